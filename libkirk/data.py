@@ -64,6 +64,9 @@ class Test:
         :type args: list(str)
         :param parallelizable: if True, test can be run in parallel
         :type parallelizable: bool
+        :param resources: names of the resources used by the test. Tests
+            using the same resource are never executed at the same time
+        :type resources: list(str)
         """
         self._name = kwargs.get("name", None)
         self._cmd = kwargs.get("cmd", None)
@@ -71,6 +74,7 @@ class Test:
         self._cwd = kwargs.get("cwd", None)
         self._env = kwargs.get("env", {})
         self._parallelizable = kwargs.get("parallelizable", False)
+        self._resources = kwargs.get("resources", [])
 
     def __repr__(self) -> str:
         return \
@@ -79,7 +83,8 @@ class Test:
             f"arguments: {self._args}, " \
             f"cwd: '{self._cwd}', " \
             f"environ: '{self._env}', " \
-            f"parallelizable: {self._parallelizable}"
+            f"parallelizable: {self._parallelizable}, " \
+            f"resources: {self._resources}"
 
     @property
     def name(self):
@@ -109,6 +114,13 @@ class Test:
         """
         return self._parallelizable
 
+    @property
+    def resources(self):
+        """
+        Names of the resources used by the test.
+        """
+        return self._resources
+
     @property
     def cwd(self):
         """
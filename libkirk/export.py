@@ -90,6 +90,9 @@ class JSONExporter(Exporter):
                     },
                 }
 
+                if test_report.usage:
+                    data_test["test"]["usage"] = test_report.usage
+
                 results_json.append(data_test)
 
         data = {
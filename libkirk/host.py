@@ -6,11 +6,14 @@
 .. moduleauthor:: Andrea Cervesato <andrea.cervesato@suse.com>
 """
 import os
+import re
 import time
+import codecs
+import shutil
 import signal
 import asyncio
 import logging
-import contextlib
+import libkirk
 from asyncio.subprocess import Process
 from libkirk.sut import SUT
 from libkirk.sut import IOBuffer
@@ -22,7 +25,19 @@ class HostSUT(SUT):
     """
     SUT implementation using host's shell.
     """
-    BUFFSIZE = 1024
+    BUFFSIZE = 64 * 1024
+    PANIC_MESSAGE = b"Kernel panic"
+    PANIC_WINDOW = 2048
+
+    # commands containing these characters require a shell
+    SHELL_CHARS = re.compile(r"[^\w@%+=:,./ -]")
+
+    # shell builtins which are not executed the same way outside of shell
+    SHELL_BUILTINS = [
+        ".", "alias", "cd", "command", "eval", "exec", "exit", "export",
+        "read", "set", "shift", "source", "time", "trap", "ulimit", "umask",
+        "unset", "wait",
+    ]
 
     def __init__(self) -> None:
         self._logger = logging.getLogger("kirk.host")
@@ -30,14 +45,30 @@ class HostSUT(SUT):
         self._procs = []
         self._running = False
         self._stop = False
+        self._cgroup = None
+        self._memory_max = None
+        self._cpu_max = None
+        self._cgroup_count = 0
 
     def setup(self, **kwargs: dict) -> None:
-        pass
+        self._cgroup = kwargs.get("cgroup", None)
+        self._memory_max = kwargs.get("memory_max", None)
+        self._cpu_max = kwargs.get("cpu_max", None)
+
+        if (self._memory_max or self._cpu_max) and not self._cgroup:
+            raise SUTError("'memory_max' and 'cpu_max' require 'cgroup'")
 
     @property
     def config_help(self) -> dict:
-        # cwd and env are given by default, so no options are needed
-        return {}
+        # cwd and env are given by default
+        return {
+            "cgroup": "cgroup v2 folder where commands are executed, each "
+                      "one inside its own child cgroup (default: None)",
+            "memory_max": "memory.max value of each command cgroup "
+                          "(default: max)",
+            "cpu_max": "cpu.max value of each command cgroup, as "
+                       "'$MAX $PERIOD' (default: max)",
+        }
 
     @property
     def name(self) -> str:
@@ -51,17 +82,230 @@ class HostSUT(SUT):
     async def is_running(self) -> bool:
         return self._running
 
+    async def _read_stdout(
+            self,
+            proc: Process,
+            iobuffer: IOBuffer) -> bytes:
+        """
+        Read process stdout until EOF and return it. Chunks are joined once
+        at the end and they are decoded only when iobuffer is given, so
+        reading has a linear cost with the size of the output.
+        """
+        chunks = []
+        decoder = None
+        if iobuffer:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+        while True:
+            data = await proc.stdout.read(self.BUFFSIZE)
+            if not data:
+                break
+
+            chunks.append(data)
+
+            if iobuffer:
+                await iobuffer.write(decoder.decode(data))
+
+        return b"".join(chunks)
+
+    def _split_command(self, command: str) -> list:
+        """
+        Return command arguments if command can be executed without shell,
+        otherwise None.
+        """
+        if self.SHELL_CHARS.search(command):
+            return None
+
+        args = command.split()
+        if not args or "=" in args[0] or args[0] in self.SHELL_BUILTINS:
+            return None
+
+        return args
+
+    async def _spawn(self, command: str, **kwargs: dict) -> Process:
+        """
+        Spawn a new process running command. Commands without shell syntax
+        are executed directly, without spawning a shell first.
+        """
+        args = self._split_command(command)
+        if args:
+            try:
+                return await asyncio.create_subprocess_exec(*args, **kwargs)
+            except OSError:
+                # let shell report commands which can't be executed
+                pass
+
+        return await asyncio.create_subprocess_shell(command, **kwargs)
+
+    async def _spawn_in_cgroup(
+            self,
+            command: str,
+            cgroup: str,
+            **kwargs: dict) -> Process:
+        """
+        Spawn a new process running command inside cgroup. Process waits for
+        a pipe to be closed before running command, so it's moved inside
+        cgroup before command can create any subprocess.
+        """
+        rfd, wfd = os.pipe()
+
+        try:
+            script = f"read _ < /dev/fd/{rfd}; "
+            args = self._split_command(command)
+            if args:
+                script += 'exec "$@"'
+            else:
+                script += command
+
+            proc = await asyncio.create_subprocess_exec(
+                "/bin/sh", "-c", script, "sh", *(args or []),
+                pass_fds=(rfd,),
+                **kwargs)
+
+            try:
+                self._write_cgroup(
+                    os.path.join(cgroup, "cgroup.procs"),
+                    str(proc.pid))
+            except OSError as err:
+                await self._kill_process(proc)
+                await proc.wait()
+
+                raise SUTError(f"Can't move command inside cgroup: {err}")
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+        return proc
+
     @staticmethod
-    async def _process_alive(proc: Process) -> bool:
+    def _write_cgroup(path: str, value: str) -> None:
         """
-        Return True if process is alive and running.
+        Write a value inside a cgroup file.
         """
-        with contextlib.suppress(asyncio.TimeoutError):
-            returncode = await asyncio.wait_for(proc.wait(), 1e-6)
-            if returncode is not None:
-                return False
+        with open(path, "w", encoding="utf-8") as fdata:
+            fdata.write(value)
 
-        return True
+    def _setup_cgroup(self) -> None:
+        """
+        Check that cgroup folder belongs to cgroup v2 and enable memory and
+        cpu controllers for its children, when they are available.
+        """
+        self._logger.info("Setting up cgroup %s", self._cgroup)
+
+        try:
+            os.makedirs(self._cgroup, exist_ok=True)
+
+            controllers_file = os.path.join(
+                self._cgroup, "cgroup.controllers")
+            if not os.path.isfile(controllers_file):
+                raise SUTError(f"'{self._cgroup}' is not a cgroup v2 folder")
+
+            with open(controllers_file, "r", encoding="utf-8") as fdata:
+                controllers = fdata.read().split()
+
+            enable = [
+                f"+{name}" for name in ["memory", "cpu"]
+                if name in controllers
+            ]
+            if enable:
+                self._write_cgroup(
+                    os.path.join(self._cgroup, "cgroup.subtree_control"),
+                    " ".join(enable))
+        except OSError as err:
+            raise SUTError(f"Can't setup cgroup: {err}")
+
+        if self._memory_max and "memory" not in controllers:
+            raise SUTError("memory controller is not available")
+
+        if self._cpu_max and "cpu" not in controllers:
+            raise SUTError("cpu controller is not available")
+
+    def _create_cgroup(self) -> str:
+        """
+        Create a new child cgroup for a command and return its path.
+        """
+        self._cgroup_count += 1
+
+        path = os.path.join(
+            self._cgroup,
+            f"cmd-{os.getpid()}-{self._cgroup_count}")
+
+        try:
+            os.mkdir(path)
+
+            if self._memory_max:
+                self._write_cgroup(
+                    os.path.join(path, "memory.max"),
+                    str(self._memory_max))
+
+            if self._cpu_max:
+                self._write_cgroup(
+                    os.path.join(path, "cpu.max"),
+                    str(self._cpu_max))
+        except OSError as err:
+            if os.path.isdir(path):
+                os.rmdir(path)
+
+            raise SUTError(f"Can't create cgroup: {err}")
+
+        return path
+
+    @staticmethod
+    def _read_cgroup_usage(path: str) -> dict:
+        """
+        Read CPU usage (in seconds) and peak memory usage (in bytes) of
+        a cgroup. Missing values are set to None.
+        """
+        usage = {
+            "cpu_usage": None,
+            "cpu_user": None,
+            "cpu_system": None,
+            "memory_peak": None,
+        }
+
+        keys = {
+            "usage_usec": "cpu_usage",
+            "user_usec": "cpu_user",
+            "system_usec": "cpu_system",
+        }
+
+        try:
+            with open(os.path.join(path, "cpu.stat"), "r",
+                      encoding="utf-8") as fdata:
+                for line in fdata:
+                    key, value = line.split()
+                    if key in keys:
+                        usage[keys[key]] = int(value) / 1000000
+        except (OSError, ValueError):
+            pass
+
+        try:
+            with open(os.path.join(path, "memory.peak"), "r",
+                      encoding="utf-8") as fdata:
+                usage["memory_peak"] = int(fdata.read())
+        except (OSError, ValueError):
+            pass
+
+        return usage
+
+    async def _remove_cgroup(self, path: str) -> None:
+        """
+        Kill all processes inside a cgroup and remove it.
+        """
+        kill_file = os.path.join(path, "cgroup.kill")
+
+        for _ in range(10):
+            try:
+                if os.path.isfile(kill_file):
+                    self._write_cgroup(kill_file, "1")
+
+                os.rmdir(path)
+                return
+            except OSError:
+                # processes might still be exiting
+                await asyncio.sleep(0.01)
+
+        self._logger.warning("Can't remove cgroup %s", path)
 
     async def _kill_process(self, proc: Process) -> None:
         """
@@ -88,6 +332,9 @@ class HostSUT(SUT):
         if await self.is_running:
             raise SUTError("SUT is running")
 
+        if self._cgroup:
+            self._setup_cgroup()
+
         self._running = True
 
     async def stop(self, iobuffer: IOBuffer = None) -> None:
@@ -140,13 +387,14 @@ class HostSUT(SUT):
         proc = None
         t_end = 0
         stdout = ""
+        cgroup = None
 
         try:
             kwargs = {
                 "stdout": asyncio.subprocess.PIPE,
                 "stderr": asyncio.subprocess.PIPE,
                 "cwd": cwd,
-                "preexec_fn": os.setsid
+                "start_new_session": True,
             }
 
             if env:
@@ -154,31 +402,24 @@ class HostSUT(SUT):
                 # env usage if dictionary is empty
                 kwargs["env"] = env
 
-            proc = await asyncio.create_subprocess_shell(command, **kwargs)
+            if self._cgroup:
+                cgroup = self._create_cgroup()
+                proc = await self._spawn_in_cgroup(command, cgroup, **kwargs)
+            else:
+                proc = await self._spawn(command, **kwargs)
 
             self._procs.append(proc)
 
             t_start = time.time()
-            panic = False
-
-            while True:
-                line = await proc.stdout.read(self.BUFFSIZE)
-                sline = line.decode(encoding="utf-8", errors="ignore")
-
-                if iobuffer:
-                    await iobuffer.write(sline)
-
-                stdout += sline
-                panic = "Kernel panic" in stdout[-2*self.BUFFSIZE:]
-
-                if not await self._process_alive(proc):
-                    break
 
+            data = await self._read_stdout(proc, iobuffer)
             await proc.wait()
 
             t_end = time.time() - t_start
 
-            if panic:
+            stdout = data.decode(encoding="utf-8", errors="ignore")
+
+            if self.PANIC_MESSAGE in data[-self.PANIC_WINDOW:]:
                 raise KernelPanicError()
         finally:
             if proc:
@@ -194,8 +435,14 @@ class HostSUT(SUT):
                     "exec_time": t_end,
                 }
 
+                if cgroup:
+                    ret["usage"] = self._read_cgroup_usage(cgroup)
+
                 self._logger.debug("return data=%s", ret)
 
+            if cgroup:
+                await self._remove_cgroup(cgroup)
+
         self._logger.info("Command executed")
 
         return ret
@@ -224,3 +471,59 @@ class HostSUT(SUT):
             self._logger.info("File copied")
 
             return retdata
+
+    async def get_file(self, target_path: str, local_path: str) -> None:
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not os.path.isfile(target_path):
+            raise SUTError(f"'{target_path}' file doesn't exist")
+
+        if not await self.is_running:
+            raise SUTError("SUT is not running")
+
+        async with self._fetch_lock:
+            self._logger.info("Copying '%s' to '%s'", target_path, local_path)
+
+            try:
+                await libkirk.to_thread(
+                    shutil.copyfile, target_path, local_path)
+            except IOError as err:
+                raise SUTError(err)
+
+            self._logger.info("File copied")
+
+    async def put_file(self, local_path: str, target_path: str) -> None:
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not os.path.isfile(local_path):
+            raise SUTError(f"'{local_path}' file doesn't exist")
+
+        if not await self.is_running:
+            raise SUTError("SUT is not running")
+
+        async with self._fetch_lock:
+            self._logger.info("Copying '%s' to '%s'", local_path, target_path)
+
+            start_t = time.time()
+
+            try:
+                await libkirk.to_thread(
+                    shutil.copyfile, local_path, target_path)
+            except IOError as err:
+                raise SUTError(err)
+
+            size = os.path.getsize(target_path)
+            exec_time = max(time.time() - start_t, 1e-6)
+
+            self._logger.info(
+                "File copied (%d bytes, %.2f MB/s)",
+                size,
+                size / exec_time / (1024 * 1024))
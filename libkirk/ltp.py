@@ -23,16 +23,20 @@ class LTPFramework(Framework):
     Linux Test Project framework definition.
     """
 
-    PARALLEL_BLACKLIST = [
-        "needs_root",
-        "needs_device",
-        "mount_device",
-        "mntpoint",
-        "resource_file",
-        "format_device",
-        "save_restore",
-        "max_runtime"
-    ]
+    # metadata parameters which don't permit parallel execution, with
+    # the name of the resource that is shared between tests using them.
+    # Parameters mapped to None can't be described by a resource (global
+    # state changes, long runtime), so tests using them run serially
+    PARALLEL_BLACKLIST = {
+        "needs_root": "root-global",
+        "needs_device": "device",
+        "mount_device": "device",
+        "mntpoint": "mntpoint",
+        "resource_file": None,
+        "format_device": "device",
+        "save_restore": None,
+        "max_runtime": None,
+    }
 
     def __init__(self) -> None:
         self._logger = logging.getLogger("libkirk.ltp")
@@ -166,6 +170,8 @@ class LTPFramework(Framework):
                 test_args = parts[2:]
 
             parallelizable = True
+            serial = False
+            resources = []
 
             if not metadata_tests:
                 # no metadata no party
@@ -185,10 +191,17 @@ class LTPFramework(Framework):
                     if not self._is_addable(test_params):
                         continue
 
-                    for blacklist_param in self.PARALLEL_BLACKLIST:
-                        if blacklist_param in test_params:
+                    for param, resource in self.PARALLEL_BLACKLIST.items():
+                        if param in test_params:
                             parallelizable = False
-                            break
+
+                            if resource is None:
+                                serial = True
+                            elif resource not in resources:
+                                resources.append(resource)
+
+                    if serial:
+                        resources = []
 
             if not parallelizable:
                 self._logger.info("Test '%s' is not parallelizable", test_name)
@@ -201,7 +214,8 @@ class LTPFramework(Framework):
                 args=test_args,
                 cwd=tc_path,
                 env=env,
-                parallelizable=parallelizable)
+                parallelizable=parallelizable,
+                resources=resources)
 
             tests.append(test)
 
@@ -6,11 +6,12 @@
 .. moduleauthor:: Andrea Cervesato <andrea.cervesato@suse.com>
 """
 import os
-import select
+import struct
 import asyncio
 import logging
 import typing
 import libkirk
+from collections import deque
 
 try:
     import msgpack
@@ -45,10 +46,23 @@ class Request:
     ALL_SLOTS = 128
     MAX_ENVS = 16
 
+    # type of the request
+    TYPE = None
+
     def __init__(self) -> None:
         self._logger = logging.getLogger("ltx.request")
         self._completed = False
         self._done_coro = []
+        self._future = None
+        self._slot_id = None
+
+    @property
+    def slot_id(self) -> int:
+        """
+        Slot ID of the request, or None if request is not related to
+        any execution slot.
+        """
+        return self._slot_id
 
     @property
     def completed(self) -> bool:
@@ -57,6 +71,27 @@ class Request:
         """
         return self._completed
 
+    @property
+    def future(self) -> asyncio.Future:
+        """
+        Future which is resolved with the request reply when request has
+        been completed, or with an exception if communication failed.
+        """
+        if not self._future:
+            self._future = asyncio.get_running_loop().create_future()
+
+        return self._future
+
+    def set_exception(self, exc: Exception) -> None:
+        """
+        Complete the request future with an exception, if someone is
+        waiting for it.
+        :param exc: raised exception
+        :type exc: Exception
+        """
+        if self._future and not self._future.done():
+            self._future.set_exception(exc)
+
     def add_done_coro(self, coro: typing.Coroutine) -> None:
         """
         Add done event to request.
@@ -77,12 +112,22 @@ class Request:
 
         self._completed = True
 
+        if self._future and not self._future.done():
+            self._future.set_result(args)
+
     async def pack(self) -> bytes:
         """
         Pack LTX request into bytes.
         """
         raise NotImplementedError()
 
+    async def pack_chunks(self) -> typing.AsyncIterator[bytes]:
+        """
+        Pack LTX request into chunks of bytes. Requests carrying large data
+        override it, so data can be streamed without packing it at once.
+        """
+        yield await self.pack()
+
     async def feed(self, message: list) -> None:
         """
         Feed request queue with data and return when the request
@@ -103,6 +148,7 @@ class Requests:
         """
         VERSION request.
         """
+        TYPE = Request.VERSION
 
         async def pack(self) -> bytes:
             return msgpack.packb([self.VERSION])
@@ -121,6 +167,7 @@ class Requests:
         """
         PING request.
         """
+        TYPE = Request.PING
 
         def __init__(self) -> None:
             super().__init__()
@@ -150,6 +197,7 @@ class Requests:
         """
         ENV request.
         """
+        TYPE = Request.ENV
 
         def __init__(self, slot_id: int, key: str, value: str) -> None:
             """
@@ -202,6 +250,7 @@ class Requests:
         """
         CWD request.
         """
+        TYPE = Request.CWD
 
         def __init__(self, slot_id: int, path: str) -> None:
             """
@@ -245,6 +294,7 @@ class Requests:
         """
         GET_FILE request.
         """
+        TYPE = Request.GET_FILE
 
         def __init__(self, path: str) -> None:
             """
@@ -280,32 +330,88 @@ class Requests:
         """
         SET_FILE request.
         """
+        TYPE = Request.SET_FILE
+
+        # size of the chunks read from local file
+        CHUNK_SIZE = 1 << 20
+
+        # maximum size which can be announced by the bin 32 header
+        MAX_SIZE = 0xffffffff
 
-        def __init__(self, path: str, data: bytes) -> None:
+        def __init__(
+                self,
+                path: str,
+                data: bytes = None,
+                local_path: str = None) -> None:
             """
             :param path: path of the file to write
             :type path: str
             :param data: data to write on file
             :type data: bytes
+            :param local_path: path of a local file which is streamed to
+                path, instead of data
+            :type local_path: str
             """
             super().__init__()
 
             if not path:
                 raise ValueError("path is empty")
 
-            if not data:
+            if not data and not local_path:
                 raise ValueError("data is empty")
 
+            if data and local_path:
+                raise ValueError("data and local_path can't be used together")
+
+            size = os.path.getsize(local_path) if local_path else len(data)
+            if size > self.MAX_SIZE:
+                raise ValueError(f"data is too big ({size} bytes)")
+
             self._path = path
             self._data = data
+            self._local_path = local_path
 
         async def pack(self) -> bytes:
+            data = self._data
+            if self._local_path:
+                with open(self._local_path, "rb") as flocal:
+                    data = flocal.read()
+
             return msgpack.packb([
                 self.SET_FILE,
                 self._path,
-                self._data,
+                data,
             ])
 
+        async def pack_chunks(self) -> typing.AsyncIterator[bytes]:
+            if not self._local_path:
+                yield await self.pack()
+                return
+
+            with open(self._local_path, "rb") as flocal:
+                size = os.fstat(flocal.fileno()).st_size
+                if size > self.MAX_SIZE:
+                    raise LTXError(
+                        f"'{self._local_path}' is too big ({size} bytes)")
+
+                # bin 32 header announces file size, so file content can
+                # follow it without being packed
+                packer = msgpack.Packer()
+                yield packer.pack_array_header(3) + \
+                    packer.pack(self.SET_FILE) + \
+                    packer.pack(self._path) + \
+                    struct.pack(">BI", 0xc6, size)
+
+                while size > 0:
+                    data = flocal.read(min(size, self.CHUNK_SIZE))
+                    if not data:
+                        raise LTXError(
+                            f"'{self._local_path}' has been truncated")
+
+                    size -= len(data)
+
+                    yield data
+
         async def feed(self, message: list) -> None:
             if self.completed:
                 return
@@ -318,6 +424,7 @@ class Requests:
         """
         EXEC request.
         """
+        TYPE = Request.EXEC
 
         def __init__(
                 self,
@@ -405,6 +512,7 @@ class Requests:
         """
         KILL request.
         """
+        TYPE = Request.KILL
 
         def __init__(self, slot_id: int) -> None:
             """
@@ -462,15 +570,26 @@ class LTX:
     """
     BUFFSIZE = 1 << 21
 
+    # type of the requests receiving messages related to a slot
+    SLOT_MESSAGES = {
+        Request.ENV: Request.ENV,
+        Request.CWD: Request.CWD,
+        Request.EXEC: Request.EXEC,
+        Request.LOG: Request.EXEC,
+        Request.RESULT: Request.EXEC,
+        Request.KILL: Request.KILL,
+    }
+
     def __init__(self, stdin_fd: int, stdout_fd: int) -> None:
         self._logger = logging.getLogger("ltx")
         self._requests = []
-        self._stop = False
+        self._slot_requests = {}
         self._stdin_fd = stdin_fd
         self._stdout_fd = stdout_fd
         self._lock = asyncio.Lock()
         self._task = None
-        self._messages = []
+        self._messages = None
+        self._unpacker = None
         self._exception = None
 
     async def __aenter__(self) -> None:
@@ -506,10 +625,18 @@ class LTX:
         self._logger.info("Connecting to LTX")
 
         self._exception = None
-        self._task = libkirk.create_task(self._polling())
+        self._messages = asyncio.Queue()
 
-        if self._exception:
-            raise self._exception
+        # force utf-8 encoding by using raw=False
+        self._unpacker = msgpack.Unpacker(raw=False)
+
+        os.set_blocking(self._stdin_fd, False)
+        os.set_blocking(self._stdout_fd, False)
+
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self._stdout_fd, self._read)
+
+        self._task = libkirk.create_task(self._polling())
 
         self._logger.info("Connected")
 
@@ -521,12 +648,9 @@ class LTX:
             return
 
         self._logger.info("Disconnecting")
-        self._stop = True
+        self._messages.put_nowait(None)
 
-        while self.connected:
-            await asyncio.sleep(0.005)
-            if self._exception:
-                raise self._exception
+        await self._task
 
         if self._exception:
             raise self._exception
@@ -548,12 +672,31 @@ class LTX:
 
         async with self._lock:
             self._logger.info("Sending requests")
-            self._requests.extend(requests)
 
-            data = [await req.pack() for req in requests]
-            tosend = b''.join(data)
+            for req in requests:
+                if req.slot_id is None:
+                    self._requests.append(req)
+                else:
+                    key = (req.TYPE, req.slot_id)
+                    self._slot_requests.setdefault(key, deque()).append(req)
+
+            # requests are packed in chunks, so large data is written
+            # while it's read and never packed in memory at once
+            data = []
+            size = 0
+
+            for req in requests:
+                async for chunk in req.pack_chunks():
+                    data.append(chunk)
+                    size += len(chunk)
 
-            await self._write(bytes(tosend))
+                    if size >= self.BUFFSIZE:
+                        await self._write(b''.join(data))
+                        data.clear()
+                        size = 0
+
+            if data:
+                await self._write(b''.join(data))
 
     async def gather(self, requests: list) -> dict:
         """
@@ -561,100 +704,141 @@ class LTX:
         rquests' replies inside a dictionary that maps requests with their
         reply.
         """
-        req_len = len(requests)
-        replies = {}
+        futures = [req.future for req in requests]
 
-        async def on_complete(req, *args):
-            replies[req] = args
+        await self.send(requests)
 
-        for req in requests:
-            req.add_done_coro(on_complete)
+        replies = await asyncio.gather(*futures)
 
-        await self.send(requests)
+        return dict(zip(requests, replies))
 
-        while len(replies) != req_len:
-            await asyncio.sleep(0.005)
-            if self._exception:
-                raise self._exception
+    def _read(self) -> None:
+        """
+        Read data from stdout when it's available and queue unpacked
+        messages. This is called by the event loop.
+        """
+        try:
+            data = os.read(self._stdout_fd, self.BUFFSIZE)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            data = None
+            self._logger.error("Can't read from LTX: %s", err)
+
+        if not data:
+            asyncio.get_running_loop().remove_reader(self._stdout_fd)
+            self._messages.put_nowait(
+                LTXError("LTX connection has been closed"))
+            return
 
-        if self._exception:
-            raise self._exception
+        self._logger.debug("Unpacking bytes: %s", data)
 
-        return replies
+        self._unpacker.feed(data)
 
-    async def _read(self, size: int) -> bytes:
+        for msg in self._unpacker:
+            if msg:
+                self._messages.put_nowait(msg)
+
+    async def _wait_writable(self) -> None:
         """
-        Blocking I/O method to read from stdout.
+        Wait until stdin can be written.
         """
-        return await libkirk.to_thread(os.read, self._stdout_fd, size)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _writable():
+            if not future.done():
+                future.set_result(None)
+
+        loop.add_writer(self._stdin_fd, _writable)
+        try:
+            await future
+        finally:
+            loop.remove_writer(self._stdin_fd)
 
     async def _write(self, data: bytes) -> None:
         """
-        Blocking I/O method to write on stdin.
+        Write data on stdin, waiting for it to be writable when needed.
         """
-        towrite = len(data)
+        view = memoryview(data)
         try:
-            wrote = await libkirk.to_thread(os.write, self._stdin_fd, data)
-
-            if towrite != wrote:
-                raise LTXError(f"Wrote {wrote} bytes but expected {towrite}")
+            while view:
+                try:
+                    wrote = os.write(self._stdin_fd, view)
+                    view = view[wrote:]
+                except BlockingIOError:
+                    await self._wait_writable()
         except BrokenPipeError:
             pass
 
-    # pylint: disable=too-many-nested-blocks
     async def _polling(self) -> None:
         """
-        Read and process messages coming from LTX stdout.
+        Process messages coming from LTX stdout.
         """
         self._logger.info("Starting producer")
 
-        poller = select.epoll()
-        poller.register(self._stdout_fd, select.EPOLLIN)
-
-        # force utf-8 encoding by using raw=False
-        unpacker = msgpack.Unpacker(raw=False)
-
         try:
-            while not self._stop:
-                events = await libkirk.to_thread(poller.poll, 0.1)
+            while True:
+                msg = await self._messages.get()
+                if msg is None:
+                    break
 
-                for fdesc, _ in events:
-                    if fdesc != self._stdout_fd:
-                        continue
+                if isinstance(msg, LTXError):
+                    raise msg
 
-                    data = await self._read(self.BUFFSIZE)
-                    if not data:
-                        continue
+                self._logger.info("Received message: %s", msg)
+                if not isinstance(msg, list):
+                    raise LTXError("Message must be an array")
 
-                    self._logger.debug("Unpacking bytes: %s", data)
+                if msg[0] == Request.ERROR:
+                    raise LTXError(msg[1])
 
-                    unpacker.feed(data)
+                await self._feed_requests(msg)
+        except LTXError as err:
+            self._exception = err
+        finally:
+            asyncio.get_running_loop().remove_reader(self._stdout_fd)
 
-                    while True:
-                        try:
-                            msg = unpacker.unpack()
-                            if not msg:
-                                continue
+            # requests won't be completed anymore
+            exc = self._exception or LTXError("LTX has been disconnected")
+            for request in self._requests:
+                request.set_exception(exc)
 
-                            self._logger.info("Received message: %s", msg)
-                            if not isinstance(msg, list):
-                                raise LTXError("Message must be an array")
+            for queue in self._slot_requests.values():
+                for request in queue:
+                    request.set_exception(exc)
 
-                            if msg[0] == Request.ERROR:
-                                raise LTXError(msg[1])
+            self._requests.clear()
+            self._slot_requests.clear()
 
-                            await self._feed_requests(msg)
-                        except msgpack.OutOfData:
-                            break
-        except LTXError as err:
-            self._exception = err
-        finally:
             self._logger.info("Producer has stopped")
 
     async def _feed_requests(self, data: list) -> None:
         """
-        Feed the list of requests with given data.
+        Feed the requests with given data. Messages related to a slot are
+        sent to the first pending request of the same type on that slot,
+        since LTX replies in order. The others messages are sent to all
+        the requests which are not related to any slot.
         """
+        req_type = self.SLOT_MESSAGES.get(data[0], None)
+        if req_type is not None and len(data) > 1:
+            key = (req_type, data[1])
+
+            queue = self._slot_requests.get(key, None)
+            if not queue:
+                self._logger.info("No requests for message: %s", data)
+                return
+
+            request = queue[0]
+            await request.feed(data)
+
+            if request.completed:
+                queue.popleft()
+                if not queue:
+                    del self._slot_requests[key]
+
+            return
+
         pos = 0
         while pos < len(self._requests):
             request = self._requests[pos]
@@ -7,9 +7,11 @@
 """
 import os
 import time
+import shlex
 import asyncio
 import logging
 import importlib
+import libkirk
 from libkirk.sut import SUT
 from libkirk.sut import SUTError
 from libkirk.sut import IOBuffer
@@ -34,7 +36,11 @@ class LTXSUT(SUT):
         self._stdin_fd = -1
         self._tmpdir = None
         self._ltx = None
-        self._slots = []
+        self._slots = set()
+        self._free_slots = list(reversed(range(0, Request.MAX_SLOTS)))
+        self._slot_env = {}
+        self._slot_cwd = {}
+        self._clock_offset = 0
 
     @property
     def name(self) -> str:
@@ -94,9 +100,6 @@ class LTXSUT(SUT):
         except LTXError as err:
             raise SUTError(err)
 
-        while await self.is_running:
-            await asyncio.sleep(1e-2)
-
         try:
             if self._stdin_fd != -1:
                 os.close(self._stdin_fd)
@@ -126,16 +129,11 @@ class LTXSUT(SUT):
         Reserve an execution slot.
         """
         async with self._release_lock:
-            slot_id = -1
-            for i in range(0, Request.MAX_SLOTS):
-                if i not in self._slots:
-                    slot_id = i
-                    break
-
-            if slot_id == -1:
+            if not self._free_slots:
                 raise SUTError("No execution slots available")
 
-            self._slots.append(slot_id)
+            slot_id = self._free_slots.pop()
+            self._slots.add(slot_id)
 
             return slot_id
 
@@ -145,6 +143,32 @@ class LTXSUT(SUT):
         """
         if slot_id in self._slots:
             self._slots.remove(slot_id)
+            self._free_slots.append(slot_id)
+
+    def _setup_requests(self, slot_id: int, cwd: str, env: dict) -> list:
+        """
+        Return the requests setting cwd and env of a slot. Values are
+        cached per slot and the ones which have been already applied to
+        the slot are not sent again, so commands sharing the same
+        environment (i.e. LTP tests) will set it only once per slot.
+        """
+        requests = []
+
+        if cwd and self._slot_cwd.get(slot_id) != cwd:
+            requests.append(Requests.cwd(slot_id, cwd))
+
+            self._slot_cwd[slot_id] = cwd
+
+        if env:
+            slot_env = self._slot_env.setdefault(slot_id, {})
+
+            for key, value in env.items():
+                if slot_env.get(key) != value:
+                    requests.append(Requests.env(slot_id, key, value))
+
+                    slot_env[key] = value
+
+        return requests
 
     async def ping(self) -> float:
         if not await self.is_running:
@@ -154,7 +178,7 @@ class LTXSUT(SUT):
         start_t = time.monotonic()
         replies = await self._send_requests([req])
 
-        return (replies[req][0] * 1e-9) - start_t
+        return (replies[req][0] * 1e-9) - self._clock_offset - start_t
 
     async def communicate(self, iobuffer: IOBuffer = None) -> None:
         if await self.is_running:
@@ -165,6 +189,9 @@ class LTXSUT(SUT):
 
         self._ltx = LTX(self._stdin_fd, self._stdout_fd)
 
+        self._slot_env.clear()
+        self._slot_cwd.clear()
+
         try:
             await self._ltx.connect()
         except LTXError as err:
@@ -172,6 +199,15 @@ class LTXSUT(SUT):
 
         await self._send_requests([Requests.version()])
 
+        # LTX clock might differ from host clock (i.e. when LTX runs
+        # inside a virtual machine), so we measure the offset between them
+        req = Requests.ping()
+        start_t = time.monotonic()
+        replies = await self._send_requests([req])
+        end_t = time.monotonic()
+
+        self._clock_offset = replies[req][0] * 1e-9 - (start_t + end_t) / 2
+
     async def run_command(
             self,
             command: str,
@@ -192,14 +228,6 @@ class LTXSUT(SUT):
         try:
             start_t = time.monotonic()
 
-            requests = []
-            if cwd:
-                requests.append(Requests.cwd(slot_id, cwd))
-
-            if env:
-                for key, value in env.items():
-                    requests.append(Requests.env(slot_id, key, value))
-
             async def _stdout_coro(data):
                 if iobuffer:
                     await iobuffer.write(data)
@@ -209,14 +237,25 @@ class LTXSUT(SUT):
                 command,
                 stdout_coro=_stdout_coro)
 
-            requests.append(exec_req)
-            replies = await self._send_requests(requests)
-            reply = replies[exec_req]
+            future = exec_req.future
+
+            try:
+                requests = self._setup_requests(slot_id, cwd, env)
+                requests.append(exec_req)
+
+                await self._ltx.send(requests)
+
+                reply = await future
+            except LTXError as err:
+                raise SUTError(err)
+
+            # result time is converted to host clock
+            end_t = (reply[0] * 1e-9) - self._clock_offset
 
             ret = {
                 "command": command,
                 "stdout": reply[3],
-                "exec_time": (reply[0] * 1e-9) - start_t,
+                "exec_time": end_t - start_t,
                 "returncode": reply[2],
             }
 
@@ -241,3 +280,77 @@ class LTXSUT(SUT):
             reply = replies[req]
 
             return reply[1]
+
+    async def put_file(self, local_path: str, target_path: str) -> None:
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not os.path.isfile(local_path):
+            raise SUTError(f"'{local_path}' file doesn't exist")
+
+        if not await self.is_running:
+            raise SUTError("SUT is not running")
+
+        async with self._fetch_lock:
+            self._logger.info("Uploading %s to %s", local_path, target_path)
+
+            start_t = time.time()
+            size = os.path.getsize(local_path)
+
+            try:
+                if size <= Requests.set_file.CHUNK_SIZE:
+                    req = Requests.set_file(target_path, local_path=local_path)
+                    await self._send_requests([req])
+                else:
+                    await self._put_file_chunks(local_path, target_path)
+            except OSError as err:
+                raise SUTError(err)
+
+            exec_time = max(time.time() - start_t, 1e-6)
+
+            self._logger.info(
+                "File uploaded (%d bytes, %.2f MB/s)",
+                size,
+                size / exec_time / (1024 * 1024))
+
+    async def _put_file_chunks(
+            self,
+            local_path: str,
+            target_path: str) -> None:
+        """
+        Upload a large file using one SET_FILE request per chunk. A SET_FILE
+        message can't be interrupted once it's written, so sending the
+        whole file at once would hold other requests (i.e. KILL and EXEC on
+        other slots) until the upload is completed. The first chunk creates
+        the file and the next ones are uploaded to a temporary file which
+        is appended to it.
+        """
+        part_path = f"{target_path}.part"
+        append_cmd = \
+            f"cat {shlex.quote(part_path)} >> {shlex.quote(target_path)}"
+        path = target_path
+
+        try:
+            with open(local_path, "rb") as flocal:
+                while True:
+                    data = await libkirk.to_thread(
+                        flocal.read, Requests.set_file.CHUNK_SIZE)
+                    if not data:
+                        break
+
+                    await self._send_requests([Requests.set_file(path, data)])
+
+                    if path == part_path:
+                        ret = await self.run_command(append_cmd)
+                        if ret["returncode"] != 0:
+                            raise SUTError(
+                                f"Can't append to '{target_path}': "
+                                f"{ret['stdout']}")
+
+                    path = part_path
+        finally:
+            if path == part_path and await self.is_running:
+                await self.run_command(f"rm -f {shlex.quote(part_path)}")
@@ -7,6 +7,7 @@
 """
 import os
 import re
+import json
 import asyncio
 import argparse
 import libkirk
@@ -129,6 +130,23 @@ def _env_config(value: str) -> dict:
     return config
 
 
+def _workers_config(value: str) -> object:
+    """
+    Return the number of workers, or "auto" if it has to be adapted
+    according with SUT load.
+    """
+    if value == "auto":
+        return value
+
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"'{value}' must be an integer or 'auto'")
+
+    return workers
+
+
 def _discover_sut(path: str) -> None:
     """
     Discover new SUT implementations.
@@ -185,27 +203,70 @@ def _get_skip_tests(skip_tests: str, skip_file: str) -> str:
     return skip
 
 
+def _get_durations(results_files: list) -> dict:
+    """
+    Return the average duration of each test, reading JSON reports of
+    previous sessions.
+    """
+    if not results_files:
+        return None
+
+    durations = {}
+
+    for results_file in results_files:
+        with open(results_file, 'r', encoding="utf-8") as results_data:
+            report = json.load(results_data)
+
+        for result in report.get("results", []):
+            name = result["test_fqn"]
+            duration = float(result["test"]["duration"])
+
+            if name not in durations:
+                durations[name] = []
+
+            durations[name].append(duration)
+
+    return {
+        name: sum(values) / len(values)
+        for name, values in durations.items()
+    }
+
+
 def _get_sut(
         args: argparse.Namespace,
         parser: argparse.ArgumentParser,
-        tmpdir: TempDir) -> SUT:
+        tmpdir: TempDir) -> list:
     """
-    Create and return SUT object.
+    Create and return the list of SUT objects. When more than one SUT is
+    defined, each SUT uses its own temporary directory.
     """
-    sut_config = args.sut.copy()
-    sut_config["tmpdir"] = tmpdir.abspath
+    suts = []
 
-    sut_name = args.sut["name"]
-    sut = _get_plugin(LOADED_SUT, sut_name)
-    if not sut:
-        parser.error(f"'{sut_name}' SUT is not available")
+    for index, config in enumerate(args.sut):
+        sut_config = config.copy()
+        sut_config["tmpdir"] = tmpdir.abspath
 
-    try:
-        sut.setup(**sut_config)
-    except SUTError as err:
-        parser.error(str(err))
+        if len(args.sut) > 1 and tmpdir.abspath:
+            tmpdir.mkdir(f"sut{index}")
+            sut_config["tmpdir"] = os.path.join(tmpdir.abspath, f"sut{index}")
 
-    return sut
+        sut_name = config["name"]
+        sut = _get_plugin(LOADED_SUT, sut_name)
+        if not sut:
+            parser.error(f"'{sut_name}' SUT is not available")
+
+        if sut in suts:
+            # the same SUT is used more than once
+            sut = sut.__class__()
+
+        try:
+            sut.setup(**sut_config)
+        except SUTError as err:
+            parser.error(str(err))
+
+        suts.append(sut)
+
+    return suts
 
 
 def _get_framework(
@@ -251,6 +312,11 @@ def _start_session(
         except re.error:
             parser.error(f"'{skip_tests}' is not a valid regular expression")
 
+    try:
+        durations = _get_durations(args.durations)
+    except (ValueError, KeyError, TypeError) as err:
+        parser.error(f"Can't read tests durations: {err}")
+
     # check if session can be restored
     restore_dir = args.restore
     if restore_dir and os.path.islink(args.restore):
@@ -269,22 +335,28 @@ def _start_session(
         tmpdir = TempDir("/tmp")
 
     # create SUT and Framework objects
-    sut = _get_sut(args, parser, tmpdir)
+    suts = _get_sut(args, parser, tmpdir)
     framework = _get_framework(args, parser)
 
     # start session
     session = Session(
-        sut=sut,
+        suts=suts,
         framework=framework,
         tmpdir=tmpdir,
         exec_timeout=args.exec_timeout,
         suite_timeout=args.suite_timeout,
         workers=args.workers,
         force_parallel=args.force_parallel,
-        skip_tests=skip_tests)
+        skip_tests=skip_tests,
+        wrap_tests=args.wrap_tests,
+        durations=durations,
+        parallel_suites=args.parallel_suites)
 
     # initialize user interface
-    if args.workers > 1:
+    if args.workers == "auto" or \
+            args.workers > 1 or \
+            len(suts) > 1 or \
+            args.parallel_suites:
         ParallelUserInterface(args.no_colors)
     else:
         if args.verbose:
@@ -420,22 +492,41 @@ def run(cmd_args: list = None) -> None:
     parser.add_argument(
         "--workers",
         "-w",
-        type=int,
+        type=_workers_config,
         default=1,
-        help="Number of workers to execute tests in parallel")
+        help="Number of workers to execute tests in parallel. Use 'auto' "
+        "to adapt it according with SUT load")
     parser.add_argument(
         "--force-parallel",
         "-p",
         action="store_true",
         help="Force parallelization execution of all tests")
+    parser.add_argument(
+        "--parallel-suites",
+        "-P",
+        action="store_true",
+        help="Run suites at the same time, sharing the same workers")
+    parser.add_argument(
+        "--wrap-tests",
+        "-W",
+        action="store_true",
+        help="Write /dev/kmsg, check tainted kernel and run each test "
+        "using a single SUT command")
+    parser.add_argument(
+        "--durations",
+        "-D",
+        nargs="*",
+        help="JSON reports of previous sessions used to run longest "
+        "parallel tests first")
 
     # session arguments
     parser.add_argument(
         "--sut",
         "-s",
-        default="host",
+        action="append",
         type=_sut_config,
-        help="System Under Test parameters. For help please use '-s help'")
+        help="System Under Test parameters. For help please use '-s help'. "
+        "Repeat the option to run tests on a pool of SUTs")
     parser.add_argument(
         "--framework",
         "-f",
@@ -457,9 +548,13 @@ def run(cmd_args: list = None) -> None:
         print(f"kirk {libkirk.VERSION}")
         parser.exit(RC_OK)
 
-    if args.sut and "help" in args.sut:
-        print(args.sut["help"])
-        parser.exit(RC_OK)
+    if not args.sut:
+        args.sut = [_sut_config("host")]
+
+    for sut_config in args.sut:
+        if "help" in sut_config:
+            print(sut_config["help"])
+            parser.exit(RC_OK)
 
     if args.framework and "help" in args.framework:
         print(args.framework["help"])
@@ -474,6 +569,17 @@ def run(cmd_args: list = None) -> None:
     if args.skip_file and not os.path.isfile(args.skip_file):
         parser.error(f"'{args.skip_file}' skip file doesn't exist")
 
+    if args.parallel_suites and args.workers == "auto":
+        parser.error("--parallel-suites can't be used with '--workers auto'")
+
+    if args.parallel_suites and len(args.sut) > 1:
+        parser.error("--parallel-suites can't be used with multiple SUTs")
+
+    if args.durations:
+        for results_file in args.durations:
+            if not os.path.isfile(results_file):
+                parser.error(f"'{results_file}' JSON report doesn't exist")
+
     if args.tmp_dir and not os.path.isdir(args.tmp_dir):
         parser.error(f"'{args.tmp_dir}' temporary folder doesn't exist")
 
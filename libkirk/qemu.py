@@ -10,15 +10,140 @@ import re
 import time
 import signal
 import string
+import json
+import base64
 import shutil
 import secrets
 import logging
+import codecs
 import asyncio
+import typing
+import importlib
 import contextlib
+import libkirk
 from libkirk.sut import SUT
 from libkirk.sut import IOBuffer
 from libkirk.sut import SUTError
+from libkirk.sut import RemoteShell
 from libkirk.sut import KernelPanicError
+from libkirk.ltx_sut import LTXSUT
+
+
+class QemuLane(RemoteShell):
+    """
+    Shell running inside the virtual machine on a virtio serial port, which
+    is used to execute commands in parallel with the other lanes.
+    """
+
+    BUFFSIZE = 64 * 1024
+
+    def __init__(self, index: int, path: str, device: str) -> None:
+        """
+        :param index: index of the lane
+        :type index: int
+        :param path: path of the unix socket connected to the serial port
+        :type path: str
+        :param device: serial port device inside the virtual machine
+        :type device: str
+        """
+        super().__init__()
+
+        self._logger = logging.getLogger("kirk.qemu.lane")
+        self._reader = None
+        self._writer = None
+        self._decoder = None
+        self.index = index
+        self.path = path
+        self.device = device
+        self.lock = asyncio.Lock()
+        self.pid = None
+
+    async def connect(self) -> None:
+        """
+        Connect to the serial port unix socket.
+        """
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            self.path)
+
+        self._decoder = codecs.getincrementaldecoder("utf-8")(
+            errors="replace")
+
+    async def close(self) -> None:
+        """
+        Close the connection with the serial port.
+        """
+        if not self._writer:
+            return
+
+        self._writer.close()
+        with contextlib.suppress(OSError):
+            await self._writer.wait_closed()
+
+        self._reader = None
+        self._writer = None
+
+    async def _read(self) -> str:
+        """
+        Read the next data from serial port.
+        """
+        data = await self._reader.read(self.BUFFSIZE)
+
+        return self._decoder.decode(data)
+
+    async def sync(self) -> int:
+        """
+        Wait for the shell to reply, discarding any pending data, and
+        return the shell PID.
+        """
+        code = f"{self.marker}-{secrets.token_hex(4)}"
+        pattern = re.compile(f"{code} (\\d+)\n")
+
+        self._writer.write(f"echo {code} $$\n".encode(encoding="utf-8"))
+        await self._writer.drain()
+
+        stdout = ""
+        match = None
+
+        while not match:
+            data = await self._read()
+            if not data:
+                raise SUTError(f"Lane on {self.device} has been closed")
+
+            stdout = stdout[-(len(code) + 16):] + data
+            match = pattern.search(stdout)
+
+        self.pid = int(match.group(1))
+
+        return self.pid
+
+    async def exec(
+            self,
+            command: str,
+            cwd: str = None,
+            env: dict = None,
+            iobuffer: IOBuffer = None) -> set:
+        """
+        Execute a command and return set(stdout, retcode, exec_time).
+        Return code is -1 if current working directory or environment
+        can't be set.
+        """
+        async with self.lock:
+            script = self.create_script(command, cwd, env)
+
+            self._logger.debug("Sending %s", repr(script))
+
+            t_start = time.time()
+
+            self._writer.write(script.encode(encoding="utf-8"))
+            await self._writer.drain()
+
+            stdout, retcode = await self.read_output(self._read, iobuffer)
+            if retcode is None:
+                raise SUTError(f"Lane on {self.device} has been closed")
+
+            exec_time = time.time() - t_start
+
+            return stdout, retcode, exec_time
 
 
 # pylint: disable=too-many-instance-attributes
@@ -29,6 +154,29 @@ class QemuSUT(SUT):
     a protected, virtualized environment.
     """
 
+    SNAPSHOT_NAME = "kirk"
+    SNAPSHOT_TIMEOUT = 10
+
+    # size of the blocks read from stdout and transport
+    BUFFSIZE = 1 << 20
+
+    # seconds we wait for new data on transport before giving up
+    TRANSFER_TIMEOUT = 5
+
+    # seconds we wait for a lane shell to reply after it started
+    LANE_TIMEOUT = 10
+
+    # seconds console is read by the watcher before releasing it to the
+    # other commands
+    WATCHER_TIMEOUT = 0.2
+
+    # seconds we wait for LTX to reply after it started or to stop
+    LTX_TIMEOUT = 10
+
+    # size of the chunks uploaded on console. It's a multiple of 57, so
+    # base64 encoding produces complete lines
+    UPLOAD_CHUNK_SIZE = 57 * 1024
+
     def __init__(self) -> None:
         self._logger = logging.getLogger("kirk.qemu")
         self._comm_lock = asyncio.Lock()
@@ -53,6 +201,24 @@ class QemuSUT(SUT):
         self._initrd = None
         self._last_read = ""
         self._panic = False
+        self._snapshot = False
+        self._snapshot_ready = False
+        self._overlay = None
+        self._kwargs = {}
+        self._vm_id = ""
+        self._throwaway = False
+        self._standby = False
+        self._standby_count = 0
+        self._spare = None
+        self._spare_task = None
+        self._lanes_count = 0
+        self._lanes = []
+        self._free_lanes = None
+        self._ltx_bin = None
+        self._ltx = None
+        self._shell_env = {}
+        self._watcher = None
+        self._panic_event = None
 
     @staticmethod
     def _generate_string(length: int = 10) -> str:
@@ -69,7 +235,8 @@ class QemuSUT(SUT):
         qemu instance for transport configuration.
         """
         pid = os.getpid()
-        transport_file = os.path.join(self._tmpdir, f"transport-{pid}")
+        transport_file = os.path.join(
+            self._tmpdir, f"transport-{pid}{self._vm_id}")
         transport_dev = ""
 
         if self._serial_type == "isa":
@@ -79,12 +246,33 @@ class QemuSUT(SUT):
 
         return transport_dev, transport_file
 
+    def _get_lane(self, index: int) -> set:
+        """
+        Return a couple of lane_dev and lane_socket used by qemu instance
+        for the configuration of the lane with the given index.
+        """
+        pid = os.getpid()
+        lane_socket = os.path.join(
+            self._tmpdir, f"lane{index}-{pid}{self._vm_id}.sock")
+
+        # port 0 is the console and port 1 is the transport
+        lane_dev = f"/dev/vport1p{index + 2}"
+
+        return lane_dev, lane_socket
+
+    def _get_monitor(self) -> str:
+        """
+        Return the path of the qemu monitor socket.
+        """
+        pid = os.getpid()
+        return os.path.join(self._tmpdir, f"monitor-{pid}{self._vm_id}.sock")
+
     def _get_command(self) -> str:
         """
         Return the full qemu command to execute.
         """
         pid = os.getpid()
-        tty_log = os.path.join(self._tmpdir, f"ttyS0-{pid}.log")
+        tty_log = os.path.join(self._tmpdir, f"ttyS0-{pid}{self._vm_id}.log")
 
         params = []
         params.append("-enable-kvm")
@@ -106,7 +294,22 @@ class QemuSUT(SUT):
                 f"Unsupported serial device type {self._serial_type}")
 
         _, transport_file = self._get_transport()
-        params.append(f"-chardev file,id=transport,path={transport_file}")
+        if self._ltx_bin:
+            # LTX requires a two-way connection, which is provided by
+            # transport_file.in and transport_file.out pipes
+            params.append(
+                f"-chardev pipe,id=transport,path={transport_file}")
+        else:
+            params.append(
+                f"-chardev file,id=transport,path={transport_file}")
+
+        for index in range(self._lanes_count):
+            _, lane_socket = self._get_lane(index)
+            params.append(
+                f"-chardev socket,id=lane{index},path={lane_socket},"
+                "server=on,wait=off")
+            params.append(
+                f"-device virtserialport,chardev=lane{index},nr={index + 2}")
 
         if self._virtfs:
             params.append(
@@ -117,7 +320,14 @@ class QemuSUT(SUT):
                 "readonly=on")
 
         if self._image:
-            params.append(f"-drive if=virtio,cache=unsafe,file={self._image}")
+            image = self._overlay if self._overlay else self._image
+            params.append(f"-drive if=virtio,cache=unsafe,file={image}")
+
+        if self._snapshot:
+            params.append(f"-monitor unix:{self._get_monitor()},server,nowait")
+
+            if self._snapshot_ready:
+                params.append(f"-loadvm {self.SNAPSHOT_NAME}")
 
         if self._initrd:
             params.append(f"-initrd {self._initrd}")
@@ -140,6 +350,8 @@ class QemuSUT(SUT):
     def setup(self, **kwargs: dict) -> None:
         self._logger.info("Initialize SUT")
 
+        self._kwargs = kwargs
+
         self._tmpdir = kwargs.get("tmpdir", None)
         self._user = kwargs.get("user", None)
         self._password = kwargs.get("password", None)
@@ -185,6 +397,48 @@ class QemuSUT(SUT):
         if self._serial_type not in ["isa", "virtio"]:
             raise SUTError("Serial protocol must be isa or virtio")
 
+        try:
+            self._snapshot = int(kwargs.get("snapshot", 0)) == 1
+        except ValueError:
+            raise SUTError("'snapshot' must be 0 or 1")
+
+        if self._snapshot and not self._image:
+            raise SUTError("'snapshot' requires a qemu image")
+
+        if self._snapshot and self._virtfs:
+            raise SUTError("'snapshot' can't be used together with 'virtfs'")
+
+        try:
+            self._standby = int(kwargs.get("standby", 0)) == 1
+        except ValueError:
+            raise SUTError("'standby' must be 0 or 1")
+
+        if self._standby and self._snapshot:
+            raise SUTError("'standby' can't be used together with 'snapshot'")
+
+        try:
+            self._lanes_count = int(kwargs.get("lanes", 0))
+        except ValueError:
+            raise SUTError("'lanes' must be an integer")
+
+        if self._lanes_count < 0:
+            raise SUTError("'lanes' can't be negative")
+
+        if self._lanes_count and self._serial_type != "virtio":
+            raise SUTError("'lanes' requires virtio serial")
+
+        self._ltx_bin = kwargs.get("ltx", None)
+
+        if self._ltx_bin and self._lanes_count:
+            raise SUTError("'ltx' can't be used together with 'lanes'")
+
+        if self._ltx_bin and not importlib.util.find_spec('msgpack'):
+            raise SUTError("'msgpack' library is not available")
+
+        self._overlay = None
+        self._snapshot_ready = False
+        self._throwaway = self._standby
+
     @property
     def config_help(self) -> dict:
         return {
@@ -200,6 +454,14 @@ class QemuSUT(SUT):
             "serial": "type of serial protocol. isa|virtio (default: isa)",
             "virtfs": "directory to mount inside VM",
             "options": "user defined options",
+            "snapshot": "restore a snapshot taken after login on restart "
+            "(default: 0)",
+            "standby": "boot a standby VM to switch to on restart "
+            "(default: 0)",
+            "lanes": "number of virtio serial ports running commands in "
+            "parallel. It requires virtio serial (default: 0)",
+            "ltx": "LTX binary inside the VM. When defined, LTX is started "
+            "on transport and it runs commands",
         }
 
     @property
@@ -208,7 +470,15 @@ class QemuSUT(SUT):
 
     @property
     def parallel_execution(self) -> bool:
-        return False
+        return self._lanes_count > 0 or bool(self._ltx_bin)
+
+    @property
+    def max_workers(self) -> int:
+        # commands waiting for a free lane would consume their timeout
+        if self._lanes_count:
+            return self._lanes_count
+
+        return None
 
     @property
     async def is_running(self) -> bool:
@@ -224,7 +494,8 @@ class QemuSUT(SUT):
         if not await self.is_running:
             raise SUTError("SUT is not running")
 
-        _, _, exec_time = await self._exec("test .", None)
+        async with self._cmd_lock:
+            _, _, exec_time = await self._exec("test .", None)
 
         return exec_time
 
@@ -257,41 +528,62 @@ class QemuSUT(SUT):
 
     async def _wait_for(self, message: str, iobuffer: IOBuffer) -> str:
         """
-        Wait a string from stdout.
+        Wait a string from stdout. Only new data is scanned, together with
+        the last characters of previous data, so the output is never
+        searched twice.
         """
         if not await self.is_running:
             return None
 
         self._logger.info("Waiting for message: %s", repr(message))
 
-        stdout = self._last_read
+        panic = "Kernel panic"
+        overlap = max(len(message), len(panic)) - 1
+
+        chunks = []
+        length = 0
+        tail = ""
+        message_end = -1
+        data = self._last_read
         self._panic = False
 
         while True:
-            if self._stop or self._panic:
-                break
+            if data:
+                chunks.append(data)
 
-            if not await self.is_running:
-                break
+                text = tail + data
+                offset = length - len(tail)
+                length += len(data)
 
-            message_pos = stdout.find(message)
-            if message_pos != -1:
-                self._last_read = stdout[message_pos + len(message):]
-                break
+                message_pos = text.find(message)
+                if message_pos != -1:
+                    message_end = offset + message_pos + len(message)
+                    break
 
-            data = await self._read_stdout(1024, iobuffer)
-            if data:
-                stdout += data
+                if panic in text:
+                    # give time to panic message coming out from serial
+                    await asyncio.sleep(2)
 
-            if "Kernel panic" in stdout:
-                # give time to panic message coming out from serial
-                await asyncio.sleep(2)
+                    # read as much data as possible from stdout
+                    data = await self._read_stdout(1024 * 1024, iobuffer)
+                    chunks.append(data)
 
-                # read as much data as possible from stdout
-                data = await self._read_stdout(1024 * 1024, iobuffer)
-                stdout += data
+                    self._panic = True
+                    break
 
-                self._panic = True
+                tail = text[-overlap:]
+
+            if self._stop:
+                break
+
+            data = await self._read_stdout(self.BUFFSIZE, iobuffer)
+            if not data and not await self.is_running:
+                break
+
+        stdout = "".join(chunks)
+
+        if message_end != -1:
+            self._last_read = stdout[message_end:]
 
         if self._panic:
             # if we ended before raising Kernel panic, we raise the exception
@@ -312,6 +604,10 @@ class QemuSUT(SUT):
         async with self._fetch_lock:
             pass
 
+        for lane in self._lanes:
+            async with lane.lock:
+                pass
+
     async def _exec(self, command: str, iobuffer: IOBuffer) -> set:
         """
         Execute a command and return set(stdout, retcode, exec_time).
@@ -358,13 +654,242 @@ class QemuSUT(SUT):
 
         return stdout, retcode, exec_time
 
-    async def stop(self, iobuffer: IOBuffer = None) -> None:
+    async def _watch_console(self) -> None:
+        """
+        Read console while commands are executed on lanes or LTX, so kernel
+        panic is recognized even if commands don't print it on stdout.
+        """
+        panic = "Kernel panic"
+        tail = ""
+
+        while not self._stop and await self.is_running:
+            data = ""
+
+            # console is read only while it's not used by other commands
+            async with self._cmd_lock:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    data = await asyncio.wait_for(
+                        self._read_stdout(self.BUFFSIZE, None),
+                        self.WATCHER_TIMEOUT)
+
+            if self._proc.stdout.at_eof():
+                break
+
+            text = tail + data
+            if panic in text:
+                self._logger.info("Kernel panic found on console")
+
+                self._panic = True
+                self._panic_event.set()
+                break
+
+            tail = text[-(len(panic) - 1):]
+
+    def _start_watcher(self) -> None:
+        """
+        Start watching console when it's not used to run commands.
+        """
+        if not self._lanes_count and not self._ltx_bin:
+            return
+
+        self._panic_event = asyncio.Event()
+        self._watcher = libkirk.create_task(self._watch_console())
+
+    async def _stop_watcher(self) -> None:
+        """
+        Stop watching console.
+        """
+        if not self._watcher:
+            return
+
+        watcher = self._watcher
+        self._watcher = None
+        self._panic_event = None
+
+        watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await watcher
+
+    async def _wait_no_panic(self, coro: typing.Coroutine) -> dict:
+        """
+        Wait for a command running on lanes or LTX and raise
+        KernelPanicError as soon as kernel panic is found on console.
+        """
+        event = self._panic_event
+        if not event:
+            return await coro
+
+        task = libkirk.create_task(coro)
+        panic = libkirk.create_task(event.wait())
+
+        try:
+            await asyncio.wait(
+                [task, panic],
+                return_when=asyncio.FIRST_COMPLETED)
+
+            if event.is_set():
+                raise KernelPanicError()
+
+            return task.result()
+        finally:
+            panic.cancel()
+            task.cancel()
+
+            await asyncio.gather(task, panic, return_exceptions=True)
+
+    async def _start_lane(self, index: int, spawn: bool = True) -> QemuLane:
+        """
+        Connect to the lane with the given index and wait for its shell to
+        reply. If spawn is True, a new shell is started on the lane.
+        """
+        lane_dev, lane_socket = self._get_lane(index)
+        lane = QemuLane(index, lane_socket, lane_dev)
+
+        try:
+            await lane.connect()
+
+            if spawn:
+                # shell is the leader of a new process group, so it can be
+                # killed together with the commands it's running
+                _, retcode, _ = await self._exec(
+                    f"(setsid sh <>{lane_dev} >&0 2>&0 &)", None)
+                if retcode != 0:
+                    raise SUTError(f"Can't start shell on {lane_dev}")
+
+            await asyncio.wait_for(lane.sync(), self.LANE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as err:
+            await lane.close()
+            raise SUTError(f"Lane on {lane_dev} is not replying: {err}")
+        except SUTError as err:
+            await lane.close()
+            raise err
+
+        return lane
+
+    async def _start_lanes(self, spawn: bool = True) -> None:
+        """
+        Start all lanes and make them available to run commands.
+        """
+        await self._close_lanes()
+
+        self._free_lanes = asyncio.Queue()
+
+        for index in range(self._lanes_count):
+            lane = await self._start_lane(index, spawn=spawn)
+
+            self._lanes.append(lane)
+            self._free_lanes.put_nowait(lane)
+
+        self._logger.info("Started %d lanes", self._lanes_count)
+
+    async def _close_lanes(self) -> None:
+        """
+        Close the connections with all lanes.
+        """
+        lanes = self._lanes
+        self._lanes = []
+
+        for lane in lanes:
+            await lane.close()
+
+    async def _restart_lane(self, lane: QemuLane) -> None:
+        """
+        Kill the lane shell together with the commands it's running, then
+        start a new shell on the lane and make it available again.
+        """
+        if self._stop or self._panic or lane not in self._lanes:
+            return
+
+        self._logger.info("Restarting lane on %s", lane.device)
+
+        await lane.close()
+
+        try:
+            async with self._cmd_lock:
+                if lane.pid:
+                    await self._exec(f"kill -9 -{lane.pid}", None)
+
+                new_lane = await self._start_lane(lane.index)
+        except SUTError as err:
+            self._logger.warning("Can't restart lane: %s", err)
+
+            if lane in self._lanes:
+                self._lanes.remove(lane)
+
+            return
+
+        if self._stop or lane not in self._lanes:
+            await new_lane.close()
+            return
+
+        self._lanes[self._lanes.index(lane)] = new_lane
+        self._free_lanes.put_nowait(new_lane)
+
+    async def _start_ltx(self, spawn: bool = True) -> None:
+        """
+        Connect to LTX running on transport. If spawn is True, LTX is
+        started inside the virtual machine.
+        """
+        transport_dev, transport_file = self._get_transport()
+
+        if spawn:
+            # serial line must be raw, so binary data is not modified
+            _, retcode, _ = await self._exec(
+                f"(setsid sh -c 'stty raw -echo 2>/dev/null; "
+                f"exec {self._ltx_bin}' "
+                f"<>{transport_dev} >&0 2>/dev/null &)",
+                None)
+            if retcode != 0:
+                raise SUTError(f"Can't start LTX on {transport_dev}")
+
+        ltx = LTXSUT()
+        ltx.setup(
+            tmpdir=self._tmpdir,
+            stdin=f"{transport_file}.in",
+            stdout=f"{transport_file}.out")
+
+        try:
+            await asyncio.wait_for(ltx.communicate(), self.LTX_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self._stop_ltx(ltx)
+            raise SUTError(f"LTX is not replying on {transport_dev}")
+
+        self._ltx = ltx
+
+        self._logger.info("LTX started")
+
+    async def _stop_ltx(self, ltx: LTXSUT) -> None:
+        """
+        Stop the given LTX session.
+        """
+        try:
+            await asyncio.wait_for(ltx.stop(), self.LTX_TIMEOUT)
+        except (SUTError, asyncio.TimeoutError) as err:
+            self._logger.warning("Can't stop LTX: %s", err)
+
+    async def _stop_vm(self, iobuffer: IOBuffer = None) -> None:
+        """
+        Stop the virtual machine that is currently in use.
+        """
         if not await self.is_running:
             return
 
         self._logger.info("Shutting down virtual machine")
         self._stop = True
 
+        await self._stop_watcher()
+
+        # commands running on lanes can't be interrupted, so we stop
+        # waiting for them
+        await self._close_lanes()
+
+        if self._ltx:
+            # running commands are killed by LTX
+            ltx = self._ltx
+            self._ltx = None
+
+            await self._stop_ltx(ltx)
+
         try:
             if not self._panic:
                 # stop command first
@@ -375,8 +900,12 @@ class QemuSUT(SUT):
                     await self._write_stdin('\x03')
                     await self._wait_lockers()
 
-                # logged in -> poweroff
-                if self._logged_in:
+                # logged in -> poweroff. When a snapshot is available or the
+                # VM is running on a throwaway overlay, guest state is
+                # discarded anyway, so we just kill qemu
+                if self._logged_in and \
+                        not self._snapshot_ready and \
+                        not self._throwaway:
                     self._logger.info("Poweroff virtual machine")
 
                     await self._write_stdin("poweroff; poweroff -f\n")
@@ -399,8 +928,266 @@ class QemuSUT(SUT):
 
             self._stop = False
 
+        if self._throwaway and self._overlay:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._overlay)
+
+            self._overlay = None
+
         self._logger.info("Qemu process ended")
 
+    def _start_spare(self) -> None:
+        """
+        Start booting the standby virtual machine in background.
+        """
+        self._standby_count += 1
+
+        spare = QemuSUT()
+        spare.setup(**{**self._kwargs, "standby": "0"})
+
+        # pylint: disable=protected-access
+        spare._vm_id = f"-standby{self._standby_count}"
+        spare._throwaway = True
+
+        self._logger.info("Booting standby virtual machine")
+
+        self._spare = spare
+        self._spare_task = asyncio.create_task(spare.communicate())
+
+    async def _stop_spare(self) -> None:
+        """
+        Stop the standby virtual machine.
+        """
+        if not self._spare:
+            return
+
+        spare = self._spare
+        task = self._spare_task
+
+        self._spare = None
+        self._spare_task = None
+
+        self._logger.info("Stopping standby virtual machine")
+
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, SUTError):
+            await task
+
+        await spare.stop()
+
+    async def _switch_to_spare(self) -> bool:
+        """
+        Wait for the standby virtual machine to be ready and use it as the
+        current virtual machine. Return False if standby failed to boot.
+        """
+        spare = self._spare
+        task = self._spare_task
+
+        self._spare = None
+        self._spare_task = None
+
+        self._logger.info("Switching to standby virtual machine")
+
+        try:
+            await task
+        except SUTError as err:
+            self._logger.warning("Standby virtual machine failed: %s", err)
+            await spare.stop()
+            return False
+
+        if not await spare.is_running:
+            return False
+
+        # pylint: disable=protected-access
+        await spare._stop_watcher()
+
+        # pylint: disable=protected-access
+        self._proc = spare._proc
+        self._vm_id = spare._vm_id
+        self._overlay = spare._overlay
+        self._last_read = spare._last_read
+        self._last_pos = spare._last_pos
+        self._lanes = spare._lanes
+        self._free_lanes = spare._free_lanes
+        self._ltx = spare._ltx
+        self._shell_env.clear()
+
+        return True
+
+    async def stop(self, iobuffer: IOBuffer = None) -> None:
+        await self._stop_spare()
+        await self._stop_vm(iobuffer=iobuffer)
+
+    async def restart(self, iobuffer: IOBuffer = None) -> None:
+        if not self._standby:
+            await super().restart(iobuffer=iobuffer)
+            return
+
+        # keep standby VM running, so communicate can switch to it
+        await self._stop_vm(iobuffer=iobuffer)
+        await self.ensure_communicate(iobuffer=iobuffer)
+
+    async def _run_host(self, *args: str) -> str:
+        """
+        Run a command on host and return its stdout.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+
+        stdout, _ = await proc.communicate()
+        stdout = stdout.decode(encoding="utf-8", errors="replace")
+
+        if proc.returncode != 0:
+            raise SUTError(f"'{' '.join(args)}' failed: {stdout}")
+
+        return stdout
+
+    async def _create_overlay(self) -> None:
+        """
+        Create the qcow2 overlay on top of the qemu image, which is used to
+        store the VM snapshot or to run a throwaway VM without touching the
+        original image.
+        """
+        if not shutil.which("qemu-img"):
+            raise SUTError("Command not found: qemu-img")
+
+        pid = os.getpid()
+        overlay = os.path.join(
+            self._tmpdir, f"overlay-{pid}{self._vm_id}.qcow2")
+        image = os.path.abspath(self._image)
+
+        self._logger.info("Creating overlay %s", overlay)
+
+        stdout = await self._run_host(
+            "qemu-img", "info", "--output=json", image)
+        image_fmt = json.loads(stdout)["format"]
+
+        await self._run_host(
+            "qemu-img", "create", "-q", "-f", "qcow2",
+            "-b", image, "-F", image_fmt, overlay)
+
+        self._overlay = overlay
+
+    async def _monitor(self, command: str) -> str:
+        """
+        Send a command to the qemu monitor and return its reply.
+        """
+        self._logger.info("Sending monitor command: %s", command)
+
+        prompt = b"(qemu) "
+        reader, writer = await asyncio.open_unix_connection(
+            self._get_monitor())
+
+        try:
+            await reader.readuntil(prompt)
+
+            writer.write(f"{command}\n".encode(encoding="utf-8"))
+            await writer.drain()
+
+            data = await reader.readuntil(prompt)
+        finally:
+            writer.close()
+
+        reply = data[:-len(prompt)].decode(encoding="utf-8", errors="replace")
+
+        self._logger.debug("Monitor reply: %s", repr(reply))
+
+        return reply
+
+    async def _save_snapshot(self) -> None:
+        """
+        Save the VM state, so next restarts can skip boot and login.
+        """
+        self._logger.info("Saving virtual machine snapshot")
+
+        try:
+            reply = await asyncio.wait_for(
+                self._monitor(f"savevm {self.SNAPSHOT_NAME}"),
+                self.SNAPSHOT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) \
+                as err:
+            self._logger.warning("Can't save snapshot: %s", err)
+            return
+
+        if "Error" in reply:
+            self._logger.warning("Can't save snapshot: %s", reply.strip())
+            return
+
+        self._snapshot_ready = True
+
+        self._logger.info("Snapshot saved")
+
+    async def _restore_snapshot(self) -> bool:
+        """
+        Check that the VM restored from the snapshot is replying and
+        synchronize its clock with host. Return False if the restore failed.
+        """
+        self._logger.info("Restoring virtual machine snapshot")
+
+        try:
+            _, retcode, _ = await asyncio.wait_for(
+                self._exec("test .", None),
+                self.SNAPSHOT_TIMEOUT)
+        except (SUTError, asyncio.TimeoutError):
+            retcode = -1
+
+        if retcode != 0:
+            return False
+
+        # guest clock stopped when the snapshot has been saved
+        await self._exec(f"date -s @{int(time.time())} > /dev/null", None)
+
+        if self._lanes_count:
+            # lane shells have been saved inside the snapshot
+            try:
+                await self._start_lanes(spawn=False)
+            except SUTError as err:
+                self._logger.warning("Can't restore lanes: %s", err)
+                return False
+
+        if self._ltx_bin:
+            # LTX process has been saved inside the snapshot
+            try:
+                await self._start_ltx(spawn=False)
+            except SUTError as err:
+                self._logger.warning("Can't restore LTX: %s", err)
+                return False
+
+        return True
+
+    async def _start_qemu(self) -> None:
+        """
+        Start the qemu process.
+        """
+        self._last_read = ""
+        self._last_pos = 0
+        self._shell_env.clear()
+
+        if self._ltx_bin:
+            _, transport_file = self._get_transport()
+
+            for pipe in [f"{transport_file}.in", f"{transport_file}.out"]:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(pipe)
+
+                os.mkfifo(pipe)
+
+        cmd = self._get_command()
+
+        self._logger.info("Starting virtual machine")
+        self._logger.debug(cmd)
+
+        # exec qemu, so killing the process won't leave it orphaned when
+        # the shell forks commands
+        # pylint: disable=consider-using-with
+        self._proc = await asyncio.create_subprocess_shell(
+            f"exec {cmd}",
+            stdout=asyncio.subprocess.PIPE,
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+
     async def communicate(self, iobuffer: IOBuffer = None) -> None:
         if not shutil.which(self._qemu_cmd):
             raise SUTError(f"Command not found: {self._qemu_cmd}")
@@ -413,17 +1200,38 @@ class QemuSUT(SUT):
         async with self._comm_lock:
             self._logged_in = False
 
-            cmd = self._get_command()
+            if self._spare and await self._switch_to_spare():
+                self._logged_in = True
+                self._start_spare()
+                self._start_watcher()
 
-            self._logger.info("Starting virtual machine")
-            self._logger.debug(cmd)
+                self._logger.info("Virtual machine started")
+                return
+
+            if self._image and \
+                    (self._throwaway or (self._snapshot and not self._overlay)):
+                await self._create_overlay()
+
+            if self._snapshot_ready:
+                await self._start_qemu()
+
+                if await self._restore_snapshot():
+                    self._logged_in = True
+                    self._start_watcher()
+
+                    self._logger.info("Virtual machine restored")
+                    return
+
+                self._logger.warning(
+                    "Can't restore snapshot. Booting virtual machine")
 
-            # pylint: disable=consider-using-with
-            self._proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stdin=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT)
+                if await self.is_running:
+                    self._proc.kill()
+                    await self._proc.wait()
+
+                self._snapshot_ready = False
+
+            await self._start_qemu()
 
             try:
                 if self._user:
@@ -455,8 +1263,22 @@ class QemuSUT(SUT):
                     if retcode != 0:
                         raise SUTError("Failed to mount virtfs")
 
+                if self._lanes_count:
+                    await self._start_lanes()
+
+                if self._ltx_bin:
+                    await self._start_ltx()
+
+                if self._snapshot:
+                    await self._save_snapshot()
+
                 self._logged_in = True
 
+                if self._standby:
+                    self._start_spare()
+
+                self._start_watcher()
+
                 self._logger.info("Virtual machine started")
             except SUTError as err:
                 error = err
@@ -468,6 +1290,63 @@ class QemuSUT(SUT):
 
             raise SUTError(error)
 
+    async def _run_command_lane(
+            self,
+            command: str,
+            cwd: str = None,
+            env: dict = None,
+            iobuffer: IOBuffer = None) -> dict:
+        """
+        Run a command on the first available lane.
+        """
+        if not self._lanes:
+            raise SUTError("No lanes available")
+
+        lane = await self._free_lanes.get()
+        done = False
+
+        try:
+            self._logger.info(
+                "Running command on %s: %s", lane.device, command)
+
+            stdout, retcode, exec_time = await lane.exec(
+                command,
+                cwd=cwd,
+                env=env,
+                iobuffer=iobuffer)
+
+            done = True
+        except SUTError as err:
+            if not self._stop:
+                raise err
+
+            stdout, retcode, exec_time = "", -1, 0
+        finally:
+            if done:
+                self._free_lanes.put_nowait(lane)
+            else:
+                # lane might be still running the command
+                libkirk.create_task(self._restart_lane(lane))
+
+        if retcode == -1 and not self._stop:
+            raise SUTError(
+                f"Can't setup current working directory {cwd} "
+                f"or environment {env}: {stdout}")
+
+        if "Kernel panic" in stdout:
+            raise KernelPanicError()
+
+        ret = {
+            "command": command,
+            "returncode": retcode,
+            "stdout": stdout,
+            "exec_time": exec_time,
+        }
+
+        self._logger.debug(ret)
+
+        return ret
+
     async def run_command(
             self,
             command: str,
@@ -480,26 +1359,63 @@ class QemuSUT(SUT):
         if not await self.is_running:
             raise SUTError("Virtual machine is not running")
 
+        if self._ltx:
+            ret = await self._wait_no_panic(self._ltx.run_command(
+                command,
+                cwd=cwd,
+                env=env,
+                iobuffer=iobuffer))
+
+            if "Kernel panic" in ret["stdout"]:
+                raise KernelPanicError()
+
+            return ret
+
+        if self._lanes_count:
+            return await self._wait_no_panic(self._run_command_lane(
+                command,
+                cwd=cwd,
+                env=env,
+                iobuffer=iobuffer))
+
         async with self._cmd_lock:
             self._logger.info("Running command: %s", command)
 
+            # command runs inside the console shell, so it might change the
+            # current working directory and it's always set. Environment
+            # variables are exported only when they differ from the values
+            # already exported inside the console shell
+            setup = []
+
             if cwd:
-                stdout, retcode, _ = await self._exec(f"cd {cwd}", None)
-                if retcode != 0:
-                    raise SUTError(
-                        f"Can't setup current working directory: {stdout}")
+                setup.append(f"cd {cwd}")
 
-            if env:
-                for key, value in env.items():
-                    stdout, retcode, _ = await self._exec(
-                        f"export {key}={value}", None)
-                    if retcode != 0:
-                        raise SUTError(
-                            f"Can't setup env {key}={value}: {stdout}")
+            for key, value in (env or {}).items():
+                if self._shell_env.get(key) != value:
+                    setup.append(f"export {key}={value}")
+
+            script = command
+            error = None
+
+            if setup:
+                # setup and command are sent together in one script
+                error = self._generate_string()
+                script = f"if {' && '.join(setup)}; then {script}; " \
+                    f"else echo {error}; fi"
+
+            stdout, retcode, exec_time = await self._exec(script, iobuffer)
 
-            stdout, retcode, exec_time = await self._exec(
-                f"{command}",
-                iobuffer)
+            if error and stdout and error in stdout:
+                # we don't know which values have been set, so they will
+                # be sent again
+                self._shell_env.clear()
+
+                raise SUTError(
+                    f"Can't setup current working directory {cwd} or "
+                    f"env {env}: {stdout.replace(error, '').strip()}")
+
+            if env:
+                self._shell_env.update(env)
 
             ret = {
                 "command": command,
@@ -512,6 +1428,78 @@ class QemuSUT(SUT):
 
             return ret
 
+    async def _read_transport(self, code: str) -> bytes:
+        """
+        Read the data frame identified by code from the transport file.
+        Frames begin with a '<code> <size>' header line, so we know when
+        data has been completely received. Return None if frame size is
+        negative, which means that no data has been sent.
+        """
+        _, transport_path = self._get_transport()
+        header = f"{code} ".encode(encoding="utf-8")
+
+        chunks = []
+        size = None
+        pending = b""
+        delay = 1e-4
+        idle_t = time.time()
+
+        with open(transport_path, "rb") as transport:
+            transport.seek(self._last_pos)
+
+            while not self._stop and size != 0:
+                toread = self.BUFFSIZE
+                if size is not None:
+                    toread = min(size, self.BUFFSIZE)
+
+                data = transport.read(toread)
+                if not data:
+                    if time.time() - idle_t > self.TRANSFER_TIMEOUT:
+                        raise SUTError("Transfer on transport is incomplete")
+
+                    if not await self.is_running:
+                        raise SUTError("Virtual machine is not running")
+
+                    # qemu is still writing data into the transport file
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 1e-2)
+                    continue
+
+                delay = 1e-4
+                idle_t = time.time()
+
+                if size is None:
+                    pending += data
+
+                    start = pending.find(header)
+                    end = pending.find(b"\n", start + 1)
+                    if start == -1 or end == -1:
+                        continue
+
+                    size = int(pending[start + len(header):end])
+                    data = pending[end + 1:]
+                    pending = b""
+
+                    if size < 0:
+                        chunks = None
+                        size = 0
+
+                    if len(data) > size:
+                        # data following the frame belongs to next transfers
+                        transport.seek(size - len(data), os.SEEK_CUR)
+                        data = data[:size]
+
+                if data:
+                    chunks.append(data)
+                    size -= len(data)
+
+            self._last_pos = transport.tell()
+
+        if chunks is None:
+            return None
+
+        return b"".join(chunks)
+
     async def fetch_file(self, target_path: str) -> bytes:
         if not target_path:
             raise ValueError("target path is empty")
@@ -519,17 +1507,41 @@ class QemuSUT(SUT):
         if not await self.is_running:
             raise SUTError("Virtual machine is not running")
 
-        async with self._fetch_lock:
-            self._logger.info("Downloading %s", target_path)
-
-            _, retcode, _ = await self._exec(f'test -f {target_path}', None)
-            if retcode != 0:
+        if self._ltx:
+            # LTX errors break the connection, so file is checked before
+            ret = await self._ltx.run_command(f"test -f {target_path}")
+            if ret["returncode"] != 0:
                 raise SUTError(f"'{target_path}' doesn't exist")
 
-            transport_dev, transport_path = self._get_transport()
+            return await self._ltx.fetch_file(target_path)
+
+        async with self._fetch_lock:
+            self._logger.info("Downloading %s", target_path)
 
-            stdout, retcode, _ = await self._exec(
-                f"cat {target_path} > {transport_dev}", None)
+            start_t = time.time()
+
+            transport_dev, _ = self._get_transport()
+            code = self._generate_string()
+
+            # isa serial is a cooked tty converting '\n' into '\r\n', so
+            # it's switched to raw mode before sending data like LTX does
+            setup = ""
+            if self._serial_type == "isa":
+                setup = f"stty -F {transport_dev} raw -echo; "
+
+            # file is sent on transport after a header containing its size.
+            # A negative size is sent when file doesn't exist. File might
+            # change while it's sent (i.e. logs), so a snapshot is taken
+            # first and header size always matches the data which follows
+            async with self._cmd_lock:
+                stdout, retcode, _ = await self._exec(
+                    f"{setup}if test -f {target_path}; then ("
+                    f"tmp=$(mktemp) && cat {target_path} > $tmp && "
+                    f"{{ printf '%s %d\\n' {code} $(wc -c < $tmp); "
+                    f"cat $tmp; }} > {transport_dev}; "
+                    f"ret=$?; rm -f $tmp; exit $ret); "
+                    f"else printf '%s -1\\n' {code} > {transport_dev}; fi",
+                    None)
 
             if self._stop:
                 return bytes()
@@ -538,19 +1550,91 @@ class QemuSUT(SUT):
                 raise SUTError(
                     f"Can't send file to {transport_dev}: {stdout}")
 
-            # read back data and send it to the local file path
-            file_size = os.path.getsize(transport_path)
+            retdata = await self._read_transport(code)
 
-            retdata = bytes()
+            if self._stop:
+                return bytes()
 
-            with open(transport_path, "rb") as transport:
-                while not self._stop and self._last_pos < file_size:
-                    transport.seek(self._last_pos)
-                    data = transport.read(4096)
-                    retdata += data
+            if retdata is None:
+                raise SUTError(f"'{target_path}' doesn't exist")
 
-                    self._last_pos = transport.tell()
+            exec_time = max(time.time() - start_t, 1e-6)
 
-            self._logger.info("File downloaded")
+            self._logger.info(
+                "File downloaded (%d bytes, %.2f MB/s)",
+                len(retdata),
+                len(retdata) / exec_time / (1024 * 1024))
 
             return retdata
+
+    async def put_file(self, local_path: str, target_path: str) -> None:
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not os.path.isfile(local_path):
+            raise SUTError(f"'{local_path}' file doesn't exist")
+
+        if not await self.is_running:
+            raise SUTError("Virtual machine is not running")
+
+        if self._ltx:
+            await self._ltx.put_file(local_path, target_path)
+            return
+
+        async with self._cmd_lock:
+            self._logger.info("Uploading %s to %s", local_path, target_path)
+
+            start_t = time.time()
+
+            code = self._generate_string()
+            eof = self._generate_string()
+
+            # file is streamed on console as a base64 here-document. PS2 is
+            # cleared, so the shell won't write a prompt for each line
+            await self._write_stdin(
+                f"PS2=''; base64 -d > {target_path} <<'{eof}'; "
+                f"echo $?-{code}\n")
+
+            size = 0
+
+            try:
+                with open(local_path, "rb") as flocal:
+                    while not self._stop:
+                        data = flocal.read(self.UPLOAD_CHUNK_SIZE)
+                        if not data:
+                            break
+
+                        size += len(data)
+
+                        await self._write_stdin(
+                            base64.encodebytes(data).decode(encoding="ascii"))
+                        await self._proc.stdin.drain()
+            except IOError as err:
+                raise SUTError(err)
+            finally:
+                await self._write_stdin(f"{eof}\n")
+
+            stdout = await self._wait_for(code, None)
+
+            if self._stop:
+                return
+
+            match = re.search(f"(?P<retcode>\\d+)-{code}", stdout or "")
+            if not match:
+                raise SUTError(
+                    f"Can't read return code from reply {repr(stdout)}")
+
+            if match.group("retcode") != "0":
+                raise SUTError(
+                    f"Can't write '{target_path}': "
+                    f"{stdout[:match.start()].strip()}")
+
+            exec_time = max(time.time() - start_t, 1e-6)
+
+            self._logger.info(
+                "File uploaded (%d bytes, %.2f MB/s)",
+                size,
+                size / exec_time / (1024 * 1024))
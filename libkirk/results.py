@@ -113,6 +113,8 @@ class TestResults(Results):
         :type retcode: int
         :param stdout: stdout of the test
         :type stdout: str
+        :param usage: resources usage of the test
+        :type usage: dict
         """
         self._test = kwargs.get("test", None)
         self._failed = max(kwargs.get("failed", 0), 0)
@@ -124,6 +126,7 @@ class TestResults(Results):
         self._retcode = kwargs.get("retcode", 0)
         self._status = kwargs.get("status", ResultStatus.PASS)
         self._stdout = kwargs.get("stdout", None)
+        self._usage = kwargs.get("usage", None)
 
         if not self._test:
             raise ValueError("Empty test object")
@@ -139,7 +142,8 @@ class TestResults(Results):
             f"status: {self._status}, " \
             f"exec_time: {self._exec_t}, " \
             f"retcode: {self._retcode}, " \
-            f"stdout: {repr(self._stdout)}"
+            f"stdout: {repr(self._stdout)}, " \
+            f"usage: {self._usage}"
 
     @property
     def test(self) -> Test:
@@ -165,6 +169,22 @@ class TestResults(Results):
         """
         return self._stdout
 
+    @property
+    def usage(self) -> dict:
+        """
+        Resources usage of the test, such as CPU time and memory peak.
+        None if it's not provided by the SUT.
+        :returns: dict
+        """
+        return self._usage
+
+    @usage.setter
+    def usage(self, value: dict) -> None:
+        """
+        Set resources usage of the test.
+        """
+        self._usage = value
+
     @property
     def status(self) -> int:
         """
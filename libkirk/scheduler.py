@@ -9,14 +9,22 @@ import os
 import re
 import sys
 import time
+import typing
+import shlex
 import asyncio
+import secrets
 import logging
+import itertools
 import libkirk
 import libkirk.data
+from collections import deque
 from libkirk import KirkException
 from libkirk.sut import SUT
 from libkirk.sut import IOBuffer
+from libkirk.sut import TrailerFilter
+from libkirk.sut import SUTError
 from libkirk.sut import KernelPanicError
+from libkirk.sut import tainted_messages
 from libkirk.data import Test
 from libkirk.data import Suite
 from libkirk.results import TestResults
@@ -90,6 +98,364 @@ class RedirectSUTStdout(IOBuffer):
         await libkirk.events.fire("sut_stdout", self._sut.name, data)
 
 
+class AdaptiveSemaphore:
+    """
+    Semaphore which maximum value can be changed at runtime.
+    """
+
+    def __init__(self, value: int) -> None:
+        """
+        :param value: maximum number of concurrent holders
+        :type value: int
+        """
+        self._value = max(value, 1)
+        self._running = 0
+        self._waiters = []
+
+    @property
+    def value(self) -> int:
+        """
+        Maximum number of concurrent holders.
+        """
+        return self._value
+
+    @property
+    def running(self) -> int:
+        """
+        Current number of holders.
+        """
+        return self._running
+
+    def set_value(self, value: int) -> None:
+        """
+        Change the maximum number of concurrent holders. When it's
+        reduced, running holders are not affected.
+        :param value: maximum number of concurrent holders
+        :type value: int
+        """
+        self._value = max(value, 1)
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        """
+        Wake up as many waiters as free slots.
+        """
+        free = self._value - self._running
+
+        while free > 0 and self._waiters:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self) -> None:
+        """
+        Acquire the semaphore.
+        """
+        while self._running >= self._value:
+            waiter = libkirk.get_event_loop().create_future()
+            self._waiters.append(waiter)
+
+            try:
+                await waiter
+            except asyncio.CancelledError as err:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # we have been woken up, so we pass the slot
+                    self._wake_up()
+
+                raise err
+
+        self._running += 1
+
+    def release(self) -> None:
+        """
+        Release the semaphore.
+        """
+        self._running -= 1
+        self._wake_up()
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        self.release()
+
+
+class WorkersPool:
+    """
+    Pool of workers shared between multiple tests schedulers. Tests which
+    can run in parallel take a single worker from the ``shared`` semaphore,
+    while the other tests take all workers by using the pool as an
+    asynchronous context manager, so they are executed alone.
+    """
+
+    def __init__(self, workers: int) -> None:
+        """
+        :param workers: number of workers
+        :type workers: int
+        """
+        self._workers = max(workers, 1)
+        self._sem = asyncio.Semaphore(self._workers)
+        self._lock = asyncio.Lock()
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of workers.
+        """
+        return self._workers
+
+    @property
+    def shared(self) -> asyncio.Semaphore:
+        """
+        Semaphore used to take a single worker.
+        """
+        return self._sem
+
+    async def __aenter__(self) -> None:
+        await self._lock.acquire()
+
+        acquired = 0
+        try:
+            for _ in range(self._workers):
+                await self._sem.acquire()
+                acquired += 1
+        except asyncio.CancelledError as err:
+            for _ in range(acquired):
+                self._sem.release()
+
+            self._lock.release()
+            raise err
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        for _ in range(self._workers):
+            self._sem.release()
+
+        self._lock.release()
+
+
+class TestsQueue:
+    """
+    Queue of tests shared between multiple tests schedulers. Tests which
+    can run in parallel and tests which must run alone are kept in separate
+    queues, so the next test is taken without scanning all pending tests.
+    """
+
+    def __init__(self) -> None:
+        self._parallel = deque()
+        self._serial = deque()
+
+    def __len__(self) -> int:
+        return len(self._parallel) + len(self._serial)
+
+    def __iter__(self) -> typing.Iterator[Test]:
+        return itertools.chain(self._parallel, self._serial)
+
+    def put(self, test: Test, serial: bool, first: bool = False) -> None:
+        """
+        Add a test to the queue.
+        :param test: test to add
+        :type test: Test
+        :param serial: if True, test must run alone
+        :type serial: bool
+        :param first: if True, test is the next one taken from its queue
+        :type first: bool
+        """
+        queue = self._serial if serial else self._parallel
+
+        if first:
+            queue.appendleft(test)
+        else:
+            queue.append(test)
+
+    def get(self, busy: callable) -> Test:
+        """
+        Take the next test. Tests which can run in parallel come first,
+        skipping the ones for which ``busy(test)`` is True. If all of them
+        are busy, the first one is taken anyway.
+        """
+        for index, test in enumerate(self._parallel):
+            if not busy(test):
+                del self._parallel[index]
+                return test
+
+        if self._parallel:
+            return self._parallel.popleft()
+
+        return self._serial.popleft()
+
+    def clear(self) -> None:
+        """
+        Remove all tests from the queue.
+        """
+        self._parallel.clear()
+        self._serial.clear()
+
+
+class WorkersController:
+    """
+    Feedback controller which grows or shrinks the number of workers,
+    according with SUT load and tests throughput. SUT is overloaded when
+    CPU or memory pressure stall information, or the load average per CPU,
+    are above the given thresholds. Workers are increased when SUT is
+    idle and all workers are busy, unless the last increase reduced the
+    number of completed tests per second.
+    """
+
+    # average of the last 10 seconds of the "some" line, in percentage
+    CPU_PRESSURE_HIGH = 40.0
+    CPU_PRESSURE_LOW = 10.0
+    MEMORY_PRESSURE_HIGH = 10.0
+    MEMORY_PRESSURE_LOW = 1.0
+
+    # load average of the last minute, per CPU
+    LOAD_HIGH = 2.0
+
+    def __init__(self, **kwargs: dict) -> None:
+        """
+        :param sut: SUT object to poll
+        :type sut: SUT
+        :param sem: semaphore limiting the workers
+        :type sem: AdaptiveSemaphore
+        :param nproc: number of SUT CPUs
+        :type nproc: int
+        :param min_workers: minimum number of workers
+        :type min_workers: int
+        :param max_workers: maximum number of workers
+        :type max_workers: int
+        :param interval: polling interval in seconds
+        :type interval: float
+        """
+        self._logger = logging.getLogger("kirk.workers")
+        self._sut = kwargs.get("sut", None)
+        self._sem = kwargs.get("sem", None)
+        self._nproc = max(kwargs.get("nproc", 1), 1)
+        self._min_workers = max(kwargs.get("min_workers", 1), 1)
+        self._max_workers = max(
+            kwargs.get("max_workers", self._nproc),
+            self._min_workers)
+        self._interval = kwargs.get("interval", 2.0)
+        self._completed = 0
+        self._last_t = time.time()
+        self._throughput = 0.0
+        self._grown = False
+
+    @property
+    def sem(self) -> AdaptiveSemaphore:
+        """
+        Semaphore limiting the workers.
+        """
+        return self._sem
+
+    @property
+    def max_workers(self) -> int:
+        """
+        Maximum number of workers.
+        """
+        return self._max_workers
+
+    def completed(self) -> None:
+        """
+        Notify the controller that a test has been completed.
+        """
+        self._completed += 1
+
+    async def _read_load(self) -> dict:
+        """
+        Read SUT load average and pressure stall information.
+        """
+        ret = await self._sut.run_command(
+            "cat /proc/loadavg; "
+            "grep -H some /proc/pressure/cpu /proc/pressure/memory "
+            "2>/dev/null")
+
+        stdout = ret["stdout"]
+
+        load = {
+            "loadavg": 0.0,
+            "cpu": 0.0,
+            "memory": 0.0,
+        }
+
+        match = re.search(r"^(?P<loadavg>\d+\.\d+)\s", stdout)
+        if match:
+            load["loadavg"] = float(match.group("loadavg"))
+
+        for resource in ["cpu", "memory"]:
+            match = re.search(
+                f"/proc/pressure/{resource}:some avg10=(?P<avg>\\d+\\.\\d+)",
+                stdout)
+            if match:
+                load[resource] = float(match.group("avg"))
+
+        return load
+
+    async def update(self) -> None:
+        """
+        Read SUT load, then update the number of workers.
+        """
+        load = await self._read_load()
+
+        curr_t = time.time()
+        throughput = self._completed / max(curr_t - self._last_t, 1e-6)
+        self._completed = 0
+        self._last_t = curr_t
+
+        workers = self._sem.value
+
+        self._logger.debug(
+            "load=%s, throughput=%.3f, workers=%d, running=%d",
+            load,
+            throughput,
+            workers,
+            self._sem.running)
+
+        if load["cpu"] >= self.CPU_PRESSURE_HIGH or \
+                load["memory"] >= self.MEMORY_PRESSURE_HIGH or \
+                load["loadavg"] / self._nproc >= self.LOAD_HIGH:
+            workers -= max(workers // 4, 1)
+            self._grown = False
+        elif self._grown and throughput < self._throughput * 0.9:
+            # last increase made things worse
+            workers -= 1
+            self._grown = False
+        elif self._sem.running >= workers and \
+                load["cpu"] < self.CPU_PRESSURE_LOW and \
+                load["memory"] < self.MEMORY_PRESSURE_LOW:
+            workers += 1
+            self._grown = True
+        else:
+            self._grown = False
+
+        self._throughput = throughput
+
+        workers = min(max(workers, self._min_workers), self._max_workers)
+        if workers != self._sem.value:
+            self._logger.info("Changing workers: %d", workers)
+            self._sem.set_value(workers)
+
+    async def run(self) -> None:
+        """
+        Periodically update the number of workers, until cancelled. The
+        number of workers learned by previous runs is kept.
+        """
+        # time spent between runs doesn't count for throughput
+        self._completed = 0
+        self._last_t = time.time()
+
+        while True:
+            await asyncio.sleep(self._interval)
+
+            try:
+                await asyncio.wait_for(self.update(), self._interval)
+            except asyncio.TimeoutError:
+                self._logger.info("SUT load polling timed out")
+            except (KirkException, KeyError, ValueError) as err:
+                self._logger.info("Can't read SUT load: %s", err)
+
+
 class TestScheduler(Scheduler):
     """
     Schedule and run tests, taking into account status of the kernel
@@ -113,6 +479,21 @@ class TestScheduler(Scheduler):
         :type max_workers: int
         :param force_parallel: Force parallel execution of all tests
         :type force_parallel: bool
+        :param wrap_tests: write /dev/kmsg, check tainted kernel and run
+            the test using a single SUT command
+        :type wrap_tests: bool
+        :param durations: tests durations in seconds from previous
+            executions, used to run longest tests first
+        :type durations: dict
+        :param adaptive_workers: if True, number of workers is adapted
+            according with SUT load, starting from the number of SUT CPUs
+        :type adaptive_workers: bool
+        :param workers_pool: workers shared with other tests schedulers.
+            If defined, ``max_workers`` is not used
+        :type workers_pool: WorkersPool
+        :param quarantine: names of the tests which are always executed
+            alone, after the other tests
+        :type quarantine: set
         """
         self._logger = logging.getLogger("kirk.test_scheduler")
         self._sut = kwargs.get("sut", None)
@@ -120,10 +501,22 @@ class TestScheduler(Scheduler):
         self._timeout = max(kwargs.get("timeout", 3600.0), 0.0)
         self._max_workers = kwargs.get("max_workers", 1)
         self._force_parallel = kwargs.get("force_parallel", False)
+        self._wrap_tests = kwargs.get("wrap_tests", False)
+        self._durations = kwargs.get("durations", None)
+        self._adaptive_workers = kwargs.get("adaptive_workers", False)
+        self._workers_pool = kwargs.get("workers_pool", None)
+        self._quarantine = kwargs.get("quarantine", None)
+        self._controller = None
+        self._resources = {}
         self._lock = asyncio.Lock()
         self._results = []
         self._stop = False
         self._tasks = []
+        self._running = []
+        self._suspects = []
+
+        if self._quarantine is None:
+            self._quarantine = set()
 
         if not self._sut:
             raise ValueError("SUT object is empty")
@@ -149,12 +542,29 @@ class TestScheduler(Scheduler):
         """
         code, messages = await self._sut.get_tainted_info()
 
+        await self._notify_tainted(code, messages)
+
+        return code, messages
+
+    async def _notify_tainted(self, code: int, messages: list) -> None:
+        """
+        Notify tainted kernel messages.
+        """
         for msg in messages:
             if msg:
                 self._logger.debug("Kernel tainted (%d): %s", code, msg)
                 await libkirk.events.fire("kernel_tainted", msg)
 
-        return code, messages
+    def _kmsg_message(self, test: Test) -> str:
+        """
+        Return the message that is written on /dev/kmsg before test.
+        """
+        cmd = self._command_from_test(test)
+
+        message = f'{sys.argv[0]}[{os.getpid()}]: ' \
+            f'starting test {test.name} ({cmd})\n'
+
+        return message
 
     async def _write_kmsg(self, test: Test) -> None:
         """
@@ -167,20 +577,101 @@ class TestScheduler(Scheduler):
             self._logger.info("Can't write on /dev/kmsg from user")
             return
 
-        cmd = f"{test.command}"
-        if len(test.arguments) > 0:
-            cmd += ' '
-            cmd += ' '.join(test.arguments)
-
-        message = f'{sys.argv[0]}[{os.getpid()}]: ' \
-            f'starting test {test.name} ({cmd})\n'
+        message = self._kmsg_message(test)
 
         await self._sut.run_command(f'echo -n "{message}" > /dev/kmsg')
 
+    def _wrap_command(self, test: Test, marker: str) -> str:
+        """
+        Return a script that writes test information on /dev/kmsg, reads
+        tainted status before and after running the test, and that prints
+        a trailer with test return code and tainted values at the end:
+
+            <marker> <returncode> <tainted before> <tainted after>
+
+        The script runs inside a subshell, so SUT's shell is not modified.
+        """
+        cmd = self._command_from_test(test)
+        message = shlex.quote(self._kmsg_message(test).rstrip())
+        tainted = "cat /proc/sys/kernel/tainted 2>/dev/null || echo -1"
+
+        script = \
+            f"(kirk_t1=$({tainted}); " \
+            f"[ \"$(id -u)\" = \"0\" ] && " \
+            f"echo -n {message} 2>/dev/null > /dev/kmsg; " \
+            f"( {cmd} ); " \
+            "kirk_rc=$?; " \
+            f"kirk_t2=$({tainted}); " \
+            f"printf '\\n{marker} %s %s %s\\n' " \
+            "\"$kirk_rc\" \"$kirk_t1\" \"$kirk_t2\"; " \
+            "exit $kirk_rc)"
+
+        return script
+
+    async def _run_wrapped(self, test: Test, iobuffer: IOBuffer) -> tuple:
+        """
+        Run a test wrapped by the script created by `_wrap_command`.
+        Return test data and tainted messages if kernel has been tainted
+        during test execution.
+        """
+        marker = f"kirk-{secrets.token_hex(8)}"
+        trailer = TrailerFilter(iobuffer, f"\n{marker} ")
+
+        try:
+            test_data = await asyncio.wait_for(self._sut.run_command(
+                self._wrap_command(test, marker),
+                cwd=test.cwd,
+                env=test.env,
+                iobuffer=trailer),
+                timeout=self._timeout
+            )
+        finally:
+            await trailer.flush()
+
+        stdout = test_data["stdout"]
+        test_data["command"] = self._command_from_test(test)
+
+        match = re.search(
+            f"\n{marker} "
+            r"(?P<retcode>-?\d+) (?P<tainted1>-?\d+) (?P<tainted2>-?\d+)",
+            stdout)
+
+        if not match:
+            self._logger.info("Can't find wrapped execution trailer")
+            return test_data, None
+
+        test_data["stdout"] = stdout[:match.start()]
+        test_data["returncode"] = int(match.group("retcode"))
+
+        tainted_code1 = int(match.group("tainted1"))
+        tainted_code2 = int(match.group("tainted2"))
+
+        if tainted_code1 < 0 or tainted_code2 < 0:
+            raise SUTError("Can't read tainted kernel information")
+
+        tainted_msg2 = tainted_messages(tainted_code2)
+        await self._notify_tainted(tainted_code2, tainted_msg2)
+
+        if tainted_code2 == tainted_code1:
+            return test_data, None
+
+        self._logger.info("Recognised Kernel tainted: %s", tainted_msg2)
+
+        return test_data, tainted_msg2
+
     @ property
     def results(self) -> list:
         return self._results
 
+    @property
+    def suspects(self) -> list:
+        """
+        Tests which were running when the last kernel error has been
+        recognised, including the test that recognised it, so they might
+        be the cause of it.
+        """
+        return self._suspects
+
     async def stop(self) -> None:
         if not self._tasks:
             return
@@ -203,21 +694,72 @@ class TestScheduler(Scheduler):
 
         self._logger.info("Tests execution has stopped")
 
+    async def _acquire_resources(self, test: Test) -> list:
+        """
+        Acquire the locks of all resources used by test and return them.
+        Locks are always acquired in the same order to avoid deadlocks.
+        """
+        locks = []
+
+        try:
+            for resource in sorted(set(test.resources)):
+                if resource not in self._resources:
+                    self._resources[resource] = asyncio.Lock()
+
+                lock = self._resources[resource]
+                await lock.acquire()
+                locks.append(lock)
+        except asyncio.CancelledError as err:
+            self._release_resources(locks)
+            raise err
+
+        return locks
+
+    @staticmethod
+    def _release_resources(locks: list) -> None:
+        """
+        Release the given resources locks.
+        """
+        for lock in reversed(locks):
+            lock.release()
+
+    async def _run_test(self, test: Test, sem: asyncio.Semaphore) -> None:
+        """
+        Run a single test and populate the results array. Resources are
+        acquired before the worker, so tests waiting for a resource don't
+        keep workers busy.
+        """
+        locks = await self._acquire_resources(test)
+        try:
+            await self._run_test_locked(test, sem)
+        finally:
+            if test in self._running:
+                self._running.remove(test)
+
+            self._release_resources(locks)
+
     # pylint: disable=too-many-statements
     # pylint: disable=too-many-locals
-    async def _run_test(self, test: Test, sem: asyncio.Semaphore) -> None:
+    async def _run_test_locked(
+            self,
+            test: Test,
+            sem: asyncio.Semaphore) -> None:
         """
-        Run a single test and populate the results array.
+        Run a single test, once its resources have been acquired.
         """
         async with sem:
             if self._stop:
                 return None
 
+            self._running.append(test)
+
             self._logger.info("Running test %s", test.name)
             self._logger.debug(test)
 
             await libkirk.events.fire("test_started", test)
-            await self._write_kmsg(test)
+
+            if not self._wrap_tests:
+                await self._write_kmsg(test)
 
             iobuffer = RedirectTestStdout(test)
             cmd = self._command_from_test(test)
@@ -228,24 +770,32 @@ class TestScheduler(Scheduler):
             status = self.STATUS_OK
 
             try:
-                tainted_code1, _ = await self._get_tainted_status()
-
-                test_data = await asyncio.wait_for(self._sut.run_command(
-                    cmd,
-                    cwd=test.cwd,
-                    env=test.env,
-                    iobuffer=iobuffer),
-                    timeout=self._timeout
-                )
-
-                tainted_code2, tainted_msg2 = await self._get_tainted_status()
-                if tainted_code2 != tainted_code1:
-                    self._logger.info(
-                        "Recognised Kernel tainted: %s",
-                        tainted_msg2)
+                if self._wrap_tests:
+                    test_data, tainted_msg = await self._run_wrapped(
+                        test, iobuffer)
+
+                    if tainted_msg:
+                        status = self.KERNEL_TAINED
+                else:
+                    tainted_code1, _ = await self._get_tainted_status()
+
+                    test_data = await asyncio.wait_for(self._sut.run_command(
+                        cmd,
+                        cwd=test.cwd,
+                        env=test.env,
+                        iobuffer=iobuffer),
+                        timeout=self._timeout
+                    )
+
+                    tainted_code2, tainted_msg2 = \
+                        await self._get_tainted_status()
+                    if tainted_code2 != tainted_code1:
+                        self._logger.info(
+                            "Recognised Kernel tainted: %s",
+                            tainted_msg2)
 
-                    tainted_msg = tainted_msg2
-                    status = self.KERNEL_TAINED
+                        tainted_msg = tainted_msg2
+                        status = self.KERNEL_TAINED
             except libkirk.sut.KernelPanicError:
                 exec_time = time.time() - start_t
 
@@ -285,9 +835,17 @@ class TestScheduler(Scheduler):
                 test_data["returncode"],
                 test_data["exec_time"])
 
+            results.usage = test_data.get("usage", None)
+
             self._logger.debug("results=%s", results)
             self._results.append(results)
 
+            if self._controller:
+                self._controller.completed()
+
+            if status not in [self.STATUS_OK, self.TEST_TIMEOUT]:
+                self._suspects = list(self._running)
+
             # raise kernel errors at the end so we can collect test results
             if status == self.KERNEL_TAINED:
                 await libkirk.events.fire("kernel_tainted", tainted_msg)
@@ -313,7 +871,7 @@ class TestScheduler(Scheduler):
         if not tests:
             return
 
-        sem = asyncio.Semaphore(1)
+        sem = self._workers_pool or asyncio.Semaphore(1)
 
         self._logger.info("Scheduling %d tests on single worker", len(tests))
 
@@ -323,6 +881,25 @@ class TestScheduler(Scheduler):
 
             await task
 
+    def _sort_by_duration(self, tests: list) -> list:
+        """
+        Sort tests from the longest to the shortest, according with
+        durations of previous executions. Tests which have never been
+        executed are estimated with the average duration.
+        """
+        if not self._durations:
+            return tests
+
+        default = sum(self._durations.values()) / len(self._durations)
+
+        self._logger.info(
+            "Sorting tests by duration (default: %.3f seconds)", default)
+
+        return sorted(
+            tests,
+            key=lambda test: self._durations.get(test.name, default),
+            reverse=True)
+
     async def _run_parallel(self, tests: list) -> None:
         """
         Run tests in parallel.
@@ -330,18 +907,99 @@ class TestScheduler(Scheduler):
         if not tests:
             return
 
-        sem = asyncio.Semaphore(self._max_workers)
+        tests = self._sort_by_duration(tests)
+
+        if self._adaptive_workers:
+            await self._run_adaptive(tests)
+            return
+
+        workers = self._max_workers
+        if self._workers_pool:
+            sem = self._workers_pool.shared
+            workers = self._workers_pool.workers
+        else:
+            sem = asyncio.Semaphore(self._max_workers)
+
         tasks = [asyncio.Task(self._run_test(test, sem)) for test in tests]
 
         self._logger.info(
             "Scheduling %d tests on %d workers",
             len(tasks),
-            self._max_workers)
+            workers)
 
         self._tasks.extend(tasks)
         await asyncio.gather(*tasks)
 
-    async def schedule(self, jobs: list) -> None:
+    async def read_nproc(self) -> int:
+        """
+        Return the number of SUT CPUs.
+        :returns: int
+        """
+        nproc = 1
+
+        ret = await self._sut.run_command("nproc")
+        if ret["returncode"] == 0:
+            try:
+                nproc = int(ret["stdout"].strip())
+            except ValueError:
+                self._logger.info("Can't read SUT CPUs: %s", ret["stdout"])
+
+        return nproc
+
+    async def _create_controller(self) -> None:
+        """
+        Create the adaptive workers controller. Controller is kept between
+        schedule() calls, so the number of workers learned by previous
+        suites is not lost.
+        """
+        if self._controller:
+            return
+
+        nproc = await self.read_nproc()
+
+        max_workers = nproc * 2
+        if self._sut.max_workers:
+            max_workers = min(max_workers, self._sut.max_workers)
+
+        self._controller = WorkersController(
+            sut=self._sut,
+            sem=AdaptiveSemaphore(min(nproc, max_workers)),
+            nproc=nproc,
+            min_workers=1,
+            max_workers=max_workers)
+
+    async def _run_adaptive(self, tests: list) -> None:
+        """
+        Run tests in parallel, adapting the number of workers according
+        with SUT load.
+        """
+        await self._create_controller()
+
+        sem = self._controller.sem
+        tasks = [asyncio.Task(self._run_test(test, sem)) for test in tests]
+
+        self._logger.info(
+            "Scheduling %d tests on %d adaptive workers",
+            len(tasks),
+            sem.value)
+
+        self._tasks.extend(tasks)
+
+        controller = libkirk.create_task(self._controller.run())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            controller.cancel()
+            await asyncio.gather(controller, return_exceptions=True)
+
+    async def schedule(self, jobs: list, alone: bool = False) -> None:
+        """
+        :param jobs: list of Test
+        :type jobs: list
+        :param alone: if True, tests run one after another and alone on
+            the SUT, taking all the workers shared with other schedulers
+        :type alone: bool
+        """
         if not jobs:
             raise ValueError("jobs list is empty")
 
@@ -354,17 +1012,30 @@ class TestScheduler(Scheduler):
 
             self._tasks.clear()
             self._results.clear()
+            self._suspects = []
+
+            # quarantined tests run alone, after all the others
+            quarantined = [
+                test for test in jobs
+                if alone or test.name in self._quarantine
+            ]
+            jobs = [test for test in jobs if test not in quarantined]
 
             try:
                 if self._force_parallel:
                     await self._run_parallel(jobs)
+                    await self._run_and_wait(quarantined)
                 else:
+                    # tests declaring their resources run in parallel with
+                    # the others, holding the resources locks
                     await self._run_parallel([
-                        test for test in jobs if test.parallelizable
+                        test for test in jobs
+                        if test.parallelizable or test.resources
                     ])
                     await self._run_and_wait([
-                        test for test in jobs if not test.parallelizable
-                    ])
+                        test for test in jobs
+                        if not (test.parallelizable or test.resources)
+                    ] + quarantined)
             except KirkException as err:
                 self._logger.info(
                     "%s caught. Cancel tasks",
@@ -389,6 +1060,132 @@ class TestScheduler(Scheduler):
             finally:
                 self._tasks.clear()
 
+    def _is_serial(self, test: Test) -> bool:
+        """
+        True if test must run alone on the SUT.
+        """
+        if test.name in self._quarantine:
+            return True
+
+        if self._force_parallel:
+            return False
+
+        return not (test.parallelizable or test.resources)
+
+    def _resources_busy(self, test: Test) -> bool:
+        """
+        True if test is waiting for a resource which is in use.
+        """
+        for res in test.resources:
+            if res in self._resources and self._resources[res].locked():
+                return True
+
+        return False
+
+    def create_queue(self, tests: list) -> TestsQueue:
+        """
+        Create a queue which can be shared with other tests schedulers,
+        containing tests sorted by duration.
+        :param tests: list of Test
+        :type tests: list
+        :returns: TestsQueue
+        """
+        queue = TestsQueue()
+
+        for test in self._sort_by_duration(tests):
+            queue.put(test, self._is_serial(test))
+
+        return queue
+
+    async def _run_queue(self, queue: TestsQueue, pool: WorkersPool) -> None:
+        """
+        Worker taking one test at a time from queue, until it's empty.
+        Tests which have not been completed go back to the queue.
+        """
+        while not self._stop and queue:
+            test = queue.get(self._resources_busy)
+
+            try:
+                if self._is_serial(test):
+                    await self._run_test(test, pool)
+                elif self._controller:
+                    async with pool.shared:
+                        await self._run_test(test, self._controller.sem)
+                else:
+                    await self._run_test(test, pool.shared)
+            finally:
+                # result of a completed test is one of the latest ones
+                results = reversed(self._results)
+                if not any(res.test is test for res in results):
+                    queue.put(test, self._is_serial(test), first=True)
+
+    async def schedule_queue(self, queue: TestsQueue) -> None:
+        """
+        Run tests taken from a queue which is shared with other tests
+        schedulers. Each free worker takes one test at a time from the
+        queue, so workers are never waiting for slower tests to complete.
+        Tests which can't run in parallel are taken last, and they are
+        executed alone.
+        :param queue: queue created by ``create_queue``, which is
+            consumed during execution
+        :type queue: TestsQueue
+        """
+        async with self._lock:
+            self._tasks.clear()
+            self._results.clear()
+            self._suspects = []
+
+            workers = self._max_workers
+            if self._adaptive_workers:
+                await self._create_controller()
+                workers = self._controller.max_workers
+
+            pool = WorkersPool(workers)
+
+            self._logger.info(
+                "Scheduling tests queue on %d workers", workers)
+
+            self._tasks.extend([
+                libkirk.create_task(self._run_queue(queue, pool))
+                for _ in range(workers)
+            ])
+
+            controller = None
+            if self._controller:
+                controller = libkirk.create_task(self._controller.run())
+
+            try:
+                await asyncio.gather(*self._tasks)
+            except KirkException as err:
+                self._logger.info(
+                    "%s caught. Cancel tasks",
+                    err.__class__.__name__)
+
+                for task in self._tasks:
+                    if not task.done():
+                        task.cancel()
+
+                self._logger.info("Wait for tasks to be done")
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+
+                if not self._stop:
+                    raise err
+            except asyncio.CancelledError as err:
+                for task in self._tasks:
+                    if not task.done():
+                        task.cancel()
+
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+
+                if not self._stop:
+                    raise err
+            finally:
+                if controller:
+                    controller.cancel()
+                    await asyncio.gather(controller, return_exceptions=True)
+
+                self._tasks.clear()
+
 
 class SuiteScheduler(Scheduler):
     """
@@ -414,15 +1211,44 @@ class SuiteScheduler(Scheduler):
         :type skip_tests: str
         :param force_parallel: Force parallel execution of all tests
         :type force_parallel: bool
+        :param wrap_tests: write /dev/kmsg, check tainted kernel and run
+            the test using a single SUT command
+        :type wrap_tests: bool
+        :param durations: tests durations in seconds from previous
+            executions, used to run longest tests first
+        :type durations: dict
+        :param adaptive_workers: if True, number of workers is adapted
+            according with SUT load, starting from the number of SUT CPUs
+        :type adaptive_workers: bool
+        :param suts: pool of SUTs sharing the tests queue. When defined,
+            ``sut`` is the first SUT of the pool
+        :type suts: list(SUT)
+        :param parallel_suites: if True, suites are executed at the same
+            time, sharing the same workers
+        :type parallel_suites: bool
         """
         self._logger = logging.getLogger("kirk.suite_scheduler")
+        self._suts = kwargs.get("suts", None)
         self._sut = kwargs.get("sut", None)
         self._framework = kwargs.get("framework", None)
         self._suite_timeout = max(kwargs.get("suite_timeout", 3600.0), 0.0)
         self._skip_tests = kwargs.get("skip_tests", None)
+        self._max_workers = max(kwargs.get("max_workers", 1), 1)
+        self._adaptive_workers = kwargs.get("adaptive_workers", False)
+        self._parallel_suites = kwargs.get("parallel_suites", False)
+        self._kwargs = kwargs
         self._results = []
         self._stop = False
         self._lock = asyncio.Lock()
+        self._restart_lock = asyncio.Lock()
+        self._restarts = 0
+        self._suites_schedulers = []
+        self._quarantine = set()
+
+        if self._suts:
+            self._sut = self._suts[0]
+        else:
+            self._suts = [self._sut]
 
         if not self._sut:
             raise ValueError("SUT is an empty object")
@@ -430,15 +1256,33 @@ class SuiteScheduler(Scheduler):
         if not self._framework:
             raise ValueError("Framework object is empty")
 
-        force_parallel = kwargs.get("force_parallel", False)
-        exec_timeout = max(kwargs.get("exec_timeout", 3600.0), 0.0)
+        # one tests scheduler for each SUT
+        self._pool = [
+            (sut, self._create_scheduler(sut)) for sut in self._suts
+        ]
 
-        self._scheduler = TestScheduler(
-            sut=self._sut,
+        self._scheduler = self._pool[0][1]
+
+    def _create_scheduler(
+            self,
+            sut: SUT,
+            workers_pool: WorkersPool = None) -> TestScheduler:
+        """
+        Create a new tests scheduler for the given SUT.
+        """
+        scheduler = TestScheduler(
+            sut=sut,
             framework=self._framework,
-            timeout=exec_timeout,
-            max_workers=kwargs.get("max_workers", 1),
-            force_parallel=force_parallel)
+            timeout=max(self._kwargs.get("exec_timeout", 3600.0), 0.0),
+            max_workers=self._max_workers,
+            force_parallel=self._kwargs.get("force_parallel", False),
+            wrap_tests=self._kwargs.get("wrap_tests", False),
+            durations=self._kwargs.get("durations", None),
+            adaptive_workers=self._adaptive_workers,
+            workers_pool=workers_pool,
+            quarantine=self._quarantine)
+
+        return scheduler
 
     @ property
     def results(self) -> list:
@@ -452,7 +1296,16 @@ class SuiteScheduler(Scheduler):
 
         self._stop = True
         try:
-            await self._scheduler.stop()
+            if len(self._pool) > 1:
+                await asyncio.gather(*[
+                    scheduler.stop() for _, scheduler in self._pool
+                ])
+            elif self._suites_schedulers:
+                await asyncio.gather(*[
+                    scheduler.stop() for scheduler in self._suites_schedulers
+                ])
+            else:
+                await self._scheduler.stop()
 
             async with self._lock:
                 pass
@@ -461,26 +1314,158 @@ class SuiteScheduler(Scheduler):
 
         self._logger.info("Suites execution has stopped")
 
-    async def _restart_sut(self) -> None:
+    async def _restart(self, sut: SUT, scheduler: TestScheduler) -> None:
         """
-        Reboot the SUT.
+        Reboot the given SUT, stopping its tests scheduler.
         """
         self._logger.info("Rebooting SUT")
 
-        await libkirk.events.fire("sut_restart", self._sut.name)
+        await libkirk.events.fire("sut_restart", sut.name)
 
-        iobuffer = RedirectSUTStdout(self._sut)
+        iobuffer = RedirectSUTStdout(sut)
 
-        await self._scheduler.stop()
-        await self._sut.stop(iobuffer=iobuffer)
-        await self._sut.ensure_communicate(iobuffer=iobuffer)
+        await scheduler.stop()
+        await sut.restart(iobuffer=iobuffer)
 
         self._logger.info("SUT rebooted")
 
-    async def _run_suite(self, suite: Suite) -> None:
+    async def _restart_sut(self) -> None:
+        """
+        Reboot the SUT.
+        """
+        await self._restart(self._sut, self._scheduler)
+
+    async def _restart_shared_sut(self, restarts: int) -> None:
+        """
+        Reboot the SUT shared by suites running at the same time, stopping
+        the tests of all suites. ``restarts`` is the number of restarts seen
+        by the suite before running its tests, so SUT is rebooted only once
+        when multiple suites recognise the same kernel error.
+        """
+        async with self._restart_lock:
+            if restarts != self._restarts:
+                return
+
+            await asyncio.gather(*[
+                scheduler.stop() for scheduler in self._suites_schedulers
+            ])
+
+            await self._restart(self._sut, self._scheduler)
+
+            self._restarts += 1
+
+    @staticmethod
+    def _skipped_result(test: Test) -> TestResults:
+        """
+        Return the results of a test which has not been executed.
+        """
+        return TestResults(
+            test=test,
+            failed=0,
+            passed=0,
+            broken=0,
+            skipped=1,
+            warnings=0,
+            exec_time=0.0,
+            retcode=32,
+            stdout=""
+        )
+
+    async def _run_lane(
+            self,
+            sut: SUT,
+            scheduler: TestScheduler,
+            queue: TestsQueue,
+            tests_results: list) -> None:
+        """
+        Run tests taken from the queue shared by all SUTs of the pool,
+        until queue is empty. Each free SUT worker takes one test at a
+        time, and SUT is rebooted after kernel errors.
+        """
+        while not self._stop and queue:
+            try:
+                await scheduler.schedule_queue(queue)
+            except (KernelPanicError,
+                    KernelTainedError,
+                    KernelTimeoutError):
+                await self._restart(sut, scheduler)
+            finally:
+                tests_results.extend(scheduler.results)
+
+    async def _run_pool(
+            self,
+            suite: Suite,
+            tests_left: list,
+            tests_results: list) -> float:
+        """
+        Run tests on all SUTs of the pool and return the execution time.
+        If suite times out, left tests are marked as skipped and None is
+        returned.
+        """
+        queue = self._scheduler.create_queue(tests_left)
+        tests_left.clear()
+
+        tasks = [
+            libkirk.create_task(self._run_lane(
+                sut,
+                scheduler,
+                queue,
+                tests_results))
+            for sut, scheduler in self._pool
+        ]
+
+        exec_time = None
+        timed_out = False
+
+        try:
+            start_t = time.time()
+            await asyncio.wait_for(
+                asyncio.gather(*tasks),
+                timeout=self._suite_timeout
+            )
+            exec_time = time.time() - start_t
+        except asyncio.TimeoutError:
+            timed_out = True
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+            # gather() returns as soon as the first lane is cancelled, so we
+            # wait for all lanes to put their tests back in the queue
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            tests_left.extend(queue)
+            queue.clear()
+
+        if timed_out:
+            self._logger.info("Testing suite timed out: %s", suite.name)
+
+            await libkirk.events.fire(
+                "suite_timeout",
+                suite,
+                self._suite_timeout)
+
+            for test in tests_left:
+                tests_results.append(self._skipped_result(test))
+
+            tests_left.clear()
+
+        return exec_time
+
+    async def _run_suite(
+            self,
+            suite: Suite,
+            scheduler: TestScheduler = None) -> None:
         """
         Run a single testing suite and populate the results array.
+        When ``scheduler`` is defined, suite is running together with other
+        suites, and it's used instead of the default tests scheduler.
         """
+        parallel_suite = scheduler is not None
+        if not scheduler:
+            scheduler = self._scheduler
+
         self._logger.info("Running suite %s", suite.name)
         self._logger.debug(suite)
 
@@ -491,6 +1476,7 @@ class SuiteScheduler(Scheduler):
         tests_results = []
         tests = []
         tests_left = []
+        suspects = []
         timed_out = False
         exec_times = []
 
@@ -506,11 +1492,50 @@ class SuiteScheduler(Scheduler):
         tests_left.extend(tests)
 
         try:
-            while not self._stop and tests_left:
+            if len(self._pool) > 1:
+                exec_time = await self._run_pool(
+                    suite,
+                    tests_left,
+                    tests_results)
+
+                if exec_time is not None:
+                    exec_times.append(exec_time)
+
+            while len(self._pool) == 1 and not self._stop and \
+                    (tests_left or suspects):
+                # wait for SUT to be rebooted by other suites
+                async with self._restart_lock:
+                    restarts = self._restarts
+
+                # after a kernel error, the tests which were running at the
+                # same time are bisected, in order to find the culprit.
+                # The last suspect runs alone to confirm it's the culprit
+                jobs = tests_left
+                alone = False
+
+                if len(suspects) == 1:
+                    # other suites' tests are paused, so they can't cause
+                    # the kernel error
+                    jobs = suspects
+                    suspects = []
+                    alone = True
+
+                    self._logger.info(
+                        "Bisecting kernel error: running %s alone",
+                        jobs[0].name)
+                elif suspects:
+                    jobs = suspects[:len(suspects) // 2]
+                    suspects = suspects[len(jobs):]
+
+                    self._logger.info(
+                        "Bisecting kernel error: running %d of %d tests",
+                        len(jobs),
+                        len(jobs) + len(suspects))
+
                 try:
                     start_t = time.time()
                     await asyncio.wait_for(
-                        self._scheduler.schedule(tests_left),
+                        scheduler.schedule(jobs, alone=alone),
                         timeout=self._suite_timeout
                     )
                     exec_times.append(time.time() - start_t)
@@ -527,40 +1552,47 @@ class SuiteScheduler(Scheduler):
                 except (KernelPanicError,
                         KernelTainedError,
                         KernelTimeoutError):
+                    suspects = list(scheduler.suspects)
+
+                    # tests of other suites are not suspects, so a single
+                    # suspect is the culprit only if it was running alone
+                    if len(suspects) == 1 and \
+                            (alone or not parallel_suite):
+                        # kernel error has been reproduced by a test
+                        # running alone, so it's the culprit
+                        self._logger.info(
+                            "Quarantine test %s: it will run alone",
+                            suspects[0].name)
+
+                        self._quarantine.add(suspects[0].name)
+                        suspects.clear()
+
                     # once we catch a kernel error, restart the SUT
-                    await self._restart_sut()
+                    if parallel_suite:
+                        await self._restart_shared_sut(restarts)
+                    else:
+                        await self._restart_sut()
                 finally:
-                    tests_results.extend(self._scheduler.results)
+                    # tests executed again during bisection replace their
+                    # previous results
+                    rerun = {res.test.name for res in scheduler.results}
+                    tests_results[:] = [
+                        item for item in tests_results
+                        if item.test.name not in rerun
+                    ]
+                    tests_results.extend(scheduler.results)
 
                 # tests_left array will be populated when SUT is
                 # rebooted after a kernel error
-                tests_left.clear()
-
-                for test in tests:
-                    found = False
-                    for test_res in tests_results:
-                        if test.name == test_res.test.name:
-                            found = True
-                            break
+                completed = {res.test.name for res in tests_results}
 
-                    if not found:
-                        tests_left.append(test)
+                tests_left.clear()
+                tests_left.extend(
+                    test for test in tests if test.name not in completed)
 
                 if timed_out:
                     for test in tests_left:
-                        tests_results.append(
-                            TestResults(
-                                test=test,
-                                failed=0,
-                                passed=0,
-                                broken=0,
-                                skipped=1,
-                                warnings=0,
-                                exec_time=0.0,
-                                retcode=32,
-                                stdout=""
-                            )
-                        )
+                        tests_results.append(self._skipped_result(test))
 
                     # no more tests need to be run
                     tests_left.clear()
@@ -602,5 +1634,42 @@ class SuiteScheduler(Scheduler):
         async with self._lock:
             self._results.clear()
 
-            for suite in jobs:
-                await libkirk.create_task(self._run_suite(suite))
+            if self._parallel_suites and len(self._pool) == 1:
+                await self._run_parallel_suites(jobs)
+            else:
+                for suite in jobs:
+                    await libkirk.create_task(self._run_suite(suite))
+
+    async def _run_parallel_suites(self, suites: list) -> None:
+        """
+        Run all suites at the same time, sharing the same workers. Each
+        suite has its own tests scheduler, so tests results and suite
+        timeout are handled per suite.
+        """
+        self._logger.info("Running %d suites in parallel", len(suites))
+
+        workers_pool = WorkersPool(self._max_workers)
+
+        self._suites_schedulers = [
+            self._create_scheduler(self._sut, workers_pool=workers_pool)
+            for _ in suites
+        ]
+
+        tasks = [
+            libkirk.create_task(self._run_suite(suite, scheduler=scheduler))
+            for suite, scheduler in zip(suites, self._suites_schedulers)
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            self._suites_schedulers = []
+
+            # keep the same order of the requested suites
+            self._results.sort(key=lambda res: suites.index(res.suite))
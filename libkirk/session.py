@@ -48,20 +48,34 @@ class Session:
         :type framework: Framework
         :param sut: SUT communication object
         :type sut: SUT
+        :param suts: pool of SUT communication objects sharing the tests
+            execution. When defined, ``sut`` is the first SUT of the pool
+        :type suts: list(SUT)
         :param exec_timeout: test timeout
         :type exec_timeout: float
         :param suite_timeout: testing suite timeout
         :type suite_timeout: float
-        :param workers: number of workers for testing suite scheduler
-        :type workers: int
+        :param workers: number of workers for testing suite scheduler,
+            or "auto" to adapt it according with SUT load
+        :type workers: int | str
         :param force_parallel: Force parallel execution of all tests
         :type force_parallel: bool
         :param skip_tests: regexp that exclude tests from execution
         :type skip_tests: str
+        :param wrap_tests: write /dev/kmsg, check tainted kernel and run
+            the test using a single SUT command
+        :type wrap_tests: bool
+        :param durations: tests durations in seconds from previous
+            executions, used to run longest tests first
+        :type durations: dict
+        :param parallel_suites: if True, suites are executed at the same
+            time, sharing the same workers
+        :type parallel_suites: bool
         """
         self._logger = logging.getLogger("kirk.session")
         self._tmpdir = kwargs.get("tmpdir", None)
         self._framework = kwargs.get("framework", None)
+        self._suts = kwargs.get("suts", None)
         self._sut = kwargs.get("sut", None)
         self._exec_timeout = kwargs.get("exec_timeout", 3600.0)
         self._stop = False
@@ -74,33 +88,59 @@ class Session:
         if not self._framework:
             raise ValueError("framework is empty")
 
+        if self._suts:
+            self._sut = self._suts[0]
+        else:
+            self._suts = [self._sut]
+
         if not self._sut:
             raise ValueError("sut is empty")
 
         suite_timeout = kwargs.get("suite_timeout", 3600.0)
         workers = kwargs.get("workers", 1)
+        adaptive_workers = workers == "auto"
         force_parallel = kwargs.get("force_parallel", False)
         skip_tests = kwargs.get("skip_tests", None)
+        wrap_tests = kwargs.get("wrap_tests", False)
+        durations = kwargs.get("durations", None)
+        parallel_suites = kwargs.get("parallel_suites", False)
+
+        if not all(sut.parallel_execution for sut in self._suts):
+            self._logger.info(
+                "SUT doesn't support parallel execution. "
+                "Forcing workers=1.")
+            workers = 1
+            adaptive_workers = False
+
+        limits = [sut.max_workers for sut in self._suts if sut.max_workers]
+        if limits and not adaptive_workers and workers > min(limits):
+            self._logger.info(
+                "SUT can't execute more than %d commands in parallel. "
+                "Forcing workers=%d.", min(limits), min(limits))
+            workers = min(limits)
+
+        if adaptive_workers:
+            workers = 1
 
         self._scheduler = SuiteScheduler(
             sut=self._sut,
+            suts=self._suts,
             framework=self._framework,
             suite_timeout=suite_timeout,
             exec_timeout=self._exec_timeout,
             max_workers=workers,
             skip_tests=skip_tests,
-            force_parallel=force_parallel)
+            force_parallel=force_parallel,
+            wrap_tests=wrap_tests,
+            durations=durations,
+            adaptive_workers=adaptive_workers,
+            parallel_suites=parallel_suites)
 
         self._curr_suite = ''
+        self._tests_suite = {}
         self._setup_debug_log()
         self._setup_test_save()
 
-        if not self._sut.parallel_execution:
-            self._logger.info(
-                "SUT doesn't support parallel execution. "
-                "Forcing workers=1.")
-            self._workers = 1
-
     def _setup_debug_log(self) -> None:
         """
         Set logging module so we save a log file with debugging information
@@ -131,10 +171,16 @@ class Session:
         async def save_suite_started(suite: libkirk.data.Suite) -> None:
             self._curr_suite = suite.name
 
+            # suites might run at the same time
+            for test in suite.tests:
+                self._tests_suite[test] = suite.name
+
         async def save_test_file(results: TestResults) -> None:
+            suite = self._tests_suite.get(results.test, self._curr_suite)
+
             epath = os.path.join(self._tmpdir.abspath, 'executed')
             with open(epath, 'a+', encoding='utf-8') as efile:
-                efile.write(f"{self._curr_suite}::{results.test.name}\n")
+                efile.write(f"{suite}::{results.test.name}\n")
 
         libkirk.events.register("suite_started", save_suite_started)
         libkirk.events.register("test_completed", save_test_file)
@@ -168,23 +214,41 @@ class Session:
 
         return data
 
-    async def _start_sut(self) -> None:
+    @staticmethod
+    async def _start_single_sut(sut: SUT) -> None:
         """
-        Start communicating with SUT.
+        Start communicating with a single SUT.
         """
-        await libkirk.events.fire("sut_start", self._sut.name)
-        await self._sut.ensure_communicate(
-            iobuffer=RedirectSUTStdout(self._sut, False))
+        await libkirk.events.fire("sut_start", sut.name)
+        await sut.ensure_communicate(
+            iobuffer=RedirectSUTStdout(sut, False))
 
-    async def _stop_sut(self) -> None:
+    @staticmethod
+    async def _stop_single_sut(sut: SUT) -> None:
         """
-        Stop the SUT.
+        Stop a single SUT.
         """
-        if not await self._sut.is_running:
+        if not await sut.is_running:
             return
 
-        await libkirk.events.fire("sut_stop", self._sut.name)
-        await self._sut.stop(iobuffer=RedirectSUTStdout(self._sut, False))
+        await libkirk.events.fire("sut_stop", sut.name)
+        await sut.stop(iobuffer=RedirectSUTStdout(sut, False))
+
+    async def _start_sut(self) -> None:
+        """
+        Start communicating with all SUTs.
+        """
+        await asyncio.gather(*[
+            self._start_single_sut(sut) for sut in self._suts
+        ])
+
+    async def _stop_sut(self) -> None:
+        """
+        Stop all SUTs.
+        """
+        await asyncio.gather(*[
+            self._stop_single_sut(sut) for sut in self._suts
+        ])
 
     async def _read_suites(self, suites: list, restore: str) -> list:
         """
@@ -228,25 +292,26 @@ class Session:
 
     async def _exec_command(self, command: str) -> None:
         """
-        Execute a single command on SUT.
+        Execute a single command on all SUTs.
         """
         async with self._exec_lock:
             exc = None
             try:
-                await libkirk.events.fire("run_cmd_start", command)
-
-                ret = await asyncio.wait_for(
-                    self._sut.run_command(
+                for sut in self._suts:
+                    await libkirk.events.fire("run_cmd_start", command)
+
+                    ret = await asyncio.wait_for(
+                        sut.run_command(
+                            command,
+                            iobuffer=RedirectSUTStdout(sut, True)),
+                        timeout=self._exec_timeout
+                    )
+
+                    await libkirk.events.fire(
+                        "run_cmd_stop",
                         command,
-                        iobuffer=RedirectSUTStdout(self._sut, True)),
-                    timeout=self._exec_timeout
-                )
-
-                await libkirk.events.fire(
-                    "run_cmd_stop",
-                    command,
-                    ret["stdout"],
-                    ret["returncode"])
+                        ret["stdout"],
+                        ret["returncode"])
             except asyncio.TimeoutError:
                 exc = KirkException(f"Command timeout: {repr(command)}")
             except KirkException as err:
@@ -5,6 +5,7 @@
 
 .. moduleauthor:: Andrea Cervesato <andrea.cervesato@suse.com>
 """
+import os
 import time
 import asyncio
 import logging
@@ -13,6 +14,7 @@ import contextlib
 from libkirk.sut import SUT
 from libkirk.sut import SUTError
 from libkirk.sut import IOBuffer
+from libkirk.sut import RemoteShell
 from libkirk.sut import KernelPanicError
 
 try:
@@ -22,11 +24,292 @@ except ModuleNotFoundError:
     pass
 
 
+class SSHConnectionPool:
+    """
+    Pool of SSH connections towards the same host. Connections are opened
+    lazily when all the opened ones are busy, sessions are assigned to the
+    less loaded connection and broken connections are replaced in
+    background. Sessions which are reserved but idle can be reclaimed when
+    all sessions are in use. One session is kept for control sessions, so
+    they never wait for running commands to complete.
+    """
+
+    def __init__(
+            self,
+            connect: callable,
+            size: int = 1,
+            max_sessions: int = 10,
+            reclaim: callable = None) -> None:
+        """
+        :param connect: coroutine function opening a new SSH connection
+        :type connect: callable
+        :param size: maximum number of connections
+        :type size: int
+        :param max_sessions: maximum number of sessions per connection
+        :type max_sessions: int
+        :param reclaim: function called when all sessions are reserved. It
+            frees an idle session, returning its connection, or it returns
+            None when there are no idle sessions
+        :type reclaim: callable
+        """
+        self._logger = logging.getLogger("kirk.ssh.pool")
+        self._connect = connect
+        self._reclaim = reclaim
+        self._size = max(size, 1)
+        self._max_sessions = max(max_sessions, 1)
+        self._load = {}
+        self._commands = 0
+        self._connecting = 0
+        self._error = None
+        self._closing = False
+        self._tasks = set()
+        self._cond = asyncio.Condition()
+
+    @property
+    def connections(self) -> list:
+        """
+        Opened connections.
+        """
+        return list(self._load.keys())
+
+    @property
+    def max_sessions(self) -> int:
+        """
+        Maximum number of sessions per connection.
+        """
+        return self._max_sessions
+
+    @max_sessions.setter
+    def max_sessions(self, value: int) -> None:
+        """
+        Set maximum number of sessions per connection.
+        """
+        self._max_sessions = max(value, 1)
+
+    def _create_task(self, coro) -> None:
+        """
+        Run a coroutine in background.
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _open(self) -> None:
+        """
+        Open a new connection and add it to the pool.
+        """
+        conn = None
+        try:
+            conn = await self._connect()
+        except (OSError, asyncssh.Error) as err:
+            self._logger.warning("Can't open SSH connection: %s", err)
+            self._error = err
+
+        async with self._cond:
+            self._connecting -= 1
+
+            if conn:
+                if self._closing:
+                    conn.close()
+                else:
+                    self._load[conn] = 0
+                    self._create_task(self._watch(conn))
+
+                    self._logger.info(
+                        "Opened SSH connection (%d/%d)",
+                        len(self._load),
+                        self._size)
+
+            self._cond.notify_all()
+
+    async def _watch(self, conn) -> None:
+        """
+        Wait for a connection to be closed and replace it.
+        """
+        await conn.wait_closed()
+
+        async with self._cond:
+            if self._closing:
+                return
+
+            self._logger.info("SSH connection has been closed")
+
+            self._load.pop(conn, None)
+
+            if self._connecting == 0:
+                self._connecting += 1
+                self._create_task(self._open())
+
+            self._cond.notify_all()
+
+    async def open(self) -> None:
+        """
+        Open the first connection of the pool. Errors are raised, so we
+        can recognize wrong configurations.
+        """
+        self._closing = False
+        self._error = None
+
+        conn = await self._connect()
+
+        async with self._cond:
+            self._load[conn] = 0
+            self._create_task(self._watch(conn))
+
+    @property
+    def saturated(self) -> bool:
+        """
+        True if a new session can't be reserved without waiting for
+        another one to be released.
+        """
+        if len(self._load) + self._connecting < self._size:
+            return False
+
+        return all(
+            load >= self._max_sessions
+            for load in self._load.values())
+
+    @property
+    def _commands_full(self) -> bool:
+        """
+        True if commands sessions can't be reserved, because the last free
+        session is kept for control sessions.
+        """
+        sessions = self._size * self._max_sessions
+        return sessions > 1 and self._commands >= sessions - 1
+
+    async def acquire(self, control: bool = False):
+        """
+        Reserve a session of the less loaded connection and return the
+        connection, opening a new one when all the others are busy.
+        :param control: if True, session is used for control traffic, such
+            as ping and files transfer, and it can take the session which
+            is kept free for it
+        :type control: bool
+        """
+        async with self._cond:
+            while True:
+                if self._closing:
+                    raise SUTError("SSH connections have been closed")
+
+                full = not control and self._commands_full
+
+                conn = None
+                if self._load and not full:
+                    conn = min(self._load, key=self._load.get)
+                    if self._load[conn] >= self._max_sessions:
+                        conn = None
+
+                busy = conn is None or self._load[conn] > 0
+                if busy and not full and \
+                        len(self._load) + self._connecting < self._size:
+                    self._connecting += 1
+                    self._create_task(self._open())
+
+                if conn is not None:
+                    self._load[conn] += 1
+                    if not control:
+                        self._commands += 1
+
+                    return conn
+
+                if not self._load and not self._connecting and self._error:
+                    raise SUTError(self._error)
+
+                if self._reclaim and (full or self.saturated):
+                    reclaimed = self._reclaim()
+                    if reclaimed is not None:
+                        if reclaimed in self._load:
+                            self._load[reclaimed] -= 1
+
+                        self._commands -= 1
+                        continue
+
+                await self._cond.wait()
+
+    async def release(self, conn, control: bool = False) -> None:
+        """
+        Release a session of the given connection.
+        :param control: True if session has been reserved for control
+            traffic
+        :type control: bool
+        """
+        async with self._cond:
+            if conn in self._load:
+                self._load[conn] -= 1
+
+            if not control:
+                self._commands -= 1
+
+            self._cond.notify_all()
+
+    async def notify(self) -> None:
+        """
+        Wake up coroutines waiting for a session, so they can reclaim the
+        sessions which became idle.
+        """
+        async with self._cond:
+            self._cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def session(self, control: bool = False):
+        """
+        Reserve a session of the less loaded connection.
+        :param control: if True, session is used for control traffic
+        :type control: bool
+        """
+        conn = await self.acquire(control=control)
+        try:
+            yield conn
+        finally:
+            await self.release(conn, control=control)
+
+    async def close(self) -> None:
+        """
+        Close all connections.
+        """
+        async with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+
+        for task in list(self._tasks):
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        conns = list(self._load.keys())
+        self._load.clear()
+
+        for conn in conns:
+            conn.close()
+
+        await asyncio.gather(*[conn.wait_closed() for conn in conns])
+
+
+class SSHShell(RemoteShell):
+    """
+    Remote shell which is kept open to run multiple commands.
+    """
+
+    def __init__(self, conn, proc) -> None:
+        """
+        :param conn: SSH connection where shell is running
+        :type conn: SSHClientConnection
+        :param proc: shell process
+        :type proc: SSHClientProcess
+        """
+        super().__init__()
+
+        self.conn = conn
+        self.proc = proc
+
+
 # pylint: disable=too-many-instance-attributes
 class SSHSUT(SUT):
     """
     A SUT that is using SSH protocol con communicate and transfer data.
     """
+    BUFFSIZE = 64 * 1024
 
     def __init__(self) -> None:
         self._logger = logging.getLogger("kirk.ssh")
@@ -38,9 +321,12 @@ class SSHSUT(SUT):
         self._password = None
         self._key_file = None
         self._sudo = False
-        self._session_sem = None
+        self._connections = 1
+        self._persistent = False
+        self._shells = []
+        self._idle_shells = []
         self._stop = False
-        self._conn = None
+        self._pool = None
         self._downloader = None
         self._procs = []
 
@@ -59,6 +345,10 @@ class SSHSUT(SUT):
             "key_file": "private key location",
             "reset_command": "command to reset the remote SUT",
             "sudo": "use sudo to access to root shell (default: 0)",
+            "connections": "maximum number of SSH connections, which are "
+                           "opened when needed (default: 1)",
+            "persistent": "run commands inside remote shells which are kept "
+                          "open between commands (default: 0)",
         }
 
     async def _reset(self, iobuffer: IOBuffer = None) -> None:
@@ -140,48 +430,80 @@ class SSHSUT(SUT):
         except ValueError:
             raise SUTError("'sudo' must be 0 or 1")
 
+        try:
+            self._connections = int(kwargs.get("connections", "1"))
+
+            if self._connections < 1:
+                raise ValueError()
+        except ValueError:
+            raise SUTError("'connections' must be an integer greater than 0")
+
+        try:
+            self._persistent = int(kwargs.get("persistent", 0)) == 1
+        except ValueError:
+            raise SUTError("'persistent' must be 0 or 1")
+
     @property
     def parallel_execution(self) -> bool:
         return True
 
     @property
     async def is_running(self) -> bool:
-        return self._conn is not None
+        return self._pool is not None
+
+    async def _connect(self):
+        """
+        Open a new SSH connection.
+        """
+        if self._key_file:
+            priv_key = asyncssh.read_private_key(self._key_file)
+
+            return await asyncssh.connect(
+                host=self._host,
+                port=self._port,
+                username=self._user,
+                client_keys=[priv_key])
+
+        return await asyncssh.connect(
+            host=self._host,
+            port=self._port,
+            username=self._user,
+            password=self._password)
 
     async def communicate(self, iobuffer: IOBuffer = None) -> None:
         if await self.is_running:
             raise SUTError("SUT is already running")
 
+        pool = SSHConnectionPool(
+            self._connect,
+            size=self._connections,
+            reclaim=self._reclaim_shell)
+
         try:
-            self._conn = None
-            if self._key_file:
-                priv_key = asyncssh.read_private_key(self._key_file)
-
-                self._conn = await asyncssh.connect(
-                    host=self._host,
-                    port=self._port,
-                    username=self._user,
-                    client_keys=[priv_key])
-            else:
-                self._conn = await asyncssh.connect(
-                    host=self._host,
-                    port=self._port,
-                    username=self._user,
-                    password=self._password)
+            await pool.open()
 
             # read maximum number of sessions and limit `run_command`
-            # concurrent calls to that by using a semaphore
-            ret = await self._conn.run(
-                r'sed -n "s/^MaxSessions\s*\([[:digit:]]*\)/\1/p" '
-                '/etc/ssh/sshd_config')
+            # concurrent calls on each connection
+            async with pool.session() as conn:
+                ret = await conn.run(
+                    r'sed -n "s/^MaxSessions\s*\([[:digit:]]*\)/\1/p" '
+                    '/etc/ssh/sshd_config')
 
-            max_sessions = ret.stdout or 10
+            try:
+                pool.max_sessions = int(ret.stdout)
+            except (TypeError, ValueError):
+                pool.max_sessions = 10
 
-            self._logger.info("Maximum SSH sessions: %d", max_sessions)
-            self._session_sem = asyncio.Semaphore(max_sessions)
+            self._logger.info("Maximum SSH sessions: %d", pool.max_sessions)
+            self._pool = pool
         except asyncssh.misc.ChannelOpenError as err:
+            await pool.close()
+
             if not self._stop:
                 raise SUTError(err)
+        except BaseException:
+            await pool.close()
+            raise
 
     async def stop(self, iobuffer: IOBuffer = None) -> None:
         if not await self.is_running:
@@ -201,15 +523,151 @@ class SSHSUT(SUT):
             if self._downloader:
                 await self._downloader.close()
 
-            self._logger.info("Closing connection")
-            self._conn.close()
-            await self._conn.wait_closed()
-            self._logger.info("Connection closed")
+            for shell in list(self._shells):
+                await self._close_shell(shell)
+
+            self._logger.info("Closing connections")
+            await self._pool.close()
+            self._logger.info("Connections closed")
 
             await self._reset(iobuffer=iobuffer)
         finally:
             self._stop = False
-            self._conn = None
+            self._pool = None
+
+    def _reclaim_shell(self):
+        """
+        Close an idle shell when all sessions are reserved, so its session
+        can be used by someone else. Return the connection of the shell,
+        or None if there are no idle shells. Session is released by the
+        connections pool.
+        """
+        if not self._idle_shells:
+            return None
+
+        shell = self._idle_shells.pop(0)
+        self._shells.remove(shell)
+
+        shell.proc.close()
+
+        self._logger.info("Reclaimed remote shell (%d)", len(self._shells))
+
+        return shell.conn
+
+    async def _open_shell(self) -> SSHShell:
+        """
+        Open a new remote shell.
+        """
+        conn = await self._pool.acquire()
+        try:
+            proc = await conn.create_process(
+                "sudo /bin/sh" if self._sudo else "/bin/sh",
+                stderr=asyncssh.DEVNULL)
+        except BaseException:
+            await self._pool.release(conn)
+            raise
+
+        shell = SSHShell(conn, proc)
+        self._shells.append(shell)
+
+        self._logger.info("Opened remote shell (%d)", len(self._shells))
+
+        return shell
+
+    async def _close_shell(self, shell: SSHShell) -> None:
+        """
+        Close a remote shell and release its session.
+        """
+        if shell not in self._shells:
+            return
+
+        self._shells.remove(shell)
+        if shell in self._idle_shells:
+            self._idle_shells.remove(shell)
+
+        shell.proc.close()
+        await self._pool.release(shell.conn)
+
+        self._logger.info("Closed remote shell (%d)", len(self._shells))
+
+    async def _run_in_shell(
+            self,
+            shell: SSHShell,
+            command: str,
+            cwd: str,
+            env: dict,
+            iobuffer: IOBuffer) -> tuple:
+        """
+        Run a command inside a remote shell and return its stdout and
+        return code. Return code is None if shell ended before command
+        completed.
+        """
+        shell.proc.stdin.write(shell.create_script(command, cwd, env))
+
+        return await shell.read_output(
+            lambda: shell.proc.stdout.read(self.BUFFSIZE),
+            iobuffer)
+
+    async def _run_command_shell(
+            self,
+            command: str,
+            cwd: str = None,
+            env: dict = None,
+            iobuffer: IOBuffer = None) -> dict:
+        """
+        Run a command inside a persistent remote shell.
+        """
+        if self._idle_shells:
+            shell = self._idle_shells.pop()
+        else:
+            shell = await self._open_shell()
+
+        self._logger.info("Running command: %s", repr(command))
+
+        start_t = time.time()
+        retcode = None
+
+        self._procs.append(shell.proc)
+        try:
+            stdout, retcode = await self._run_in_shell(
+                shell, command, cwd, env, iobuffer)
+        finally:
+            self._procs.remove(shell.proc)
+
+            if retcode is None:
+                await self._close_shell(shell)
+            else:
+                self._idle_shells.append(shell)
+
+                # someone might be waiting for the session of this shell
+                await self._pool.notify()
+
+        if retcode is None:
+            if not self._stop:
+                raise SUTError(
+                    "Remote shell has been closed before command "
+                    "completion")
+
+            retcode = shell.proc.returncode
+        elif retcode == -1:
+            raise SUTError(
+                f"Can't setup current working directory {cwd} "
+                f"or environment {env}: {stdout}")
+
+        ret = {
+            "command": command,
+            "returncode": retcode,
+            "exec_time": time.time() - start_t,
+            "stdout": stdout
+        }
+
+        if "Kernel panic" in stdout:
+            raise KernelPanicError()
+
+        self._logger.info("Command executed")
+        self._logger.debug(ret)
+
+        return ret
 
     async def ping(self) -> float:
         if not await self.is_running:
@@ -220,7 +678,8 @@ class SSHSUT(SUT):
         self._logger.info("Ping %s:%d", self._host, self._port)
 
         try:
-            await self._conn.run("test .", check=True)
+            async with self._pool.session(control=True) as conn:
+                await conn.run("test .", check=True)
         except asyncssh.Error as err:
             raise SUTError(err)
 
@@ -242,7 +701,14 @@ class SSHSUT(SUT):
         if not await self.is_running:
             raise SUTError("SSH connection is not present")
 
-        async with self._session_sem:
+        if self._persistent:
+            return await self._run_command_shell(
+                command,
+                cwd=cwd,
+                env=env,
+                iobuffer=iobuffer)
+
+        async with self._pool.session() as conn:
             cmd = self._create_command(command, cwd, env)
             ret = None
             proc = None
@@ -251,7 +717,7 @@ class SSHSUT(SUT):
             try:
                 self._logger.info("Running command: %s", repr(command))
 
-                proc = await self._conn.create_process(cmd)
+                proc = await conn.create_process(cmd)
                 self._procs.append(proc)
 
                 start_t = time.time()
@@ -295,16 +761,96 @@ class SSHSUT(SUT):
         if not await self.is_running:
             raise SUTError("SSH connection is not present")
 
+        self._logger.info("Downloading %s", target_path)
+
         data = None
         try:
-            ret = await self._conn.run(
-                f"cat {target_path}",
-                check=True,
-                encoding=None)
-
-            data = ret.stdout
+            async with self._pool.session(control=True) as conn:
+                async with conn.start_sftp_client() as sftp:
+                    async with sftp.open(target_path, "rb") as ftarget:
+                        # blocks are read using parallel requests
+                        data = await ftarget.read()
+
+                        if not data:
+                            # files such as the ones inside /proc have
+                            # zero size, so they are read until EOF
+                            chunks = []
+                            while True:
+                                chunk = await ftarget.read(self.BUFFSIZE)
+                                if not chunk:
+                                    break
+
+                                chunks.append(chunk)
+
+                            data = b"".join(chunks)
         except asyncssh.Error as err:
             if not self._stop:
                 raise SUTError(err)
 
+        self._logger.info("File downloaded")
+
         return data
+
+    async def get_file(self, target_path: str, local_path: str) -> None:
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not await self.is_running:
+            raise SUTError("SSH connection is not present")
+
+        self._logger.info("Downloading %s to %s", target_path, local_path)
+
+        try:
+            async with self._pool.session(control=True) as conn:
+                async with conn.start_sftp_client() as sftp:
+                    await sftp.get(target_path, local_path)
+        except asyncssh.Error as err:
+            if not self._stop:
+                raise SUTError(err)
+        except OSError as err:
+            raise SUTError(err)
+
+        if not self._stop and os.path.getsize(local_path) == 0:
+            # files with zero size might still have data (i.e. /proc)
+            await super().get_file(target_path, local_path)
+
+        self._logger.info("File downloaded")
+
+    async def put_file(self, local_path: str, target_path: str) -> None:
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        if not target_path:
+            raise ValueError("target path is empty")
+
+        if not os.path.isfile(local_path):
+            raise SUTError(f"'{local_path}' file doesn't exist")
+
+        if not await self.is_running:
+            raise SUTError("SSH connection is not present")
+
+        self._logger.info("Uploading %s to %s", local_path, target_path)
+
+        start_t = time.time()
+
+        try:
+            async with self._pool.session(control=True) as conn:
+                async with conn.start_sftp_client() as sftp:
+                    # blocks are written using parallel requests
+                    await sftp.put(local_path, target_path)
+        except asyncssh.Error as err:
+            if not self._stop:
+                raise SUTError(err)
+        except OSError as err:
+            raise SUTError(err)
+
+        size = os.path.getsize(local_path)
+        exec_time = max(time.time() - start_t, 1e-6)
+
+        self._logger.info(
+            "File uploaded (%d bytes, %.2f MB/s)",
+            size,
+            size / exec_time / (1024 * 1024))
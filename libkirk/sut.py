@@ -6,7 +6,9 @@
 .. moduleauthor:: Andrea Cervesato <andrea.cervesato@suse.com>
 """
 import re
+import typing
 import asyncio
+import secrets
 from libkirk import KirkException
 from libkirk.plugin import Plugin
 
@@ -35,6 +37,168 @@ class IOBuffer:
         raise NotImplementedError()
 
 
+class TrailerFilter(IOBuffer):
+    """
+    Forward data to an other buffer until marker is found. Everything
+    following the marker is a trailer that is never forwarded, such as the
+    command status printed after a command by wrapped tests execution or
+    by remote shells. Data which might be the begin of the marker is held
+    back until it's known whether it belongs to the marker or not.
+    """
+
+    def __init__(self, iobuffer: IOBuffer, marker: str) -> None:
+        self._iobuffer = iobuffer
+        self._marker = marker
+        self._pending = ""
+        self._found = False
+
+    async def write(self, data: str) -> None:
+        if self._found:
+            return
+
+        data = self._pending + data
+        self._pending = ""
+
+        pos = data.find(self._marker)
+        if pos != -1:
+            self._found = True
+            data = data[:pos]
+        else:
+            # keep the tail of data which might be the begin of the trailer
+            for size in range(min(len(self._marker) - 1, len(data)), 0, -1):
+                if self._marker.startswith(data[-size:]):
+                    self._pending = data[-size:]
+                    data = data[:-size]
+                    break
+
+        if data:
+            await self._iobuffer.write(data)
+
+    async def flush(self) -> None:
+        """
+        Write data that has been held back, if trailer has not been found.
+        """
+        if self._pending and not self._found:
+            await self._iobuffer.write(self._pending)
+
+        self._pending = ""
+
+
+class RemoteShell:
+    """
+    Shell which is kept open to run multiple commands, reading them from
+    its input. Each command is followed by a trailer containing a marker
+    and the command return code. Current working directory and environment
+    are cached, so they are sent only when they change.
+    """
+
+    def __init__(self) -> None:
+        self.cwd = None
+        self.env = {}
+        self.marker = f"kirk-{secrets.token_hex(8)}"
+        self._state_known = True
+
+    def create_script(self, command: str, cwd: str, env: dict) -> str:
+        """
+        Create the script running command inside the shell. The script
+        prints a trailer with the command return code at the end, or -1
+        if current working directory or environment can't be set.
+        """
+        env = env or {}
+        setup = []
+
+        known = self._state_known
+
+        if not known or cwd != self.cwd:
+            setup.append(f"cd {cwd}" if cwd else "cd")
+
+        for key in self.env:
+            if key not in env:
+                setup.append(f"unset {key}")
+
+        for key, value in env.items():
+            if not known or self.env.get(key) != value:
+                setup.append(f"export {key}={value}")
+
+        self.cwd = cwd
+        self.env = dict(env)
+        self._state_known = True
+
+        # command runs inside a subshell, so it can't change shell state
+        # or read the next commands from the shell input
+        script = [
+            f"(\n{command}\n) </dev/null",
+            f"printf '\\n%s %d\\n' {self.marker} $?",
+        ]
+
+        if setup:
+            script = [f"if {' && '.join(setup)}; then"] + script + [
+                "else",
+                f"printf '\\n%s %d\\n' {self.marker} -1",
+                "fi",
+            ]
+
+        return "\n".join(script) + "\n"
+
+    async def read_output(
+            self,
+            read: typing.Callable[[], typing.Awaitable[str]],
+            iobuffer: IOBuffer = None) -> tuple:
+        """
+        Read the command output using the read coroutine, until the
+        trailer is found. Only new data is scanned, together with an
+        overlap window containing the trailer.
+        :param read: coroutine returning the next data, or an empty string
+            when shell has been closed
+        :type read: coroutine
+        :param iobuffer: buffer receiving the command output
+        :type iobuffer: IOBuffer
+        :returns: set(stdout, retcode). Return code is None if shell has
+            been closed before command completion.
+        """
+        pattern = re.compile(f"\n{self.marker} (-?\\d+)\n")
+        overlap = len(self.marker) + 32
+        trailer = TrailerFilter(iobuffer, f"\n{self.marker} ") \
+            if iobuffer else None
+
+        chunks = []
+        length = 0
+        tail = ""
+        match = None
+
+        while not match:
+            data = await read()
+            if not data:
+                break
+
+            if trailer:
+                await trailer.write(data)
+
+            chunks.append(data)
+
+            window = tail + data
+            offset = length - len(tail)
+            length += len(data)
+
+            match = pattern.search(window)
+
+            tail = window[-overlap:]
+
+        if trailer:
+            await trailer.flush()
+
+        stdout = "".join(chunks)
+        if not match:
+            return stdout, None
+
+        retcode = int(match.group(1))
+        if retcode == -1:
+            # shell state is unknown, so everything is sent again
+            self._state_known = False
+
+        return stdout[:offset + match.start()], retcode
+
+
 TAINED_MSG = [
     "proprietary module was loaded",
     "module was force loaded",
@@ -57,6 +221,25 @@ TAINED_MSG = [
 ]
 
 
+def tainted_messages(code: int) -> list:
+    """
+    Decode the /proc/sys/kernel/tainted value into a list of messages.
+    :param code: tainted value
+    :type code: int
+    :returns: list[str]
+    """
+    tainted_num = len(TAINED_MSG)
+    bits = format(code, f"0{tainted_num}b")[::-1]
+
+    messages = []
+    for i in range(0, tainted_num):
+        if bits[i] == "1":
+            msg = TAINED_MSG[i]
+            messages.append(msg)
+
+    return messages
+
+
 class SUT(Plugin):
     """
     SUT abstraction class. It could be a remote host, a local host, a virtual
@@ -70,6 +253,14 @@ class SUT(Plugin):
         """
         raise NotImplementedError()
 
+    @property
+    def max_workers(self) -> int:
+        """
+        Maximum number of commands which can be executed in parallel, or
+        None if there's no limit.
+        """
+        return None
+
     @property
     async def is_running(self) -> bool:
         """
@@ -126,6 +317,9 @@ class SUT(Plugin):
                 "exec_time": <float>,
             }
 
+            SUT can also add a "usage" dictionary, containing resources
+            used by the command (i.e. "cpu_usage" or "memory_peak").
+
             If None is returned, then callback failed.
         """
         raise NotImplementedError()
@@ -139,6 +333,38 @@ class SUT(Plugin):
         """
         raise NotImplementedError()
 
+    async def get_file(self, target_path: str, local_path: str) -> None:
+        """
+        Fetch file from target path and save it inside local path. SUT
+        implementations can override it in order to stream data, without
+        keeping the whole file in memory.
+        :param target_path: path of the file to download from target
+        :type target_path: str
+        :param local_path: path of the local file where data is saved
+        :type local_path: str
+        """
+        if not local_path:
+            raise ValueError("local path is empty")
+
+        data = await self.fetch_file(target_path)
+
+        try:
+            with open(local_path, "wb") as flocal:
+                flocal.write(data)
+        except IOError as err:
+            raise SUTError(err)
+
+    async def put_file(self, local_path: str, target_path: str) -> None:
+        """
+        Upload a local file to the target path. Data is streamed to target,
+        so large files are never loaded in memory at once.
+        :param local_path: path of the local file to upload
+        :type local_path: str
+        :param target_path: path of the file to write on target
+        :type target_path: str
+        """
+        raise NotImplementedError()
+
     async def ensure_communicate(
             self,
             iobuffer: IOBuffer = None,
@@ -164,6 +390,17 @@ class SUT(Plugin):
 
                 await self.stop(iobuffer=iobuffer)
 
+    async def restart(self, iobuffer: IOBuffer = None) -> None:
+        """
+        Restart the SUT, stopping the current session and communicating
+        again with it. SUT implementations can override this method when
+        they can restart faster than a full stop/communicate cycle.
+        :param iobuffer: buffer used to write SUT stdout
+        :type iobuffer: IOBuffer
+        """
+        await self.stop(iobuffer=iobuffer)
+        await self.ensure_communicate(iobuffer=iobuffer)
+
     async def get_info(self) -> dict:
         """
         Return SUT information.
@@ -252,15 +489,8 @@ class SUT(Plugin):
 
             stdout = ret["stdout"].rstrip()
 
-            tainted_num = len(TAINED_MSG)
             code = int(stdout.rstrip())
-            bits = format(code, f"0{tainted_num}b")[::-1]
-
-            messages = []
-            for i in range(0, tainted_num):
-                if bits[i] == "1":
-                    msg = TAINED_MSG[i]
-                    messages.append(msg)
+            messages = tainted_messages(code)
 
             if self._tainted_status.qsize() > 0:
                 await self._tainted_status.get()
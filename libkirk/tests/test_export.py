@@ -191,3 +191,45 @@ class TestJSONExporter:
                 "skipped": 0,
                 "warnings": 0,
             }
+
+    async def test_save_file_usage(self, tmpdir):
+        """
+        Test save_file method when tests resources usage is available.
+        """
+        test = Test(name="ls0", cmd="ls", resources=["device"])
+        usage = {
+            "cpu_usage": 0.5,
+            "cpu_user": 0.3,
+            "cpu_system": 0.2,
+            "memory_peak": 1024,
+        }
+
+        suite_res = [
+            SuiteResults(
+                suite=Suite("ls_suite0", [test]),
+                tests=[
+                    TestResults(
+                        test=test,
+                        passed=1,
+                        exec_time=1,
+                        stdout="",
+                        usage=usage,
+                    ),
+                ],
+                distro="openSUSE-Leap",
+                distro_ver="15.3",
+                kernel="5.17",
+                arch="x86_64",
+                cpu="x86_64",
+                swap="10 kB",
+                ram="1000 kB",
+                exec_time=1),
+        ]
+
+        output = tmpdir / "output.json"
+        await JSONExporter().save_file(suite_res, str(output))
+
+        with open(str(output), 'r') as json_data:
+            data = json.load(json_data)
+
+        assert data["results"][0]["test"]["usage"] == usage
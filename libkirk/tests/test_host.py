@@ -1,8 +1,14 @@
 """
 Unittests for host SUT implementations.
 """
+import os
+import asyncio
 import pytest
+from libkirk.sut import IOBuffer
+from libkirk.sut import SUTError
 from libkirk.host import HostSUT
+from libkirk.session import Session
+from libkirk.tempfile import TempDir
 from libkirk.tests.test_sut import _TestSUT
 from libkirk.tests.test_session import _TestSession
 
@@ -36,8 +42,175 @@ class TestHostSUT(_TestSUT):
     async def test_fetch_file_stop(self):
         pytest.skip(reason="Coroutines don't support I/O file handling")
 
+    @pytest.mark.parametrize("command, shell", [
+        ("echo ciao", False),
+        ("/bin/echo -n ciao", False),
+        ("echo $HOME", True),
+        ("echo ciao | cat", True),
+        ("cd /tmp", True),
+        ("A=1 env", True),
+        ("ls *", True),
+    ])
+    async def test_split_command(self, sut, command, shell):
+        """
+        Test that commands requiring a shell are recognised.
+        """
+        args = sut._split_command(command)
+        if shell:
+            assert args is None
+        else:
+            assert args == command.split()
+
+    @pytest.mark.parametrize("command, returncode, stdout", [
+        ("echo ciao", 0, "ciao\n"),
+        ("echo ciao | tr c C", 0, "Ciao\n"),
+        ("cd / && pwd", 0, "/\n"),
+        ("A=ciao env | grep ^A=", 0, "A=ciao\n"),
+        ("exit 3", 3, ""),
+        ("kirk_command_not_found", 127, ""),
+    ])
+    async def test_run_command_spawn(self, sut, command, returncode, stdout):
+        """
+        Test run_command with commands executed with and without shell.
+        """
+        await sut.communicate()
+
+        ret = await sut.run_command(command)
+        assert ret["returncode"] == returncode
+        assert ret["stdout"] == stdout
+
+    async def test_run_command_large_output(self, sut):
+        """
+        Test that large outputs are completely captured.
+        """
+        class Counter(IOBuffer):
+            """
+            Count written characters.
+            """
+
+            def __init__(self) -> None:
+                self.count = 0
+
+            async def write(self, data: str) -> None:
+                self.count += len(data)
+
+        iobuffer = Counter()
+        size = 4 * 1024 * 1024
+
+        await sut.communicate()
+
+        ret = await sut.run_command(
+            f"head -c {size} /dev/zero | tr '\\0' 'a'",
+            iobuffer=iobuffer)
+
+        assert ret["returncode"] == 0
+        assert len(ret["stdout"]) == size
+        assert iobuffer.count == size
+
+
+@pytest.fixture
+def cgroup_dir():
+    """
+    Path of a temporary cgroup v2 folder.
+    """
+    mount = None
+    with open("/proc/mounts", "r", encoding="utf-8") as fdata:
+        for line in fdata:
+            items = line.split()
+            if items[2] == "cgroup2":
+                mount = items[1]
+                break
+
+    if not mount or not os.access(mount, os.W_OK):
+        pytest.skip(reason="Writable cgroup v2 is not available")
+
+    path = os.path.join(mount, f"kirk-test-{os.getpid()}")
+
+    yield path
+
+    if os.path.isdir(path):
+        os.rmdir(path)
+
+
+class TestHostSUTCgroup:
+    """
+    Test HostSUT commands execution inside cgroups.
+    """
+
+    async def test_setup_cgroup_required(self):
+        """
+        Test that limits can't be set without cgroup.
+        """
+        sut = HostSUT()
+
+        with pytest.raises(SUTError):
+            sut.setup(memory_max="100M")
+
+    async def test_not_cgroup2(self, tmpdir):
+        """
+        Test that cgroup folder must belong to cgroup v2.
+        """
+        sut = HostSUT()
+        sut.setup(cgroup=str(tmpdir))
+
+        with pytest.raises(SUTError):
+            await sut.communicate()
+
+    async def test_run_command(self, cgroup_dir):
+        """
+        Test that commands are executed inside their own cgroup and that
+        their resources usage is reported.
+        """
+        sut = HostSUT()
+        sut.setup(cgroup=cgroup_dir)
+        await sut.communicate()
+
+        try:
+            # subprocesses created by a shell belong to the cgroup as well
+            ret = await sut.run_command("cat /proc/self/cgroup | cat")
+            assert ret["returncode"] == 0
+            assert os.path.basename(cgroup_dir) in ret["stdout"]
+
+            ret = await sut.run_command("cat /proc/self/cgroup")
+            assert ret["returncode"] == 0
+            assert os.path.basename(cgroup_dir) in ret["stdout"]
+
+            usage = ret["usage"]
+            assert usage["cpu_usage"] >= 0
+            assert usage["cpu_user"] >= 0
+            assert usage["cpu_system"] >= 0
+
+            # command cgroups are removed after execution
+            assert not [
+                name for name in os.listdir(cgroup_dir)
+                if name.startswith("cmd-")
+            ]
+        finally:
+            await sut.stop()
+
 
 class TestHostSession(_TestSession):
     """
     Test Session implementation.
     """
+
+    async def test_workers_limit(self, tmpdir, sut, dummy_framework):
+        """
+        Test that workers are limited by the SUT parallel commands.
+        """
+        class _LimitedHostSUT(HostSUT):
+            @property
+            def max_workers(self) -> int:
+                return 2
+
+        limited = _LimitedHostSUT()
+        limited.setup()
+
+        for suts, workers in [([sut], 8), ([limited], 2), ([sut, limited], 2)]:
+            session = Session(
+                tmpdir=TempDir(str(tmpdir)),
+                framework=dummy_framework,
+                suts=suts,
+                workers=8)
+
+            assert session._scheduler._max_workers == workers
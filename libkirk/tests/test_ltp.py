@@ -109,6 +109,7 @@ class TestLTPFramework:
                     "testcases",
                     "bin")
                 assert not test.parallelizable
+                assert not test.resources
                 assert "LTPROOT" in test.env
                 assert "TMPDIR" in test.env
                 assert "LTP_COLORIZE_OUTPUT" in test.env
@@ -124,6 +125,7 @@ class TestLTPFramework:
                 "testcases",
                 "bin")
             assert not test.parallelizable
+            assert not test.resources
             assert "LTPROOT" in test.env
             assert "TMPDIR" in test.env
             assert "LTP_COLORIZE_OUTPUT" in test.env
@@ -138,6 +140,36 @@ class TestLTPFramework:
         suite = await framework.find_suite(sut, "slow_suite")
         assert len(suite.tests) == 0
 
+    async def test_find_suite_resources(self, framework, sut, tmpdir):
+        """
+        Test that tests changing global state run serially, even when they
+        also declare resources.
+        """
+        runtest = tmpdir / "runtest" / "res_suite"
+        runtest.write(
+            "dev_test echo ciao\n"
+            "restore_test echo ciao\n"
+            "runtime_test echo ciao\n")
+
+        metadata = tmpdir / "metadata" / "ltp.json"
+        metadata.write(json.dumps({
+            "tests": {
+                "dev_test": {"needs_device": "1", "needs_root": "1"},
+                "restore_test": {"needs_device": "1", "save_restore": []},
+                "runtime_test": {"max_runtime": "10"},
+            }
+        }))
+
+        suite = await framework.find_suite(sut, "res_suite")
+        tests = {test.name: test for test in suite.tests}
+
+        assert tests["dev_test"].resources == ["root-global", "device"]
+        assert not tests["restore_test"].resources
+        assert not tests["runtime_test"].resources
+
+        for test in suite.tests:
+            assert not test.parallelizable
+
     async def test_read_result_passed(self, framework):
         """
         Test read_result method when test passes.
@@ -37,13 +37,17 @@ class TestLTX:
         os.mkfifo(stdin_path)
         os.mkfifo(stdout_path)
 
-        stdin = os.open(stdin_path, os.O_RDWR | os.O_NONBLOCK)
-        stdout = os.open(stdout_path, os.O_RDWR)
+        # LTX client uses non-blocking I/O, so the LTX process must have
+        # its own file descriptors
+        ltx_stdin = os.open(stdin_path, os.O_RDONLY | os.O_NONBLOCK)
+        stdin = os.open(stdin_path, os.O_WRONLY)
+        stdout = os.open(stdout_path, os.O_RDONLY | os.O_NONBLOCK)
+        ltx_stdout = os.open(stdout_path, os.O_WRONLY)
 
         proc = await asyncio.subprocess.create_subprocess_shell(
             TEST_LTX_BINARY,
-            stdin=stdin,
-            stdout=stdout)
+            stdin=ltx_stdin,
+            stdout=ltx_stdout)
 
         try:
             async with LTX(stdin, stdout) as handle:
@@ -51,6 +55,9 @@ class TestLTX:
         finally:
             proc.kill()
 
+            for fd in [ltx_stdin, stdin, stdout, ltx_stdout]:
+                os.close(fd)
+
     async def test_version(self, ltx):
         """
         Test version request.
@@ -59,6 +66,17 @@ class TestLTX:
         replies = await ltx.gather([req])
         assert replies[req][0] == "0.1"
 
+    async def test_future(self, ltx):
+        """
+        Test request future.
+        """
+        req = Requests.version()
+        await ltx.send([req])
+
+        reply = await asyncio.wait_for(req.future, timeout=5)
+        assert reply[0] == "0.1"
+        assert req.completed
+
     async def test_ping(self, ltx):
         """
         Test ping request.
@@ -151,6 +169,33 @@ class TestLTX:
 
         assert pfile.read_bytes() == data
 
+    async def test_set_file_local_path(self, ltx, tmp_path):
+        """
+        Test set_file request streaming a local file.
+        """
+        data = os.urandom(3 * Requests.set_file.CHUNK_SIZE + 7)
+        plocal = tmp_path / 'local.bin'
+        plocal.write_bytes(data)
+        pfile = tmp_path / 'file.bin'
+
+        req = Requests.set_file(str(pfile), local_path=str(plocal))
+        await ltx.gather([req, Requests.ping()])
+
+        assert pfile.read_bytes() == data
+
+    async def test_set_file_too_big(self, tmp_path):
+        """
+        Test set_file request when local file can't be announced by the
+        bin 32 header.
+        """
+        plocal = tmp_path / 'local.bin'
+        with open(plocal, 'wb') as flocal:
+            flocal.truncate(Requests.set_file.MAX_SIZE + 1)
+
+        with pytest.raises(ValueError):
+            Requests.set_file(str(tmp_path / 'file.bin'),
+                              local_path=str(plocal))
+
     async def test_get_file(self, ltx, tmp_path):
         """
         Test get_file request.
@@ -194,6 +239,24 @@ class TestLTX:
         assert reply[2] == 0
         assert reply[3] == "CIAO"
 
+    async def test_env_same_slot(self, ltx):
+        """
+        Test multiple env requests on the same slot.
+        """
+        requests = [
+            Requests.env(0, f"HELLO{i}", f"CIAO{i}")
+            for i in range(Requests.env.MAX_ENVS)
+        ]
+        exec_req = Requests.execute(0, "echo -n $HELLO0$HELLO15")
+        requests.append(exec_req)
+
+        replies = await ltx.gather(requests)
+
+        for i, req in enumerate(requests[:-1]):
+            assert replies[req] == (0, f"HELLO{i}", f"CIAO{i}")
+
+        assert replies[exec_req][3] == "CIAO0CIAO15"
+
     async def test_env_multiple(self, ltx):
         """
         Test env request.
@@ -304,6 +367,92 @@ class TestLTXSUT(_TestSUT):
     async def test_fetch_file_stop(self):
         pytest.skip(reason="LTX doesn't support stop for GET_FILE")
 
+    async def test_env_cwd_cache(self, sut, tmpdir):
+        """
+        Test that cwd and env are correctly applied when they change
+        between commands.
+        """
+        await sut.communicate()
+
+        path = str(tmpdir)
+        cmd = "echo -n $PWD:$HELLO"
+
+        ret = await sut.run_command(cmd, cwd=path, env=dict(HELLO="a"))
+        assert ret["stdout"] == f"{path}:a"
+
+        ret = await sut.run_command(cmd, cwd="/tmp", env=dict(HELLO="b"))
+        assert ret["stdout"] == "/tmp:b"
+
+        ret = await sut.run_command(cmd, cwd=path, env=dict(HELLO="a"))
+        assert ret["stdout"] == f"{path}:a"
+
+        rets = await asyncio.gather(*[
+            sut.run_command(cmd, cwd=path, env=dict(HELLO=str(i % 2)))
+            for i in range(10)
+        ])
+
+        for i, ret in enumerate(rets):
+            assert ret["stdout"] == f"{path}:{i % 2}"
+
+    async def test_env_slot_isolation(self, sut):
+        """
+        Test that env of a command is not applied to other slots.
+        """
+        await sut.communicate()
+
+        cmd = "sleep 0.2; echo -n $KIRK_ISOLATION"
+
+        rets = await asyncio.gather(
+            sut.run_command(cmd, env=dict(KIRK_ISOLATION="a")),
+            sut.run_command(cmd),
+        )
+
+        assert rets[0]["stdout"] == "a"
+        assert rets[1]["stdout"] == ""
+
+    async def test_put_file_interleave(self, sut, tmpdir, monkeypatch):
+        """
+        Test that requests can be sent while a large file is uploaded.
+        """
+        monkeypatch.setattr(Requests.set_file, "CHUNK_SIZE", 1024)
+
+        await sut.communicate()
+
+        local_file = str(tmpdir / "local_file")
+        target_file = str(tmpdir / "target_file")
+
+        data = os.urandom(16 * 1024 + 3)
+        with open(local_file, "wb") as flocal:
+            flocal.write(data)
+
+        sent = []
+        uploading = asyncio.Event()
+        send = sut._ltx.send
+
+        async def _send(requests):
+            for req in requests:
+                sent.append(req.TYPE)
+                if req.TYPE == Requests.set_file.TYPE:
+                    uploading.set()
+
+            await send(requests)
+
+        monkeypatch.setattr(sut._ltx, "send", _send)
+
+        task = asyncio.create_task(sut.put_file(local_file, target_file))
+
+        await uploading.wait()
+        await sut.ping()
+        await task
+
+        pos = sent.index(Requests.ping.TYPE)
+        assert Requests.set_file.TYPE in sent[pos:]
+
+        with open(target_file, "rb") as ftarget:
+            assert ftarget.read() == data
+
+        assert not os.path.exists(f"{target_file}.part")
+
 
 class TestLTXSession(_TestSession):
     """
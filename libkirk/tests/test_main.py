@@ -314,6 +314,150 @@ class TestMain:
         assert excinfo.value.code == libkirk.main.RC_OK
         self.read_report(temp, 2)
 
+    def test_sut_pool(self, tmpdir):
+        """
+        Test --sut option when it's used multiple times.
+        """
+        temp = tmpdir.mkdir("temp")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01", "environ",
+            "--sut", "host",
+            "--sut", "host",
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        self.read_report(temp, 3)
+
+    def test_parallel_suites(self, tmpdir):
+        """
+        Test --parallel-suites option.
+        """
+        temp = tmpdir.mkdir("temp")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01", "environ",
+            "--workers", str(os.cpu_count()),
+            "--parallel-suites",
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        self.read_report(temp, 3)
+
+    def test_wrap_tests(self, tmpdir):
+        """
+        Test --wrap-tests option.
+        """
+        temp = tmpdir.mkdir("temp")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01",
+            "--wrap-tests"
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        report_d = self.read_report(temp, 2)
+        for test in report_d["results"]:
+            assert test["test"]["log"] == "ciao0"
+
+    def test_durations(self, tmpdir):
+        """
+        Test --durations option.
+        """
+        temp = tmpdir.mkdir("temp")
+        report = str(tmpdir / "report.json")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01",
+            "--json-report", report
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        temp = tmpdir.mkdir("temp2")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01",
+            "--durations", report
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        self.read_report(temp, 2)
+
+    def test_durations_not_exist(self, tmpdir):
+        """
+        Test --durations option when JSON report doesn't exist.
+        """
+        temp = tmpdir.mkdir("temp")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01",
+            "--durations", str(tmpdir / "this_file_doesnt_exist.json")
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == 2
+
+    def test_workers_auto(self, tmpdir):
+        """
+        Test --workers option when number of workers is adaptive.
+        """
+        temp = tmpdir.mkdir("temp")
+        cmd_args = [
+            "--tmp-dir", str(temp),
+            "--framework", "dummy",
+            "--run-suite", "suite01", "environ",
+            "--workers", "auto",
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == libkirk.main.RC_OK
+
+        self.read_report(temp, 3)
+
+    def test_workers_wrong(self):
+        """
+        Test --workers option with a wrong value.
+        """
+        cmd_args = [
+            "--run-command", "ls",
+            "--workers", "many",
+        ]
+
+        with pytest.raises(SystemExit) as excinfo:
+            libkirk.main.run(cmd_args=cmd_args)
+
+        assert excinfo.value.code == 2
+
     def test_sut_help(self):
         """
         Test "--sut help" command and check if SUT class(es) are loaded.
@@ -2,8 +2,11 @@
 Test SUT implementations.
 """
 import os
+import time
+import asyncio
 import pytest
 from libkirk.qemu import QemuSUT
+from libkirk.sut import SUTError
 from libkirk.sut import KernelPanicError
 from libkirk.tests.test_sut import _TestSUT
 from libkirk.tests.test_sut import Printer
@@ -16,6 +19,7 @@ TEST_QEMU_USERNAME = os.environ.get("TEST_QEMU_USERNAME", None)
 TEST_QEMU_PASSWORD = os.environ.get("TEST_QEMU_PASSWORD", None)
 TEST_QEMU_KERNEL = os.environ.get("TEST_QEMU_KERNEL", None)
 TEST_QEMU_BUSYBOX = os.environ.get("TEST_QEMU_BUSYBOX", None)
+TEST_QEMU_LTX = os.environ.get("TEST_QEMU_LTX", None)
 
 if not TEST_QEMU_IMAGE:
     pytestmark.append(pytest.mark.skip(
@@ -51,9 +55,98 @@ class _TestQemuSUT(_TestSUT):
                 "cat /tmp/panic.txt",
                 iobuffer=iobuff)
 
+    async def test_kernel_panic_console(self, sut):
+        """
+        Test kernel panic recognition when message is printed on console
+        and not on command stdout.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        with pytest.raises(KernelPanicError):
+            await asyncio.wait_for(
+                sut.run_command(
+                    "echo 'Kernel panic' > /dev/console; sleep 30"),
+                20)
+
+    async def test_console_concurrency(self, sut):
+        """
+        Test that console is used by one command at time when commands
+        are executed together.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        await asyncio.gather(
+            *[sut.ping() for _ in range(10)],
+            *[sut.fetch_file("/proc/version") for _ in range(10)],
+            *[sut.run_command("echo ciao") for _ in range(10)])
+
     async def test_fetch_file_stop(self):
         pytest.skip(reason="Coroutines don't support I/O file handling")
 
+    async def test_fetch_file_not_exist(self, sut):
+        """
+        Test fetch_file on a file which doesn't exist.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        with pytest.raises(SUTError):
+            await sut.fetch_file("/tmp/kirk_file_not_exist")
+
+    async def test_fetch_file_frames(self, sut):
+        """
+        Test that consecutive fetch_file calls read their own data.
+        """
+        await sut.communicate(iobuffer=Printer())
+        await sut.run_command("head -c 1048576 /dev/urandom > /tmp/random")
+
+        data = await sut.fetch_file("/tmp/random")
+        assert len(data) == 1048576
+
+        for _ in range(3):
+            assert await sut.fetch_file("/tmp/random") == data
+            assert await sut.fetch_file("/proc/version")
+
+    async def test_fetch_file_newlines(self, sut):
+        """
+        Test that fetch_file doesn't alter newlines inside data.
+        """
+        await sut.communicate(iobuffer=Printer())
+        await sut.run_command("seq 1 10000 > /tmp/lines")
+
+        data = await sut.fetch_file("/tmp/lines")
+        assert data == "".join(f"{i}\n" for i in range(1, 10001)).encode()
+
+    async def test_env_cwd_cache(self, sut):
+        """
+        Test that cwd and env are correctly applied when they change
+        between commands, and that cwd is set again when a command
+        changes it inside the console shell.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        cmd = "echo -n $PWD:$HELLO"
+
+        ret = await sut.run_command(cmd, cwd="/tmp", env=dict(HELLO="a"))
+        assert ret["stdout"] == "/tmp:a"
+
+        ret = await sut.run_command("cd /", cwd="/tmp")
+        assert ret["returncode"] == 0
+
+        ret = await sut.run_command(cmd)
+        assert ret["stdout"] == "/:a"
+
+        ret = await sut.run_command(cmd, cwd="/tmp", env=dict(HELLO="a"))
+        assert ret["stdout"] == "/tmp:a"
+
+        ret = await sut.run_command(cmd, cwd="/", env=dict(HELLO="b"))
+        assert ret["stdout"] == "/:b"
+
+        with pytest.raises(SUTError):
+            await sut.run_command(cmd, cwd="/tmp/kirk_dir_not_exist")
+
+        ret = await sut.run_command(cmd, cwd="/tmp", env=dict(HELLO="a"))
+        assert ret["stdout"] == "/tmp:a"
+
 
 @pytest.fixture
 async def sut_isa(tmpdir):
@@ -115,6 +208,235 @@ class TestQemuSUTVirtIO(_TestQemuSUT):
         yield sut_virtio
 
 
+class TestQemuSUTSnapshot(_TestQemuSUT):
+    """
+    Test QemuSUT implementation restoring a snapshot on restart.
+    """
+
+    @pytest.fixture
+    async def sut(self, tmpdir):
+        runner = QemuSUT()
+        runner.setup(
+            tmpdir=str(tmpdir),
+            image=TEST_QEMU_IMAGE,
+            user=TEST_QEMU_USERNAME,
+            password=TEST_QEMU_PASSWORD,
+            snapshot="1")
+
+        yield runner
+
+        if await runner.is_running:
+            await runner.stop()
+
+    async def test_snapshot_restore(self, sut):
+        """
+        Test that restart restores the snapshot taken after login.
+        """
+        iobuff = Printer()
+
+        await sut.communicate(iobuffer=iobuff)
+        ret = await sut.run_command(
+            "touch /tmp/kirk_snapshot",
+            iobuffer=iobuff)
+        assert ret["returncode"] == 0
+
+        await sut.stop(iobuffer=iobuff)
+        await sut.communicate(iobuffer=iobuff)
+
+        ret = await sut.run_command(
+            "test -f /tmp/kirk_snapshot",
+            iobuffer=iobuff)
+        assert ret["returncode"] == 1
+
+        ret = await sut.run_command("echo ciao", iobuffer=iobuff)
+        assert ret["returncode"] == 0
+        assert ret["stdout"] == "ciao\n"
+
+    async def test_snapshot_virtfs(self, tmpdir):
+        """
+        Test that snapshot can't be used together with virtfs.
+        """
+        with pytest.raises(SUTError):
+            QemuSUT().setup(
+                tmpdir=str(tmpdir),
+                image=TEST_QEMU_IMAGE,
+                virtfs=str(tmpdir),
+                snapshot="1")
+
+
+class TestQemuSUTLanes(_TestQemuSUT):
+    """
+    Test QemuSUT implementation running commands on multiple lanes.
+    """
+
+    @pytest.fixture
+    async def sut(self, tmpdir):
+        runner = QemuSUT()
+        runner.setup(
+            tmpdir=str(tmpdir),
+            image=TEST_QEMU_IMAGE,
+            user=TEST_QEMU_USERNAME,
+            password=TEST_QEMU_PASSWORD,
+            serial="virtio",
+            lanes="4")
+
+        yield runner
+
+        if await runner.is_running:
+            await runner.stop()
+
+    async def test_lanes_setup(self, tmpdir):
+        """
+        Test lanes option validation.
+        """
+        with pytest.raises(SUTError):
+            QemuSUT().setup(tmpdir=str(tmpdir), lanes="-1")
+
+        with pytest.raises(SUTError):
+            QemuSUT().setup(tmpdir=str(tmpdir), serial="isa", lanes="2")
+
+        sut = QemuSUT()
+        sut.setup(tmpdir=str(tmpdir), serial="virtio", lanes="2")
+        assert sut.parallel_execution
+        assert sut.max_workers == 2
+
+    async def test_lanes_parallel(self, sut):
+        """
+        Test that commands are executed at the same time on lanes.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        start_t = time.time()
+        results = await asyncio.gather(*[
+            sut.run_command("sleep 1; echo ciao") for _ in range(4)
+        ])
+
+        assert time.time() - start_t < 3
+        for ret in results:
+            assert ret["returncode"] == 0
+            assert ret["stdout"] == "ciao\n"
+
+    async def test_lanes_cancel(self, sut):
+        """
+        Test that a lane is restarted when command is cancelled.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(sut.run_command("sleep 100"), 1)
+
+        for _ in range(8):
+            ret = await sut.run_command("echo ciao")
+            assert ret["returncode"] == 0
+            assert ret["stdout"] == "ciao\n"
+
+
+@pytest.mark.skipif(
+    not TEST_QEMU_LTX,
+    reason="TEST_QEMU_LTX not defined")
+class TestQemuSUTLTX(_TestQemuSUT):
+    """
+    Test QemuSUT implementation running commands with LTX.
+    """
+
+    @pytest.fixture(params=["isa", "virtio"])
+    async def sut(self, tmpdir, request):
+        runner = QemuSUT()
+        runner.setup(
+            tmpdir=str(tmpdir),
+            image=TEST_QEMU_IMAGE,
+            user=TEST_QEMU_USERNAME,
+            password=TEST_QEMU_PASSWORD,
+            serial=request.param,
+            ltx=TEST_QEMU_LTX)
+
+        yield runner
+
+        if await runner.is_running:
+            await runner.stop()
+
+    async def test_ltx_setup(self, tmpdir):
+        """
+        Test that ltx can't be used together with lanes.
+        """
+        with pytest.raises(SUTError):
+            QemuSUT().setup(
+                tmpdir=str(tmpdir),
+                serial="virtio",
+                lanes="2",
+                ltx=TEST_QEMU_LTX)
+
+    async def test_ltx_parallel(self, sut):
+        """
+        Test that commands are executed at the same time by LTX.
+        """
+        await sut.communicate(iobuffer=Printer())
+        assert sut.parallel_execution
+
+        start_t = time.time()
+        results = await asyncio.gather(*[
+            sut.run_command("sleep 1; echo ciao") for _ in range(8)
+        ])
+
+        assert time.time() - start_t < 3
+        for ret in results:
+            assert ret["returncode"] == 0
+            assert ret["stdout"] == "ciao\n"
+            assert 1 <= ret["exec_time"] < 3
+
+
+class TestQemuSUTStandby(_TestQemuSUT):
+    """
+    Test QemuSUT implementation switching to a standby VM on restart.
+    """
+
+    @pytest.fixture
+    async def sut(self, tmpdir):
+        runner = QemuSUT()
+        runner.setup(
+            tmpdir=str(tmpdir),
+            image=TEST_QEMU_IMAGE,
+            user=TEST_QEMU_USERNAME,
+            password=TEST_QEMU_PASSWORD,
+            standby="1")
+
+        yield runner
+
+        if await runner.is_running:
+            await runner.stop()
+
+    async def test_standby_restart(self, sut):
+        """
+        Test that restart switches to a clean standby VM.
+        """
+        iobuff = Printer()
+
+        await sut.communicate(iobuffer=iobuff)
+        ret = await sut.run_command(
+            "touch /root/kirk_standby",
+            iobuffer=iobuff)
+        assert ret["returncode"] == 0
+
+        await sut.restart(iobuffer=iobuff)
+        assert await sut.is_running
+
+        ret = await sut.run_command(
+            "test -f /root/kirk_standby",
+            iobuffer=iobuff)
+        assert ret["returncode"] == 1
+
+    async def test_standby_snapshot(self, tmpdir):
+        """
+        Test that standby can't be used together with snapshot.
+        """
+        with pytest.raises(SUTError):
+            QemuSUT().setup(
+                tmpdir=str(tmpdir),
+                image=TEST_QEMU_IMAGE,
+                standby="1",
+                snapshot="1")
+
+
 class TestSessionQemuISA(_TestSession):
     """
     Test Session using Qemu with ISA protocol.
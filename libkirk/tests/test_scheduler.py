@@ -2,12 +2,20 @@
 Unittests for runner module.
 """
 import re
+import time
 import asyncio
 import pytest
+import libkirk.sut
 from libkirk.sut import TAINED_MSG
 from libkirk.data import Test
 from libkirk.data import Suite
 from libkirk.host import HostSUT
+from libkirk.sut import IOBuffer
+from libkirk.scheduler import TrailerFilter
+from libkirk.scheduler import AdaptiveSemaphore
+from libkirk.scheduler import WorkersController
+from libkirk.scheduler import WorkersPool
+from libkirk.scheduler import TestsQueue
 from libkirk.scheduler import TestScheduler
 from libkirk.scheduler import SuiteScheduler
 from libkirk.scheduler import KernelTainedError
@@ -54,20 +62,24 @@ class MockSuiteScheduler(SuiteScheduler):
 
     def __init__(self, **kwargs: dict) -> None:
         super().__init__(**kwargs)
-        self._scheduler = MockTestScheduler(
-            sut=kwargs.get("sut", None),
-            framework=kwargs.get("framework", None),
-            timeout=kwargs.get("exec_timeout", 3600),
-            max_workers=kwargs.get("max_workers", 1)
-        )
         self._rebooted = 0
 
-    async def _restart_sut(self) -> None:
+    def _create_scheduler(self, sut, workers_pool=None) -> TestScheduler:
+        return MockTestScheduler(
+            sut=sut,
+            framework=self._framework,
+            timeout=self._kwargs.get("exec_timeout", 3600),
+            max_workers=self._max_workers,
+            workers_pool=workers_pool,
+            quarantine=self._quarantine
+        )
+
+    async def _restart(self, sut, scheduler) -> None:
         self._logger.info("Rebooting the SUT")
 
-        await self._scheduler.stop()
-        await self._sut.stop()
-        await self._sut.communicate()
+        await scheduler.stop()
+        await sut.stop()
+        await sut.communicate()
 
         self._rebooted += 1
 
@@ -75,6 +87,177 @@ class MockSuiteScheduler(SuiteScheduler):
     def rebooted(self) -> int:
         return self._rebooted
 
+    @property
+    def quarantine(self) -> set:
+        return self._quarantine
+
+
+class StringBuffer(IOBuffer):
+    """
+    IOBuffer which stores written data.
+    """
+
+    def __init__(self) -> None:
+        self.data = ""
+
+    async def write(self, data: str) -> None:
+        self.data += data
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 1024])
+async def test_trailer_filter(chunk):
+    """
+    Test TrailerFilter when trailer is splitted in multiple chunks.
+    """
+    stdout = "ciao\n\nkirk\n\nkirk-1234 0 0 0\n"
+    buffer = StringBuffer()
+    trailer = TrailerFilter(buffer, "\nkirk-1234 ")
+
+    for i in range(0, len(stdout), chunk):
+        await trailer.write(stdout[i:i + chunk])
+
+    await trailer.flush()
+
+    assert buffer.data == "ciao\n\nkirk\n"
+
+
+async def test_adaptive_semaphore():
+    """
+    Test AdaptiveSemaphore when value changes.
+    """
+    sem = AdaptiveSemaphore(1)
+    running = []
+
+    async def worker():
+        async with sem:
+            running.append(sem.running)
+            await asyncio.sleep(0.1)
+
+    tasks = [asyncio.Task(worker()) for _ in range(4)]
+    await asyncio.sleep(0.05)
+
+    assert sem.running == 1
+
+    sem.set_value(4)
+    await asyncio.gather(*tasks)
+
+    assert max(running) == 4
+    assert sem.running == 0
+
+
+async def test_workers_pool():
+    """
+    Test WorkersPool when exclusive access is requested.
+    """
+    pool = WorkersPool(4)
+    running = []
+    exclusive = []
+
+    async def shared():
+        async with pool.shared:
+            running.append(1)
+            await asyncio.sleep(0.1)
+            running.pop()
+
+    async def alone():
+        async with pool:
+            exclusive.append(len(running))
+            await asyncio.sleep(0.1)
+
+    await asyncio.gather(*[
+        shared(), shared(), alone(), shared(), alone(), shared()
+    ])
+
+    assert exclusive == [0, 0]
+
+
+async def test_tests_queue():
+    """
+    Test TestsQueue order between parallel, busy and serial tests.
+    """
+    queue = TestsQueue()
+    serial = Test(name="serial", cmd="echo")
+    busy = Test(name="busy", cmd="echo", resources=["device"])
+    free = Test(name="free", cmd="echo")
+    first = Test(name="first", cmd="echo")
+
+    queue.put(serial, True)
+    queue.put(busy, False)
+    queue.put(free, False)
+    queue.put(first, False, first=True)
+
+    assert len(queue) == 4
+    assert list(queue) == [first, busy, free, serial]
+
+    def is_busy(test):
+        return bool(test.resources)
+
+    assert queue.get(is_busy) is first
+    assert queue.get(is_busy) is free
+    assert queue.get(is_busy) is busy
+    assert queue.get(is_busy) is serial
+    assert not queue
+
+
+class MockLoadSUT:
+    """
+    SUT returning the given load.
+    """
+
+    def __init__(self) -> None:
+        self.load = ""
+
+    async def run_command(self, command: str) -> dict:
+        return {
+            "command": command,
+            "returncode": 0,
+            "stdout": self.load,
+            "exec_time": 0.0,
+        }
+
+
+@pytest.mark.parametrize(
+    "load, running, expected",
+    [
+        # SUT is idle and all workers are busy
+        ("0.10 0.10 0.10 1/100 1000\n"
+         "/proc/pressure/cpu:some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+         "/proc/pressure/memory:some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n",
+         4, 5),
+        # SUT is idle, but workers are not all busy
+        ("0.10 0.10 0.10 1/100 1000\n", 2, 4),
+        # CPU pressure is high
+        ("0.10 0.10 0.10 1/100 1000\n"
+         "/proc/pressure/cpu:some avg10=80.00 avg60=0.00 avg300=0.00 total=0\n",
+         4, 3),
+        # memory pressure is high
+        ("0.10 0.10 0.10 1/100 1000\n"
+         "/proc/pressure/memory:some avg10=20.00 avg60=0.00 avg300=0.00 total=0\n",
+         4, 3),
+        # load average is high
+        ("16.00 0.10 0.10 1/100 1000\n", 4, 3),
+    ])
+async def test_workers_controller(load, running, expected):
+    """
+    Test WorkersController update according with SUT load.
+    """
+    sut = MockLoadSUT()
+    sut.load = load
+
+    sem = AdaptiveSemaphore(4)
+    for _ in range(running):
+        await sem.acquire()
+
+    controller = WorkersController(
+        sut=sut,
+        sem=sem,
+        nproc=4,
+        max_workers=8)
+
+    await controller.update()
+
+    assert sem.value == expected
+
 
 @pytest.fixture
 async def sut():
@@ -97,12 +280,20 @@ class TestTestScheduler:
     async def create_runner(self, sut, dummy_framework):
         def _callback(
                 timeout: float = 3600.0,
-                max_workers: int = 1) -> TestScheduler:
+                max_workers: int = 1,
+                wrap_tests: bool = False,
+                durations: dict = None,
+                adaptive_workers: bool = False,
+                quarantine: set = None) -> TestScheduler:
             obj = MockTestScheduler(
                 sut=sut,
                 framework=dummy_framework,
                 timeout=timeout,
-                max_workers=max_workers)
+                max_workers=max_workers,
+                wrap_tests=wrap_tests,
+                durations=durations,
+                adaptive_workers=adaptive_workers,
+                quarantine=quarantine)
 
             return obj
 
@@ -139,6 +330,174 @@ class TestTestScheduler:
             assert res.return_code == 0
             assert res.stdout == "ciao"
 
+    async def test_schedule_resources(self, tmpdir, create_runner):
+        """
+        Test the schedule method when tests share resources. Tests using
+        the same resource are never executed at the same time, so
+        ``mkdir`` never fails.
+        """
+        tests = []
+        for i in range(10):
+            resource = f"res{i % 2}"
+            lockdir = str(tmpdir / resource)
+
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="mkdir",
+                args=[lockdir, "&&", "sleep", "0.1", "&&", "rmdir", lockdir],
+                parallelizable=False,
+                resources=[resource],
+            ))
+
+        runner = create_runner(max_workers=10)
+
+        start_t = time.time()
+        await runner.schedule(tests)
+        end_t = time.time() - start_t
+
+        assert len(runner.results) == len(tests)
+
+        for res in runner.results:
+            assert res.return_code == 0
+
+        # two tests are executed at the same time
+        assert end_t < 0.1 * len(tests)
+
+    async def test_schedule_adaptive_workers(self, create_runner):
+        """
+        Test the schedule method using adaptive workers.
+        """
+        tests = []
+        for i in range(10):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="echo",
+                args=["-n", "ciao"],
+                parallelizable=True,
+            ))
+
+        runner = create_runner(adaptive_workers=True)
+
+        await runner.schedule(tests)
+        assert len(runner.results) == len(tests)
+
+        for res in runner.results:
+            assert res.return_code == 0
+            assert res.stdout == "ciao"
+
+    async def test_schedule_adaptive_workers_kept(self, create_runner):
+        """
+        Test that adaptive workers learned by a schedule call are kept by
+        the next one.
+        """
+        tests = [
+            Test(name="test", cmd="echo", args=["ciao"], parallelizable=True)
+        ]
+
+        runner = create_runner(adaptive_workers=True)
+
+        await runner.schedule(tests)
+        sem = runner._controller.sem
+        workers = sem.value + 3
+        sem.set_value(workers)
+
+        await runner.schedule(tests)
+        assert runner._controller.sem is sem
+        assert sem.value == workers
+
+    async def test_schedule_durations(self, create_runner):
+        """
+        Test the schedule method running longest tests first.
+        """
+        tests = []
+        for i in range(5):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="echo",
+                args=["-n", "ciao"],
+                parallelizable=True,
+            ))
+
+        durations = {
+            "test0": 1.0,
+            "test1": 2.0,
+            "test3": 4.0,
+        }
+
+        runner = create_runner(max_workers=1, durations=durations)
+
+        await runner.schedule(tests)
+
+        names = [res.test.name for res in runner.results]
+        assert names == ["test3", "test2", "test4", "test1", "test0"]
+
+    @pytest.mark.parametrize("workers", [1, 10])
+    async def test_schedule_wrap_tests(self, workers, create_runner):
+        """
+        Test the schedule method using wrapped tests execution.
+        """
+        tests = []
+        for i in range(10):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="echo",
+                args=["-n", "ciao", "&&", "exit", str(i % 2)],
+                parallelizable=True,
+            ))
+
+        runner = create_runner(max_workers=workers, wrap_tests=True)
+
+        await runner.schedule(tests)
+        assert len(runner.results) == len(tests)
+
+        for res in runner.results:
+            index = int(res.test.name[len("test"):])
+            assert res.return_code == index % 2
+            assert res.stdout == "ciao"
+
+    @pytest.mark.parametrize("workers", [1, 10])
+    async def test_schedule_wrap_tests_kernel_tainted(
+            self, workers, sut, create_runner):
+        """
+        Test the schedule method using wrapped tests execution when kernel
+        is tainted.
+        """
+        async def mock_run_command(
+                command,
+                cwd=None,
+                env=None,
+                iobuffer=None) -> dict:
+            match = re.search(r"(?P<marker>kirk-[0-9a-f]+)", command)
+            stdout = f"ciao\n{match.group('marker')} 0 0 1\n"
+
+            if iobuffer:
+                await iobuffer.write(stdout)
+
+            return {
+                "command": command,
+                "returncode": 0,
+                "stdout": stdout,
+                "exec_time": 0.1,
+            }
+
+        sut.run_command = mock_run_command
+        runner = create_runner(max_workers=workers, wrap_tests=True)
+
+        tests = []
+        for i in range(10):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="echo",
+                args=["ciao"],
+                parallelizable=True,
+            ))
+
+        with pytest.raises(KernelTainedError):
+            await runner.schedule(tests)
+
+        assert len(runner.results) > 0
+        assert runner.results[0].stdout == "ciao"
+
     @pytest.mark.parametrize("workers", [1, 10])
     async def test_schedule_stop(self, workers, create_runner):
         """
@@ -235,6 +594,64 @@ class TestTestScheduler:
         assert res.return_code == -1
         assert res.stdout == "Kernel panic\n"
 
+    async def test_schedule_kernel_panic_suspects(self, create_runner):
+        """
+        Test that tests running when a kernel panic is recognised are
+        reported as suspects, including the one recognising it.
+        """
+        tests = [
+            Test(
+                name="panic",
+                cmd="sleep 0.1 && echo",
+                args=["Kernel", "panic"],
+                parallelizable=True),
+            Test(
+                name="serial",
+                cmd="echo",
+                args=["ciao"]),
+        ]
+
+        for i in range(3):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["1"],
+                parallelizable=True,
+            ))
+
+        runner = create_runner(max_workers=10)
+
+        with pytest.raises(KernelPanicError):
+            await runner.schedule(tests)
+
+        assert len(runner.results) == 1
+        assert runner.results[0].test.name == "panic"
+        assert sorted(test.name for test in runner.suspects) == \
+            ["panic", "test0", "test1", "test2"]
+
+    async def test_schedule_quarantine(self, create_runner):
+        """
+        Test that quarantined tests are executed alone, after the others.
+        """
+        tests = []
+        for i in range(4):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.2"],
+                parallelizable=True,
+            ))
+
+        runner = create_runner(max_workers=10, quarantine={"test0"})
+
+        start_t = time.time()
+        await runner.schedule(tests)
+        exec_time = time.time() - start_t
+
+        assert len(runner.results) == len(tests)
+        assert runner.results[-1].test.name == "test0"
+        assert 0.4 <= exec_time < 0.8
+
     @pytest.mark.parametrize("workers", [1, 10])
     async def test_schedule_kernel_timeout(self, workers, sut, create_runner):
         """
@@ -295,6 +712,276 @@ class TestSuiteScheduler:
     Tests for SuiteScheduler.
     """
 
+    @pytest.fixture
+    async def suts(self, sut):
+        """
+        Pool of SUT objects.
+        """
+        other = MockHostSUT()
+        other.setup()
+        await other.communicate()
+
+        yield [sut, other]
+
+        await other.stop()
+
+    async def test_schedule_parallel_suites(self, dummy_framework, sut):
+        """
+        Test the schedule method running suites in parallel.
+        """
+        runner = MockSuiteScheduler(
+            sut=sut,
+            framework=dummy_framework,
+            max_workers=10,
+            parallel_suites=True)
+
+        suites = []
+        for i in range(3):
+            tests = []
+            for j in range(3):
+                tests.append(Test(
+                    name=f"test{j}",
+                    cmd="sleep",
+                    args=["0.2", "&&", "echo", "-n", f"suite{i}"],
+                    parallelizable=True,
+                ))
+
+            suites.append(Suite(f"suite{i}", tests))
+
+        start_t = time.time()
+        await runner.schedule(suites)
+        end_t = time.time() - start_t
+
+        # all tests run at the same time
+        assert end_t < 0.6
+
+        assert len(runner.results) == len(suites)
+
+        for i, suite_res in enumerate(runner.results):
+            assert suite_res.suite.name == f"suite{i}"
+            assert len(suite_res.tests_results) == 3
+
+            for res in suite_res.tests_results:
+                assert res.stdout == f"suite{i}"
+
+    async def test_schedule_parallel_suites_kernel_panic(
+            self, dummy_framework, sut):
+        """
+        Test the schedule method running suites in parallel when kernel
+        panic occurs.
+        """
+        runner = MockSuiteScheduler(
+            sut=sut,
+            framework=dummy_framework,
+            max_workers=10,
+            parallel_suites=True)
+
+        suites = []
+        for i in range(3):
+            tests = []
+            for j in range(3):
+                tests.append(Test(
+                    name=f"test{j}",
+                    cmd="sleep",
+                    args=["0.2", "&&", "echo", "-n", "ciao"],
+                    parallelizable=True,
+                ))
+
+            suites.append(Suite(f"suite{i}", tests))
+
+        suites[0].tests.append(Test(
+            name="panic",
+            cmd="echo",
+            args=["-n", "Kernel", "panic"],
+            parallelizable=True,
+        ))
+
+        await runner.schedule(suites)
+
+        assert runner.rebooted >= 1
+        assert runner.quarantine == {"panic"}
+        assert len(runner.results) == len(suites)
+        assert len(runner.results[0].tests_results) == 4
+        assert len(runner.results[1].tests_results) == 3
+        assert len(runner.results[2].tests_results) == 3
+
+    async def test_schedule_parallel_suites_bisect_alone(
+            self, dummy_framework, sut):
+        """
+        Test that the last suspect of a kernel error runs alone on the SUT
+        when suites are running in parallel, so it's not quarantined due
+        to tests of other suites.
+        """
+        runner = MockSuiteScheduler(
+            sut=sut,
+            framework=dummy_framework,
+            max_workers=4,
+            parallel_suites=True)
+
+        # panic is reported only when test runs next to the other suite
+        suites = [
+            Suite("suite0", [Test(
+                name="panic",
+                cmd="sleep 0.3; pgrep -f 'sleep 1[.]234' > /dev/null && "
+                    "echo -n Kernel panic",
+                parallelizable=True,
+            )]),
+            Suite("suite1", [Test(
+                name="other",
+                cmd="sleep",
+                args=["1.234"],
+                parallelizable=True,
+            )]),
+        ]
+
+        await runner.schedule(suites)
+
+        assert runner.rebooted == 1
+        assert not runner.quarantine
+        assert len(runner.results[0].tests_results) == 1
+        assert len(runner.results[1].tests_results) == 1
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    async def test_schedule_pool(self, workers, suts, dummy_framework):
+        """
+        Test the schedule method using a pool of SUTs.
+        """
+        runner = MockSuiteScheduler(
+            suts=suts,
+            framework=dummy_framework,
+            max_workers=workers)
+
+        tests = []
+        for i in range(10):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.1", "&&", "echo", "-n", "ciao"],
+                parallelizable=True,
+            ))
+
+        await runner.schedule([Suite("suite01", tests)])
+
+        assert len(runner.results) == 1
+        assert len(runner.results[0].tests_results) == len(tests)
+
+        for res in runner.results[0].tests_results:
+            assert res.return_code == 0
+            assert res.stdout == "ciao"
+
+    async def test_schedule_pool_free_workers(self, dummy_framework):
+        """
+        Test that a slow test doesn't keep the other workers of its SUT
+        idle when using a pool of SUTs.
+        """
+        class CountingSUT(MockHostSUT):
+            """
+            SUT counting the executed commands.
+            """
+
+            def __init__(self) -> None:
+                super().__init__()
+                self.commands = []
+
+            async def run_command(self, command, **kwargs) -> dict:
+                self.commands.append(command)
+                return await super().run_command(command, **kwargs)
+
+        suts = [CountingSUT(), CountingSUT()]
+        for obj in suts:
+            obj.setup()
+            await obj.communicate()
+
+        runner = MockSuiteScheduler(
+            suts=suts,
+            framework=dummy_framework,
+            max_workers=2)
+
+        tests = [Test(
+            name="slow",
+            cmd="sleep",
+            args=["1"],
+            parallelizable=True,
+        )]
+
+        for i in range(20):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.05"],
+                parallelizable=True,
+            ))
+
+        try:
+            await runner.schedule([Suite("suite01", tests)])
+        finally:
+            for obj in suts:
+                await obj.stop()
+
+        assert len(runner.results[0].tests_results) == len(tests)
+
+        # both SUTs run many tests, including the one running the slow test
+        for obj in suts:
+            assert len([
+                cmd for cmd in obj.commands if cmd == "sleep 0.05"
+            ]) >= 3
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    async def test_schedule_pool_kernel_panic(
+            self, workers, suts, dummy_framework):
+        """
+        Test the schedule method on kernel panic using a pool of SUTs.
+        """
+        runner = MockSuiteScheduler(
+            suts=suts,
+            framework=dummy_framework,
+            max_workers=workers)
+
+        tests = []
+        for i in range(0, 9):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="echo",
+                args=["-n", "ciao"],
+                parallelizable=True,
+            ))
+        tests.append(Test(
+            name="test9",
+            cmd="echo",
+            args=["-n", "Kernel", "panic"],
+            parallelizable=True,
+        ))
+        await runner.schedule([Suite("suite01", tests)])
+
+        assert runner.rebooted == 1
+        assert len(runner.results) == 1
+        assert len(runner.results[0].tests_results) == len(tests)
+
+    async def test_schedule_pool_suite_timeout(self, suts, dummy_framework):
+        """
+        Test the schedule method on suite timeout using a pool of SUTs.
+        """
+        runner = MockSuiteScheduler(
+            suts=suts,
+            framework=dummy_framework,
+            suite_timeout=0.1)
+
+        tests = []
+        for i in range(10):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.5"],
+                parallelizable=True,
+            ))
+        await runner.schedule([Suite("suite01", tests)])
+
+        assert len(runner.results[0].tests_results) == len(tests)
+
+        for res in runner.results[0].tests_results:
+            assert res.skipped == 1
+            assert res.return_code == 32
+
     @pytest.fixture
     async def create_runner(self, sut, dummy_framework):
         def _callback(
@@ -420,10 +1107,95 @@ class TestSuiteScheduler:
         ))
         await runner.schedule([Suite("suite01", tests)])
 
-        assert runner.rebooted == 1
+        if workers > 1:
+            assert runner.rebooted >= 1
+        else:
+            assert runner.rebooted == 1
+
+        assert runner.quarantine == {"test9"}
         assert len(runner.results) == 1
         assert len(runner.results[0].tests_results) == 10
 
+    async def test_schedule_kernel_panic_bisect(self, create_runner):
+        """
+        Test that tests interrupted by a kernel panic are bisected, so the
+        test causing the panic is quarantined once it reproduces the panic
+        running alone.
+        """
+        runner = create_runner(max_workers=10)
+
+        tests = [
+            Test(
+                name="panic",
+                cmd="sleep 0.1 && echo",
+                args=["-n", "Kernel", "panic"],
+                parallelizable=True),
+        ]
+
+        for i in range(3):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.5"],
+                parallelizable=True,
+            ))
+
+        await runner.schedule([Suite("suite01", tests)])
+
+        # all together, then panic with test0, then panic alone
+        assert runner.rebooted == 3
+        assert runner.quarantine == {"panic"}
+
+        results = runner.results[0].tests_results
+        assert sorted(res.test.name for res in results) == \
+            sorted(test.name for test in tests)
+
+        for res in results:
+            if res.test.name == "panic":
+                assert res.return_code == -1
+            else:
+                assert res.return_code == 0
+
+    async def test_schedule_kernel_panic_bisect_innocent(
+            self, sut, create_runner):
+        """
+        Test that a suspect which doesn't reproduce the kernel panic when
+        running alone is not quarantined.
+        """
+        runner = create_runner(max_workers=10)
+
+        tests = []
+        for i in range(2):
+            tests.append(Test(
+                name=f"test{i}",
+                cmd="sleep",
+                args=["0.3"],
+                parallelizable=True,
+            ))
+
+        run_command = sut.run_command
+        panics = []
+
+        async def panic_once(command, **kwargs) -> dict:
+            # first execution of test0 triggers a panic, then it passes
+            if command == "sleep 0.3" and not panics:
+                panics.append(command)
+                await asyncio.sleep(0.1)
+                raise libkirk.sut.KernelPanicError()
+
+            return await run_command(command, **kwargs)
+
+        sut.run_command = panic_once
+
+        await runner.schedule([Suite("suite01", tests)])
+
+        assert runner.rebooted == 1
+        assert not runner.quarantine
+        assert len(runner.results[0].tests_results) == len(tests)
+
+        for res in runner.results[0].tests_results:
+            assert res.return_code == 0
+
     @pytest.mark.parametrize("workers", [1, 10])
     async def test_schedule_kernel_timeout(self, workers, sut, create_runner):
         """
@@ -5,6 +5,7 @@ import os
 import asyncio
 import pytest
 from libkirk.sut import IOBuffer
+from libkirk.sut import SUTError
 from libkirk.sut import KernelPanicError
 from libkirk.ssh import SSHSUT
 from libkirk.tests.test_sut import _TestSUT
@@ -98,6 +99,98 @@ class _TestSSHSUT(_TestSUT):
         else:
             assert ret["stdout"] != "root\n"
 
+    async def test_connections(self, config):
+        """
+        Test that commands are spread over multiple connections when
+        connections option is defined.
+        """
+        kwargs = dict(connections="4")
+        kwargs.update(config)
+
+        sut = SSHSUT()
+        sut.setup(**kwargs)
+        await sut.communicate()
+
+        try:
+            # more commands than maximum number of sessions
+            rets = await asyncio.gather(*[
+                sut.run_command(f"sleep 0.5 && echo {i}")
+                for i in range(20)
+            ])
+
+            for i, ret in enumerate(rets):
+                assert ret["returncode"] == 0
+                assert ret["stdout"] == f"{i}\n"
+
+            assert 1 < len(sut._pool.connections) <= 4
+        finally:
+            await sut.stop()
+
+    async def test_connections_reconnect(self, config):
+        """
+        Test that broken connections are replaced.
+        """
+        kwargs = dict(connections="2")
+        kwargs.update(config)
+
+        sut = SSHSUT()
+        sut.setup(**kwargs)
+        await sut.communicate()
+
+        try:
+            conn = sut._pool.connections[0]
+            conn.close()
+            await conn.wait_closed()
+
+            ret = await sut.run_command("echo ciao")
+            assert ret["returncode"] == 0
+            assert ret["stdout"] == "ciao\n"
+            assert conn not in sut._pool.connections
+        finally:
+            await sut.stop()
+
+    async def test_fetch_file_proc(self, sut, tmpdir):
+        """
+        Test fetch_file and get_file methods with files reporting zero
+        size, such as the ones inside /proc.
+        """
+        await sut.communicate()
+
+        ret = await sut.run_command("cat /proc/cpuinfo")
+        data = await sut.fetch_file("/proc/cpuinfo")
+        assert data.decode() == ret["stdout"]
+
+        local_file = str(tmpdir / "cpuinfo")
+        await sut.get_file("/proc/cpuinfo", local_file)
+
+        with open(local_file, "r") as flocal:
+            assert flocal.read() == ret["stdout"]
+
+    async def test_ping_more_workers(self, sut):
+        """
+        Test that ping and files transfer don't wait for running commands
+        when there are more workers than available sessions.
+        """
+        await sut.communicate()
+        sut._pool.max_sessions = 2
+
+        tasks = [
+            asyncio.create_task(sut.run_command("sleep 2"))
+            for _ in range(5)
+        ]
+
+        try:
+            await asyncio.sleep(0.5)
+
+            await asyncio.wait_for(sut.ping(), timeout=1)
+            await asyncio.wait_for(
+                sut.fetch_file("/proc/version"), timeout=1)
+        finally:
+            rets = await asyncio.gather(*tasks)
+
+        for ret in rets:
+            assert ret["returncode"] == 0
+
     async def test_kernel_panic(self, sut):
         """
         Test kernel panic recognition.
@@ -155,6 +248,87 @@ class TestSSHSUTKeyfile(_TestSSHSUT):
         yield config_keyfile
 
 
+class TestSSHSUTPersistent(_TestSSHSUT):
+    """
+    Test SSHSUT implementation using persistent remote shells.
+    """
+
+    @pytest.fixture
+    def config(self, config_password):
+        config_password["persistent"] = "1"
+        yield config_password
+
+    async def test_persistent_env(self, sut):
+        """
+        Test that environment is updated between commands running in the
+        same remote shell.
+        """
+        await sut.communicate()
+
+        ret = await sut.run_command("echo $KIRK_VAR", env=dict(KIRK_VAR="a"))
+        assert ret["stdout"] == "a\n"
+
+        ret = await sut.run_command("echo $KIRK_VAR", env=dict(KIRK_VAR="b"))
+        assert ret["stdout"] == "b\n"
+
+        ret = await sut.run_command("echo $KIRK_VAR")
+        assert ret["stdout"] == "\n"
+
+    async def test_persistent_cwd(self, sut):
+        """
+        Test that current working directory is updated between commands
+        running in the same remote shell, and that commands can't change
+        the shell state.
+        """
+        await sut.communicate()
+
+        ret = await sut.run_command("cd /usr && pwd", cwd="/tmp")
+        assert ret["stdout"] == "/usr\n"
+
+        ret = await sut.run_command("pwd", cwd="/tmp")
+        assert ret["stdout"] == "/tmp\n"
+
+        ret = await sut.run_command("exit 3")
+        assert ret["returncode"] == 3
+
+        ret = await sut.run_command("echo ciao # comment")
+        assert ret["returncode"] == 0
+        assert ret["stdout"] == "ciao\n"
+
+    async def test_persistent_bad_cwd(self, sut):
+        """
+        Test that command fails when current working directory can't be
+        set.
+        """
+        await sut.communicate()
+
+        with pytest.raises(SUTError):
+            await sut.run_command("pwd", cwd="/kirk_dir_not_found")
+
+        ret = await sut.run_command("echo ciao")
+        assert ret["stdout"] == "ciao\n"
+
+    async def test_persistent_more_workers(self, sut):
+        """
+        Test that idle remote shells release their session when there are
+        more workers than available sessions.
+        """
+        await sut.communicate()
+        sut._pool.max_sessions = 2
+
+        async def worker(i):
+            for _ in range(3):
+                ret = await sut.run_command(f"sleep 0.1; echo {i}")
+                assert ret["stdout"] == f"{i}\n"
+
+        await asyncio.wait_for(
+            asyncio.gather(*[worker(i) for i in range(5)]),
+            timeout=20)
+
+        await asyncio.wait_for(sut.ping(), timeout=5)
+        await asyncio.wait_for(sut.fetch_file("/proc/version"), timeout=5)
+
+
 class TestSessionSSHPassword(_TestSession):
     """
     Test Session implementation using SSH SUT in password mode.
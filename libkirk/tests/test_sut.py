@@ -9,6 +9,7 @@ import pytest
 import libkirk
 from libkirk.sut import IOBuffer
 from libkirk.sut import SUTError
+from libkirk.sut import RemoteShell
 
 
 pytestmark = pytest.mark.asyncio
@@ -26,6 +27,55 @@ class Printer(IOBuffer):
         print(data, end="")
 
 
+async def test_remote_shell(tmpdir):
+    """
+    Test RemoteShell scripts inside a local shell.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "sh",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT)
+
+    shell = RemoteShell()
+
+    async def _read():
+        data = await proc.stdout.read(1024)
+        return data.decode()
+
+    async def _run(command, cwd=None, env=None):
+        script = shell.create_script(command, cwd, env)
+        proc.stdin.write(script.encode())
+
+        return await shell.read_output(_read)
+
+    try:
+        assert await _run("echo -n ciao") == ("ciao", 0)
+        assert await _run("exit 3") == ("", 3)
+
+        path = str(tmpdir)
+        ret = await _run("echo -n $PWD:$A", cwd=path, env=dict(A="1"))
+        assert ret == (f"{path}:1", 0)
+
+        _, retcode = await _run("echo", cwd="/kirk_not_exist")
+        assert retcode == -1
+
+        ret = await _run("echo -n $PWD:$A", cwd=path, env=dict(A="2"))
+        assert ret == (f"{path}:2", 0)
+
+        ret = await _run("echo -n $PWD:$A", cwd=path)
+        assert ret == (f"{path}:", 0)
+
+        # shell is closed before command completion
+        proc.stdin.write(b"exit\n")
+        assert await shell.read_output(_read) == ("", None)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+
+        await proc.wait()
+
+
 @pytest.fixture
 def sut():
     """
@@ -100,6 +150,18 @@ class _TestSUT:
         with pytest.raises(SUTError):
             await sut.ensure_communicate(iobuffer=Printer(), retries=1)
 
+    async def test_restart(self, sut):
+        """
+        Test restart method.
+        """
+        await sut.communicate(iobuffer=Printer())
+        await sut.restart(iobuffer=Printer())
+        assert await sut.is_running
+
+        ret = await sut.run_command("echo 0", iobuffer=Printer())
+        assert ret["returncode"] == 0
+        assert ret["stdout"] == "0\n"
+
     @pytest.fixture
     def sut_stop_sleep(self, request):
         """
@@ -232,6 +294,55 @@ class _TestSUT:
 
             assert data == b"mytests"
 
+    async def test_get_file(self, sut, tmpdir):
+        """
+        Test get_file method.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        with pytest.raises(ValueError):
+            await sut.get_file("/tmp/myfile", None)
+
+        for i in range(0, 5):
+            myfile = f"/tmp/myfile{i}"
+            local_file = str(tmpdir / f"myfile{i}")
+
+            await sut.run_command(f"echo -n 'mytests' > {myfile}")
+            await sut.get_file(myfile, local_file)
+
+            with open(local_file, "rb") as flocal:
+                assert flocal.read() == b"mytests"
+
+    @pytest.mark.parametrize("size", [0, 1024, 4 * 1024 * 1024 + 3])
+    async def test_put_file(self, sut, tmpdir, size):
+        """
+        Test put_file method.
+        """
+        await sut.communicate(iobuffer=Printer())
+
+        local_file = str(tmpdir / "local_file")
+        target_file = f"/tmp/put_file{os.getpid()}"
+
+        with pytest.raises(ValueError):
+            await sut.put_file(None, target_file)
+
+        with pytest.raises(ValueError):
+            await sut.put_file(local_file, None)
+
+        with pytest.raises(SUTError):
+            await sut.put_file(local_file, target_file)
+
+        data = os.urandom(size)
+        with open(local_file, "wb") as flocal:
+            flocal.write(data)
+
+        try:
+            await sut.put_file(local_file, target_file)
+
+            assert await sut.fetch_file(target_file) == data
+        finally:
+            await sut.run_command(f"rm -f {target_file}")
+
     async def test_fetch_file_stop(self, sut):
         """
         Test stop method when running fetch_file.